@@ -9,6 +9,8 @@ from django.core.cache import cache
 import json
 import re
 from typing import Dict, List, Optional
+from core.api.rate_limit import RateLimitExceeded, acquire
+from core.services.book_card import BookCard, decode_cards, encode_cards
 
 
 class AmazonBooksAPI:
@@ -31,21 +33,30 @@ class AmazonBooksAPI:
             'Upgrade-Insecure-Requests': '1',
         }
 
-    def search_books(self, query: str, max_results: int = 10) -> Dict:
+    def _get(self, url: str, **kwargs) -> requests.Response:
+        """
+        Send a GET request to Amazon through the shared rate limiter.
+        """
+        acquire('amazon')
+        return requests.get(url, **kwargs)
+
+    def search_books(self, query: str, max_results: int = 10, force_refresh: bool = False) -> Dict:
         """
         Search for books on Amazon.
 
         Args:
             query (str): Search term for books
             max_results (int): Maximum number of results to return
+            force_refresh (bool): Ignore and replace the cached result
 
         Returns:
             Dict: Dictionary containing search results or error message
         """
         cache_key = f"amazon_books_{query}_{max_results}"
-        cached_result = cache.get(cache_key)
-        if cached_result:
-            return cached_result
+        cached_result = None if force_refresh else cache.get(cache_key)
+        books = decode_cards(cached_result['books']) if cached_result else None
+        if books is not None:
+            return {**cached_result, 'books': books}
 
         try:
             # Use Amazon's search URL for books
@@ -56,7 +67,7 @@ class AmazonBooksAPI:
                 'ref': 'sr_nr_i_0'
             }
 
-            response = requests.get(
+            response = self._get(
                 search_url, params=params, headers=self.headers, timeout=10)
 
             # If we get blocked or error, return sample data
@@ -72,10 +83,13 @@ class AmazonBooksAPI:
                 'source': 'amazon'
             }
 
-            # Cache for 1 hour
-            cache.set(cache_key, result, 3600)
+            # Cache for 1 hour, with the cards encoded as tuples
+            cache.set(cache_key, {**result, 'books': encode_cards(books)}, 3600)
             return result
 
+        except RateLimitExceeded as e:
+            # Nothing was fetched; sample data would pass for a result
+            return {'error': str(e), 'books': []}
         except requests.RequestException:
             # Return sample data if request fails
             return self._get_sample_books(query, max_results)
@@ -93,9 +107,8 @@ class AmazonBooksAPI:
             max_results (int): Maximum results to parse
 
         Returns:
-            List[Dict]: List of book dictionaries
+            List[BookCard]: The book cards
         """
-        books = []
 
         # This is a mock implementation since actual HTML parsing would be complex
         # In a real implementation, you would use BeautifulSoup to parse the HTML
@@ -115,7 +128,7 @@ class AmazonBooksAPI:
             }
         ]
 
-        return sample_books[:max_results]
+        return [BookCard.from_amazon(book) for book in sample_books[:max_results]]
 
     def _get_sample_books(self, query: str, max_results: int) -> Dict:
         """
@@ -165,7 +178,7 @@ class AmazonBooksAPI:
         ]
 
         return {
-            'books': sample_books[:max_results],
+            'books': [BookCard.from_amazon(book) for book in sample_books[:max_results]],
             'total_results': len(sample_books[:max_results]),
             'source': 'amazon_demo',
             'note': 'Datos de demostración - Amazon API no disponible'
@@ -190,7 +203,7 @@ class AmazonBooksAPI:
             # Construct product URL
             product_url = f"{self.base_url}/dp/{amazon_asin}"
 
-            response = requests.get(
+            response = self._get(
                 product_url, headers=self.headers, timeout=10)
             response.raise_for_status()
 
@@ -257,6 +270,13 @@ class AmazonBooksAPIAlternative:
             "X-RapidAPI-Host": self.rapidapi_host
         }
 
+    def _get(self, url: str, **kwargs) -> requests.Response:
+        """
+        Send a GET request to Amazon through the shared rate limiter.
+        """
+        acquire('amazon')
+        return requests.get(url, **kwargs)
+
     def search_books(self, query: str, max_results: int = 10) -> Dict:
         """
         Search books using RapidAPI Amazon Data Scraper.
@@ -266,8 +286,9 @@ class AmazonBooksAPIAlternative:
 
         cache_key = f"rapidapi_amazon_books_{query}_{max_results}"
         cached_result = cache.get(cache_key)
-        if cached_result:
-            return cached_result
+        books = decode_cards(cached_result['books']) if cached_result else None
+        if books is not None:
+            return {**cached_result, 'books': books}
 
         try:
             url = f"https://{self.rapidapi_host}/search"
@@ -278,7 +299,7 @@ class AmazonBooksAPIAlternative:
                 "max_results": max_results
             }
 
-            response = requests.get(
+            response = self._get(
                 url, headers=self.headers, params=params, timeout=15)
             response.raise_for_status()
 
@@ -291,8 +312,8 @@ class AmazonBooksAPIAlternative:
                 'source': 'amazon_rapidapi'
             }
 
-            # Cache for 2 hours
-            cache.set(cache_key, result, 7200)
+            # Cache for 2 hours, with the cards encoded as tuples
+            cache.set(cache_key, {**result, 'books': encode_cards(result['books'])}, 7200)
             return result
 
         except requests.RequestException as e:
@@ -300,7 +321,7 @@ class AmazonBooksAPIAlternative:
         except Exception as e:
             return {'error': f'Error processing RapidAPI response: {str(e)}', 'books': []}
 
-    def _format_rapidapi_results(self, products: List[Dict]) -> List[Dict]:
+    def _format_rapidapi_results(self, products: List[Dict]) -> List[BookCard]:
         """
         Format RapidAPI results to match our expected format.
         """
@@ -318,6 +339,6 @@ class AmazonBooksAPIAlternative:
                 'asin': product.get('asin', ''),
                 'publication_date': 'N/A'
             }
-            formatted_books.append(book)
+            formatted_books.append(BookCard.from_amazon(book))
 
         return formatted_books
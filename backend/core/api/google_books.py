@@ -5,6 +5,8 @@ import requests
 from django.conf import settings
 from django.http import HttpResponse
 from django.core.cache import cache
+from core.api.rate_limit import acquire
+from core.services.book_card import BookCard, decode_cards, encode_cards
 GOOGLE_BOOKS_API_URL = "https://www.googleapis.com/books/v1/volumes"
 
 
@@ -21,14 +23,24 @@ class GoogleBooksAPI:
         self.api_key: str = getattr(
             settings, 'GOOGLE_BOOKS_API_KEY', None) or ''
 
-    def fetch_book_details(self: 'GoogleBooksAPI', query: str) -> dict:
+    def _get(self: 'GoogleBooksAPI', url: str, **kwargs) -> requests.Response:
+        """
+        Sends a GET request to Google Books through the shared rate limiter.
+        """
+        acquire('google')
+        return requests.get(url, **kwargs)
+
+    def fetch_book_details(self: 'GoogleBooksAPI', query: str, force_refresh: bool = False) -> dict:
         """
         Method to fetch book details with caching.
         Returns a list of books or an error dict.
         Performs smart search: tries ISBN first, then general search, then related subjects.
+        With force_refresh the cached result is ignored and replaced.
         """
         cache_key = f"google_book_{query}"
-        cached_result = cache.get(cache_key)
+        cached_result = None if force_refresh else cache.get(cache_key)
+        if isinstance(cached_result, list):
+            cached_result = decode_cards(cached_result)
         if cached_result:
             return cached_result
 
@@ -48,7 +60,7 @@ class GoogleBooksAPI:
             params['key'] = self.api_key
 
         try:
-            response = requests.get(self.url, params=params, timeout=5)
+            response = self._get(self.url, params=params, timeout=5)
             response.raise_for_status()
             data: dict = response.json()
         except requests.RequestException as e:
@@ -68,7 +80,52 @@ class GoogleBooksAPI:
         else:
             result = self.__return_multiple_results(data)
 
-        cache.set(cache_key, result, 86400)
+        cache.set(cache_key, encode_cards(result) if isinstance(result, list) else result, 86400)
+        return result
+
+    def search_by_operators(self: 'GoogleBooksAPI', query: str, force_refresh: bool = False) -> dict:
+        """
+        Method to run a single search with Google Books operators such as
+        isbn:, inauthor: or intitle:, without the fallback chain of
+        fetch_book_details.
+
+        Args:
+            query (str): The query with the search operators.
+            force_refresh (bool, optional): Ignore and replace the cached result.
+
+        Returns:
+            dict: A list of books or an error dict.
+        """
+        cache_key = f"google_book_operators_{query}"
+        cached_result = None if force_refresh else cache.get(cache_key)
+        if isinstance(cached_result, list):
+            cached_result = decode_cards(cached_result)
+        if cached_result:
+            return cached_result
+
+        if not self.api_key:
+            return {'error': 'Google Books API key not configured. Please add GOOGLE_BOOKS to your .env file'}
+
+        params: dict = {
+            'q': query,
+            'key': self.api_key,
+            'maxResults': 20,
+            'orderBy': 'relevance'
+        }
+        try:
+            response = self._get(self.url, params=params, timeout=5)
+            response.raise_for_status()
+            data: dict = response.json()
+        except requests.RequestException as e:
+            return {'error': f'Error connecting to Google Books API: {str(e)}'}
+
+        if not data.get('items'):
+            result = {
+                'error': 'No se encontraron libros con la búsqueda proporcionada.'}
+        else:
+            result = self.__return_multiple_results(data)
+
+        cache.set(cache_key, encode_cards(result) if isinstance(result, list) else result, 86400)
         return result
 
     def __get_general_search(self: 'GoogleBooksAPI', query: str, params: dict) -> dict:
@@ -84,7 +141,7 @@ class GoogleBooksAPI:
         """
         params['q'] = query
         params['maxResults'] = 20
-        response = requests.get(self.url, params=params)
+        response = self._get(self.url, params=params)
         data = response.json()
         return data
 
@@ -102,13 +159,13 @@ class GoogleBooksAPI:
         # Search by subject
         params['q'] = f'subject:{query}'
         params['maxResults'] = 20
-        response = requests.get(self.url, params=params)
+        response = self._get(self.url, params=params)
         data = response.json()
 
         # If still no results, try intitle search
         if not data.get('items'):
             params['q'] = f'intitle:{query}'
-            response = requests.get(self.url, params=params)
+            response = self._get(self.url, params=params)
             data = response.json()
 
         return data
@@ -143,24 +200,9 @@ class GoogleBooksAPI:
             data (dict): The JSON response from the Google Books API.
 
         Returns:
-            list: A list of dictionaries containing book details.
+            list: The BookCard of every volume, at most 10.
         """
-        books = []
-        for item in data.get('items', [])[:10]:  # Limit to 10 results
-            book_info = item.get('volumeInfo', {})
-            books.append({
-                'id': item.get('id', 'unknown'),
-                'title': book_info.get('title', 'N/A'),
-                'authors': book_info.get('authors', []),
-                'publisher': book_info.get('publisher', 'N/A'),
-                'publishedDate': book_info.get('publishedDate', 'N/A'),
-                'description': book_info.get('description', 'N/A')[:300] + '...' if book_info.get('description') and len(book_info.get('description', '')) > 300 else book_info.get('description', 'N/A'),
-                'pageCount': book_info.get('pageCount', 'N/A'),
-                'categories': book_info.get('categories', []),
-                'thumbnail': book_info.get('imageLinks', {}).get('thumbnail', '').replace('http://', 'https://'),
-                'previewLink': book_info.get('previewLink', '#'),
-            })
-        return books
+        return [BookCard.from_google(item) for item in data.get('items', [])[:10]]
 
     def get_book_by_id(self: 'GoogleBooksAPI', book_id: str) -> dict:
         """
@@ -183,7 +225,7 @@ class GoogleBooksAPI:
         try:
             url = f"{self.url}/{book_id}"
             params = {'key': self.api_key} if self.api_key else {}
-            response = requests.get(url, params=params, timeout=5)
+            response = self._get(url, params=params, timeout=5)
             response.raise_for_status()
             data = response.json()
 
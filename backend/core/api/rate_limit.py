@@ -0,0 +1,145 @@
+"""
+Rate limiting for the external book APIs, shared by interactive and
+background requests.
+"""
+import threading
+import time
+from contextlib        import contextmanager
+import requests
+from django.conf       import settings
+from django.core.cache import cache
+
+
+DEFAULT_RATE_LIMITS = {
+    'google': {'rate': 1.0, 'burst': 10},
+    'amazon': {'rate': 0.5, 'burst': 5},
+}
+BACKGROUND_RESERVE = 0.5
+
+
+class RateLimitExceeded(requests.RequestException):
+    """
+    Raised when a background request would eat into the interactive budget.
+    """
+
+
+class RateLimiter:
+    """
+    Request budget of one provider: burst requests per window of burst / rate
+    seconds, counted in the cache with the atomic cache.incr. With a shared
+    cache backend (Redis, Memcached) every process draws from the same
+    budget, including management commands; with the local memory cache the
+    budget is per process. Interactive requests always go through and count;
+    background requests only go through while the window keeps a reserve for
+    interactive traffic.
+    """
+
+    def __init__(self: 'RateLimiter', provider: str, rate: float, burst: int) -> None:
+        self.provider = provider
+        self.rate = rate
+        self.burst = burst
+        # Without a rate the budget is a single window that never ends
+        self.window = burst / rate if rate > 0 else None
+
+    def _key(self: 'RateLimiter') -> str:
+        window = int(time.time() // self.window) if self.window else 0
+        return f'rate_limit_{self.provider}_{window}'
+
+    def _incr(self: 'RateLimiter', key: str) -> int:
+        timeout = int(2 * self.window) + 1 if self.window else None
+        for _ in range(2):
+            cache.add(key, 0, timeout)
+            try:
+                return cache.incr(key)
+            except ValueError:
+                # Expired or evicted between add and incr
+                continue
+        return 1
+
+    @property
+    def used(self: 'RateLimiter') -> int:
+        """
+        Requests counted in the current window.
+        """
+        return cache.get(self._key(), 0)
+
+    def consume(self: 'RateLimiter') -> None:
+        """
+        Counts an interactive request.
+        """
+        self._incr(self._key())
+
+    def try_acquire(self: 'RateLimiter', reserve: float = BACKGROUND_RESERVE) -> bool:
+        """
+        Counts a background request only if the window keeps the reserve.
+
+        Args:
+            reserve (float, optional): Fraction of the burst kept for
+                interactive requests. Defaults to 0.5.
+
+        Returns:
+            bool: True if the request may be sent.
+        """
+        key = self._key()
+        if self._incr(key) > (1 - reserve) * self.burst:
+            try:
+                cache.decr(key)
+            except ValueError:
+                pass
+            return False
+        return True
+
+
+_limiters: dict = {}
+_limiters_lock = threading.Lock()
+_priority = threading.local()
+
+
+def get_limiter(provider: str) -> RateLimiter:
+    """
+    Gets the rate limiter of a provider.
+
+    Args:
+        provider (str): 'google' or 'amazon'.
+
+    Returns:
+        RateLimiter: The provider rate limiter.
+    """
+    with _limiters_lock:
+        if provider not in _limiters:
+            limits = getattr(settings, 'EXTERNAL_API_RATE_LIMITS', DEFAULT_RATE_LIMITS)
+            config = limits.get(provider, DEFAULT_RATE_LIMITS.get(provider, {'rate': 1.0, 'burst': 10}))
+            _limiters[provider] = RateLimiter(provider, config['rate'], config['burst'])
+        return _limiters[provider]
+
+
+@contextmanager
+def background_priority():
+    """
+    Marks the requests made by the current thread as background requests.
+    """
+    previous = getattr(_priority, 'background', False)
+    _priority.background = True
+    try:
+        yield
+    finally:
+        _priority.background = previous
+
+
+def acquire(provider: str) -> None:
+    """
+    Accounts for a request to a provider before it is sent.
+
+    Args:
+        provider (str): 'google' or 'amazon'.
+
+    Raises:
+        RateLimitExceeded: If it is a background request and there is no
+            spare budget.
+    """
+    limiter = get_limiter(provider)
+    if getattr(_priority, 'background', False):
+        if not limiter.try_acquire():
+            raise RateLimitExceeded(f'No spare {provider} budget for background requests')
+    else:
+        limiter.consume()
@@ -7,6 +7,7 @@ from openai import OpenAI
 from django.conf import settings
 from django.core.cache import cache
 from core.api.google_books import GoogleBooksAPI
+from core.services.book_card import decode_cards, encode_cards
 
 
 # Initialize OpenAI client
@@ -36,7 +37,9 @@ class AIRecommendationService:
         cache_key = f'ai_recommendations_user_{user.id}'
         cached_recommendations = cache.get(cache_key)
         if cached_recommendations:
-            return cached_recommendations
+            cards = decode_cards(cached_recommendations)
+            if cards is not None:
+                return cards
 
         # Generate AI recommendations
         search_queries = self._generate_search_queries(user)
@@ -56,7 +59,7 @@ class AIRecommendationService:
                 continue
 
         # Cache for 6 hours
-        cache.set(cache_key, recommended_books, 21600)
+        cache.set(cache_key, encode_cards(recommended_books), 21600)
         return recommended_books
 
     def _generate_search_queries(self, user):
@@ -0,0 +1,212 @@
+"""
+Approximate nearest neighbors by cosine similarity with random hyperplanes.
+"""
+import numpy as np
+from sklearn.preprocessing import normalize
+
+
+DEFAULT_TABLES  = 8
+DEFAULT_BITS    = 10
+HASH_BLOCK_SIZE = 4096
+
+
+class HyperplaneLSH:
+    """
+    Locality sensitive hashing index for cosine similarity.
+
+    Every table hashes a vector to the signs of its projections on n_bits
+    random hyperplanes, so two vectors share a bucket with probability
+    (1 - angle / pi) ** n_bits. A query reads its bucket in every table and
+    ranks the union of their members exactly. More bits make buckets smaller
+    and queries faster; more tables find more of the true neighbors. Each
+    table is stored as its bucket codes sorted, with the rows in that order,
+    so a bucket is a binary search and a contiguous slice.
+    """
+
+    def __init__(self: 'HyperplaneLSH', vectors, n_tables: int = DEFAULT_TABLES,
+                 n_bits: int = DEFAULT_BITS, seed: int = 0, planes: np.ndarray = None,
+                 codes: np.ndarray = None, order: np.ndarray = None) -> None:
+        """
+        Builds the index, or restores it from the arrays of to_arrays().
+
+        Args:
+            vectors: The row vectors, dense or sparse; they are normalized.
+            n_tables (int, optional): Hash tables. Defaults to 8.
+            n_bits (int, optional): Hyperplanes per table, at most 31. Defaults to 10.
+            seed (int, optional): Seed of the random hyperplanes. Defaults to 0.
+            planes, codes, order (np.ndarray, optional): Stored index arrays;
+                the vectors are then used as they are, already normalized.
+        """
+        if planes is None:
+            self.vectors = normalize(vectors).astype(np.float32)
+            n_bits = min(n_bits, 31)
+            rng = np.random.default_rng(seed)
+            planes = rng.standard_normal((n_tables * n_bits, self.vectors.shape[1])).astype(np.float32)
+            planes = planes.reshape(n_tables, n_bits, -1)
+            row_codes = self.hash(self.vectors, planes)
+            order = np.argsort(row_codes, axis=0, kind='stable').T.astype(np.int32)
+            codes = np.take_along_axis(row_codes.T, order, axis=1)
+        else:
+            self.vectors = vectors
+        self.planes = planes
+        self.codes = codes
+        self.order = order
+
+    def __len__(self: 'HyperplaneLSH') -> int:
+        return self.vectors.shape[0]
+
+    @property
+    def n_tables(self: 'HyperplaneLSH') -> int:
+        """
+        Number of hash tables.
+        """
+        return self.planes.shape[0]
+
+    @staticmethod
+    def hash(vectors, planes: np.ndarray) -> np.ndarray:
+        """
+        Gets the bucket code of every vector in every table.
+
+        Args:
+            vectors: The row vectors, dense or sparse.
+            planes (np.ndarray): The (tables, bits, dimensions) hyperplanes.
+
+        Returns:
+            np.ndarray: An int32 array of shape (N, tables).
+        """
+        n_tables, n_bits, _ = planes.shape
+        flat = planes.reshape(n_tables * n_bits, -1).T
+        weights = np.left_shift(1, np.arange(n_bits, dtype=np.int64))
+        codes = np.empty((vectors.shape[0], n_tables), dtype=np.int32)
+        for start in range(0, vectors.shape[0], HASH_BLOCK_SIZE):
+            stop = min(start + HASH_BLOCK_SIZE, vectors.shape[0])
+            bits = np.asarray(vectors[start:stop] @ flat) > 0
+            codes[start:stop] = bits.reshape(stop - start, n_tables, n_bits) @ weights
+        return codes
+
+    def candidates(self: 'HyperplaneLSH', vector: np.ndarray) -> np.ndarray:
+        """
+        Gets the rows sharing a bucket with a vector in any table.
+
+        Args:
+            vector (np.ndarray): A dense vector.
+
+        Returns:
+            np.ndarray: The candidate rows, sorted.
+        """
+        codes = self.hash(vector.reshape(1, -1), self.planes)[0]
+        found = []
+        for table, code in enumerate(codes):
+            start, stop = np.searchsorted(self.codes[table], [code, code + 1])
+            found.append(self.order[table, start:stop])
+        return np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int32)
+
+    def query(self: 'HyperplaneLSH', vector: np.ndarray, k: int, exclude: int = None) -> tuple:
+        """
+        Gets the approximate K most similar rows of a vector.
+
+        Args:
+            vector (np.ndarray): A dense vector, not necessarily normalized.
+            k (int): Number of neighbors.
+            exclude (int, optional): A row that is never returned, e.g. the
+                row of the vector itself. Defaults to None.
+
+        Returns:
+            tuple: (rows, scores), best first. Fewer than K rows are returned
+                when the buckets hold fewer candidates.
+        """
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        if norm == 0 or k <= 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        vector = vector / norm
+        rows = self.candidates(vector)
+        if exclude is not None:
+            rows = rows[rows != exclude]
+        if not len(rows):
+            return rows, np.empty(0, dtype=np.float32)
+        scores = np.asarray(self.vectors[rows] @ vector, dtype=np.float32).ravel()
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return rows[top].astype(np.int32), scores[top]
+
+    def top_k_neighbors(self: 'HyperplaneLSH', k: int) -> tuple:
+        """
+        Gets the approximate K most similar rows of every row.
+
+        Args:
+            k (int): Neighbors per row.
+
+        Returns:
+            tuple: (neighbors, scores), int32 and float32 arrays of shape
+                (N, K). Missing neighbors are -1 with a score of 0.
+        """
+        neighbors = np.full((len(self), k), -1, dtype=np.int32)
+        scores = np.zeros((len(self), k), dtype=np.float32)
+        for row in range(len(self)):
+            vector = self.vectors[row]
+            vector = vector.toarray() if hasattr(vector, 'toarray') else vector
+            found, found_scores = self.query(vector, k, exclude=row)
+            neighbors[row, :len(found)] = found
+            scores[row, :len(found)] = found_scores
+        return neighbors, scores
+
+    def to_arrays(self: 'HyperplaneLSH') -> dict:
+        """
+        Gets the arrays the index is restored from, besides the vectors.
+
+        Returns:
+            dict: The planes, codes and order arrays.
+        """
+        return {'planes': self.planes, 'codes': self.codes, 'order': self.order}
+
+
+def recall_at_k(approximate: np.ndarray, exact: np.ndarray) -> float:
+    """
+    Gets the share of the exact neighbors that an approximate search found.
+
+    Args:
+        approximate (np.ndarray): (N, K) neighbor rows, -1 for missing ones.
+        exact (np.ndarray): (N, K) exact neighbor rows of the same rows.
+
+    Returns:
+        float: The mean recall@K, between 0 and 1.
+    """
+    if not exact.size:
+        return 1.0
+    found = sum(len(np.intersect1d(a[a >= 0], e)) for a, e in zip(approximate, exact))
+    return found / exact.size
+
+
+def sample_recall(index: HyperplaneLSH, k: int, sample_size: int = 1000, seed: int = 0) -> float:
+    """
+    Measures the recall@K of an index against an exact search, on a random
+    sample of its own rows.
+
+    Args:
+        index (HyperplaneLSH): The index.
+        k (int): Number of neighbors.
+        sample_size (int, optional): Rows queried. Defaults to 1000.
+        seed (int, optional): Seed of the sample. Defaults to 0.
+
+    Returns:
+        float: The mean recall@K, between 0 and 1.
+    """
+    k = min(k, len(index) - 1)
+    if k <= 0:
+        return 1.0
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(index), size=min(sample_size, len(index)), replace=False)
+    approximate = np.full((len(rows), k), -1, dtype=np.int32)
+    exact = np.empty((len(rows), k), dtype=np.int32)
+    for i, row in enumerate(rows):
+        vector = index.vectors[row]
+        vector = np.asarray(vector.toarray() if hasattr(vector, 'toarray') else vector).ravel()
+        found, _ = index.query(vector, k, exclude=row)
+        approximate[i, :len(found)] = found
+        scores = np.asarray(index.vectors @ vector).ravel()
+        scores[row] = -np.inf
+        top = np.argpartition(-scores, k - 1)[:k]
+        exact[i] = top
+    return recall_at_k(approximate, exact)
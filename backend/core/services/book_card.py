@@ -0,0 +1,273 @@
+"""
+Compact book card shared by the database, Google Books and Amazon listings.
+"""
+from django.db.models           import QuerySet
+from django.db.models.functions import Substr
+
+
+CARD_FORMAT        = 1
+DESCRIPTION_LENGTH = 300
+LIBRO_CARD_FIELDS  = ('id', 'categoria_id', 'titulo', 'autor', 'isbn', 'imagen_url', 'precio', 'calificacion')
+SOURCE_LABELS      = {'database': 'Database', 'google': 'Google Books', 'amazon': 'Amazon'}
+
+
+def _short(text: str) -> str:
+    if text and len(text) > DESCRIPTION_LENGTH:
+        return text[:DESCRIPTION_LENGTH] + '...'
+    return text
+
+
+class BookCard:
+    """
+    A book as shown in a listing. Cards have no per-instance dict, and the
+    duplicated camelCase keys of the old card dicts are read-only aliases,
+    so templates and callers using card.get('pageCount') keep working.
+    """
+    __slots__ = ('source', 'id', 'title', 'authors', 'description', 'thumbnail', 'publisher',
+                 'published_date', 'page_count', 'categories', 'link', 'price', 'rating', 'isbn',
+                 'is_local', 'is_favorite')
+
+    ALIASES = {
+        'book_id': 'id',
+        'publishedDate': 'published_date',
+        'publication_date': 'published_date',
+        'pageCount': 'page_count',
+        'previewLink': 'link',
+        'amazon_url': 'link',
+        'image_url': 'thumbnail',
+    }
+
+    def __init__(self: 'BookCard', source: str, id, title: str, authors: list = (), description: str = None,
+                 thumbnail: str = '', publisher: str = None, published_date: str = None,
+                 page_count=None, categories: list = (), link: str = None, price=None, rating=None,
+                 isbn: str = None, is_local: bool = False) -> None:
+        self.source = source
+        self.id = id
+        self.title = title
+        self.authors = tuple(authors)
+        self.description = description
+        self.thumbnail = thumbnail
+        self.publisher = publisher
+        self.published_date = published_date
+        self.page_count = page_count
+        self.categories = tuple(categories)
+        self.link = link
+        self.price = price
+        self.rating = rating
+        self.isbn = isbn
+        self.is_local = is_local
+        self.is_favorite = False
+
+    @classmethod
+    def from_libro(cls: type, libro, source: str = 'database') -> 'BookCard':
+        """
+        Builds the card of a local book. Loaded with card_queryset, only the
+        first characters of the description are read from the database.
+
+        Args:
+            libro (Libro): The book object.
+            source (str, optional): The source code. Defaults to 'database'.
+
+        Returns:
+            BookCard: The card.
+        """
+        if 'descripcion_corta' in libro.__dict__:
+            description = libro.descripcion_corta
+        else:
+            description = libro.descripcion
+        return cls(
+            source      = source,
+            id          = libro.id,
+            title       = libro.titulo,
+            authors     = [libro.autor] if libro.autor else [],
+            description = _short(description),
+            thumbnail   = libro.imagen_url or '',
+            price       = float(libro.precio) if libro.precio else None,
+            rating      = libro.calificacion,
+            isbn        = libro.isbn,
+            is_local    = True,
+        )
+
+    @classmethod
+    def from_google(cls: type, item: dict) -> 'BookCard':
+        """
+        Builds the card of a Google Books volume.
+
+        Args:
+            item (dict): A volume of the Google Books API response.
+
+        Returns:
+            BookCard: The card.
+        """
+        info = item.get('volumeInfo', {})
+        return cls(
+            source         = 'google',
+            id             = item.get('id', 'unknown'),
+            title          = info.get('title', 'N/A'),
+            authors        = info.get('authors', []),
+            description    = _short(info.get('description')) or 'N/A',
+            thumbnail      = info.get('imageLinks', {}).get('thumbnail', '').replace('http://', 'https://'),
+            publisher      = info.get('publisher', 'N/A'),
+            published_date = info.get('publishedDate', 'N/A'),
+            page_count     = info.get('pageCount', 'N/A'),
+            categories     = info.get('categories', []),
+            link           = info.get('previewLink', '#'),
+        )
+
+    @classmethod
+    def from_amazon(cls: type, book: dict) -> 'BookCard':
+        """
+        Builds the card of an Amazon search result.
+
+        Args:
+            book (dict): The book parsed from Amazon.
+
+        Returns:
+            BookCard: The card.
+        """
+        amazon_url = book.get('amazon_url', '')
+        return cls(
+            source         = 'amazon',
+            id             = book.get('asin') or (amazon_url.split('/')[-1] if amazon_url else 'unknown'),
+            title          = book.get('title', 'N/A'),
+            authors        = book.get('authors', []),
+            description    = _short(book.get('description')) or 'N/A',
+            thumbnail      = book.get('image_url', ''),
+            published_date = book.get('publication_date', 'N/A'),
+            link           = amazon_url,
+            price          = book.get('price', 'N/A'),
+            rating         = book.get('rating', 'N/A'),
+            isbn           = book.get('isbn'),
+        )
+
+    @property
+    def source_label(self: 'BookCard') -> str:
+        """
+        The source name shown to users.
+        """
+        return SOURCE_LABELS.get(self.source, self.source)
+
+    def __getitem__(self: 'BookCard', key: str):
+        name = self.ALIASES.get(key, key)
+        if name not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, name)
+
+    def __contains__(self: 'BookCard', key: str) -> bool:
+        return self.ALIASES.get(key, key) in self.__slots__
+
+    def get(self: 'BookCard', key: str, default=None):
+        """
+        Dict-style read, returning the default for unknown or empty fields.
+        """
+        try:
+            value = self[key]
+        except KeyError:
+            return default
+        return default if value is None else value
+
+    def __eq__(self: 'BookCard', other) -> bool:
+        return isinstance(other, BookCard) and self.encode() == other.encode()
+
+    def __hash__(self: 'BookCard') -> int:
+        return hash(self.encode())
+
+    def __repr__(self: 'BookCard') -> str:
+        return f'BookCard({self.source!r}, {self.id!r}, {self.title!r})'
+
+    def to_dict(self: 'BookCard') -> dict:
+        """
+        Gets the card as the JSON object returned by the search APIs.
+
+        Returns:
+            dict: The card fields, with the key names the API has always used.
+        """
+        return {
+            'source': self.source_label,
+            'book_id': self.id,
+            'id': self.id,
+            'title': self.title,
+            'authors': list(self.authors),
+            'description': self.description,
+            'thumbnail': self.thumbnail,
+            'publisher': self.publisher,
+            'publishedDate': self.published_date,
+            'pageCount': self.page_count,
+            'categories': list(self.categories),
+            'link': self.link,
+            'price': self.price,
+            'rating': self.rating,
+            'isbn': self.isbn,
+            'is_local': self.is_local,
+            'is_favorite': self.is_favorite,
+            ('amazon_url' if self.source == 'amazon' else 'previewLink'): self.link,
+        }
+
+    def encode(self: 'BookCard') -> tuple:
+        """
+        Gets the card as a plain tuple for the cache, led by CARD_FORMAT;
+        the per-user is_favorite flag is not stored. Bump CARD_FORMAT
+        whenever __slots__ changes.
+        """
+        return (CARD_FORMAT,) + tuple(getattr(self, name) for name in self.__slots__[:-1])
+
+    @classmethod
+    def decode(cls: type, values: tuple) -> 'BookCard':
+        """
+        Rebuilds a card from BookCard.encode().
+
+        Raises:
+            ValueError: If the tuple was encoded in another card format.
+        """
+        if len(values) != len(cls.__slots__) or values[0] != CARD_FORMAT:
+            raise ValueError('Book card encoded in another format')
+        card = cls.__new__(cls)
+        for name, value in zip(cls.__slots__, values[1:]):
+            setattr(card, name, value)
+        card.is_favorite = False
+        return card
+
+
+def encode_cards(cards: list) -> list:
+    """
+    Encodes a listing for the cache.
+
+    Args:
+        cards (list): The BookCard objects.
+
+    Returns:
+        list: One tuple per card.
+    """
+    return [card.encode() for card in cards]
+
+
+def decode_cards(values: list) -> list:
+    """
+    Decodes a listing read from the cache.
+
+    Args:
+        values (list): The tuples stored by encode_cards.
+
+    Returns:
+        list: The BookCard objects, None if the listing was stored in
+            another card format and has to be treated as a cache miss.
+    """
+    try:
+        return [BookCard.decode(value) for value in values]
+    except (TypeError, ValueError):
+        return None
+
+
+def card_queryset(queryset: QuerySet) -> QuerySet:
+    """
+    Restricts a Libro queryset to the columns a card needs, reading only
+    the beginning of the description.
+
+    Args:
+        queryset (QuerySet): The Libro queryset.
+
+    Returns:
+        QuerySet: The projected queryset, for BookCard.from_libro.
+    """
+    return queryset.only(*LIBRO_CARD_FIELDS).annotate(
+        descripcion_corta=Substr('descripcion', 1, DESCRIPTION_LENGTH + 1))
@@ -0,0 +1,98 @@
+"""
+Denormalized popularity counters stored on Libro.
+"""
+# pylint: disable=E1101
+from django.db                  import transaction
+from django.db.models           import Avg, Case, Count, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from libros.models              import CONTADORES_POPULARIDAD, Libro, Resena
+from profiles.models            import Favorito
+
+
+def ajustar_favoritos(libro_id: int, delta: int) -> None:
+    """
+    Adds a favorite to or removes one from the counter of a book.
+
+    Args:
+        libro_id (int): The book ID.
+        delta (int): 1 when a favorite is added, -1 when it is removed.
+    """
+    Libro.objects.filter(pk=libro_id).update(total_favoritos=F('total_favoritos') + delta)
+
+
+def ajustar_resenas(libro_id: int, calificacion: float, signo: int) -> None:
+    """
+    Adds a review to or removes one from the counters of a book, updating
+    the mean rating in the same statement so concurrent writers never see
+    a count and a mean that disagree.
+
+    Args:
+        libro_id (int): The book ID.
+        calificacion (float): The review rating.
+        signo (int): 1 when the review is added, -1 when it is removed.
+    """
+    total = F('total_resenas') + signo
+    suma = F('promedio_resenas') * F('total_resenas') + signo * calificacion
+    Libro.objects.filter(pk=libro_id).update(
+        total_resenas=total,
+        promedio_resenas=Case(
+            When(total_resenas__lte=-signo, then=Value(0.0)),
+            default=suma / total,
+        ),
+    )
+
+
+def mover_resena(previa: tuple, nueva: tuple) -> None:
+    """
+    Applies a review insert, update or delete to the book counters.
+
+    Args:
+        previa (tuple): (libro_id, calificacion) before the change, None on insert.
+        nueva (tuple): (libro_id, calificacion) after the change, None on delete.
+    """
+    if previa == nueva:
+        return
+    with transaction.atomic():
+        if previa is not None:
+            ajustar_resenas(*previa, signo=-1)
+        if nueva is not None:
+            ajustar_resenas(*nueva, signo=1)
+
+
+def reconciliar(batch_size: int = 2000) -> int:
+    """
+    Recomputes the counters of every book from Favorito and Resena and
+    repairs the ones that drifted.
+
+    Args:
+        batch_size (int, optional): Books fetched and written per batch.
+            Defaults to 2000.
+
+    Returns:
+        int: The number of books repaired.
+    """
+    favoritos = Favorito.objects.filter(libro=OuterRef('pk')).order_by().values(
+        'libro').annotate(total=Count('id')).values('total')
+    resenas = Resena.objects.filter(libro=OuterRef('pk')).order_by().values('libro')
+    libros = Libro.objects.order_by().annotate(
+        real_favoritos=Coalesce(Subquery(favoritos), 0),
+        real_resenas=Coalesce(Subquery(resenas.annotate(total=Count('id')).values('total')), 0),
+        real_promedio=Coalesce(Subquery(resenas.annotate(media=Avg('calificacion')).values('media')),
+                               Value(0.0)),
+    ).values_list('id', *CONTADORES_POPULARIDAD, 'real_favoritos', 'real_resenas', 'real_promedio')
+
+    reparados = []
+    total = 0
+    for libro_id, favs, n_resenas, promedio, real_favs, real_n, real_promedio in libros.iterator(
+            chunk_size=batch_size):
+        if (favs, n_resenas) != (real_favs, real_n) or abs(promedio - real_promedio) > 1e-6:
+            reparados.append(Libro(id=libro_id, total_favoritos=real_favs,
+                                   total_resenas=real_n, promedio_resenas=real_promedio))
+        if len(reparados) >= batch_size:
+            Libro.objects.bulk_update(reparados, CONTADORES_POPULARIDAD)
+            total += len(reparados)
+            reparados = []
+    if reparados:
+        Libro.objects.bulk_update(reparados, CONTADORES_POPULARIDAD)
+        total += len(reparados)
+    return total
@@ -0,0 +1,443 @@
+"""
+Book detail page data: the main book section, the availability offers and
+the related books, cached per book and rendered inline or served
+separately.
+"""
+# pylint: disable=E1101
+import uuid
+from concurrent.futures           import ThreadPoolExecutor, wait
+from django.conf                  import settings
+from django.core.cache            import cache
+from django.template.loader       import render_to_string
+from django.utils.safestring      import SafeString, mark_safe
+from core.api.google_books        import GoogleBooksAPI
+from core.api.amazon_books        import AmazonBooksAPI
+from core.services.fragment_cache import user_segment
+from libros.models                import FuenteLibro, Libro
+
+
+DEFAULT_DETAIL_SECTIONS_DEADLINE = 8
+DEFAULT_DETAIL_CACHE_TIMEOUT     = 300
+AVAILABILITY_TEMPLATE = 'fragments/book_availability.html'
+RELATED_TEMPLATE      = 'fragments/related_books.html'
+
+google_api = GoogleBooksAPI()
+amazon_api = AmazonBooksAPI()
+_sections_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='book-detail')
+
+
+def detail_key(source: str, book_id) -> str:
+    """
+    Gets the cache key of a book detail payload. Local books are keyed by
+    their primary key whatever URL they were reached from.
+    """
+    if source == 'database' and str(book_id).isdigit():
+        book_id = int(book_id)
+    return f'book_detail_{source}_{book_id}'
+
+
+def invalidate_detail(libro_id: int) -> None:
+    """
+    Drops the cached detail payload of a local book.
+
+    Args:
+        libro_id (int): The book ID.
+    """
+    cache.delete(detail_key('database', libro_id))
+
+
+def _section_key(source: str, book_id, payload: dict, section: str) -> str:
+    """
+    Gets the cache key of one section of a book. Sections are keyed by the
+    version of the payload, so invalidating the payload orphans them all.
+    """
+    return f"{detail_key(source, book_id)}_{payload['version']}_{section}"
+
+
+def _store(key: str, value) -> None:
+    timeout = getattr(settings, 'BOOK_DETAIL_CACHE_TIMEOUT', DEFAULT_DETAIL_CACHE_TIMEOUT)
+    cache.set(key, value, timeout)
+
+
+def get_detail(book_id: str, source: str = None) -> tuple:
+    """
+    Gets the detail payload of a book: the main section and the version
+    its availability offers and related books are cached under. A cached
+    payload costs one cache read; on a miss only the main section is loaded.
+
+    Args:
+        book_id (str): The book ID.
+        source (str, optional): 'database', 'google' or 'amazon'. Defaults to
+            'database' for the numeric IDs of local books and 'google' otherwise.
+
+    Returns:
+        tuple: (source, payload, error); payload is a dict or None, error a
+            message or None.
+    """
+    detect = not source
+    if detect:
+        try:
+            int(book_id)
+            source = 'database'
+        except (ValueError, TypeError):
+            source = 'google'
+
+    payload = cache.get(detail_key(source, book_id))
+    # Payloads cached in the old combined format have no version
+    if payload is not None and 'version' in payload:
+        return source, payload, None
+    book, error = load_book(source, book_id)
+    if book is None and detect and source == 'database':
+        # Numeric IDs that are not local books are Google Books IDs
+        return get_detail(book_id, 'google')
+    if error or not book:
+        return source, None, error
+
+    payload = {'book': book, 'version': uuid.uuid4().hex}
+    _store(detail_key(source, book_id), payload)
+    return source, payload, None
+
+
+def _load_database_book(book_id) -> dict:
+    """
+    Loads a local book with its category and its available sources.
+
+    Returns:
+        dict: The book detail payload, None if there is no such book.
+    """
+    libro = Libro.objects.select_related('categoria').filter(id=book_id).first()
+    if libro is None:
+        return None
+    fuentes = FuenteLibro.objects.filter(libro=libro, disponible=True).order_by('precio').values(
+        'plataforma', 'url_libro', 'precio', 'moneda')
+    return {
+        'title': libro.titulo,
+        'authors': [libro.autor] if libro.autor else [],
+        'description': libro.descripcion,
+        'thumbnail': libro.imagen_url,
+        'categories': [libro.categoria.nombre] if libro.categoria else [],
+        'published_date': libro.fecha_publicacion.strftime('%Y-%m-%d') if libro.fecha_publicacion else None,
+        'publishedDate': libro.fecha_publicacion.strftime('%Y-%m-%d') if libro.fecha_publicacion else None,
+        'page_count': libro.paginas,
+        'pageCount': libro.paginas,
+        'publisher': 'N/A',
+        'price': float(libro.precio) if libro.precio else None,
+        'rating': libro.calificacion,
+        'sources': list(fuentes),
+    }
+
+
+def load_book(source: str, book_id: str) -> tuple:
+    """
+    Loads the main section of the detail page.
+
+    Args:
+        source (str): 'database', 'google' or 'amazon'.
+        book_id (str): The book ID in that source.
+
+    Returns:
+        tuple: (book, error); book is a dict or None, error a message or None.
+    """
+    book = None
+    error = None
+
+    if source == 'google':
+        try:
+            book_data = google_api.get_book_by_id(book_id)
+
+            if isinstance(book_data, dict) and 'error' in book_data:
+                error = book_data['error']
+            else:
+                book = book_data
+
+        except Exception as e:
+            error = f'Error al cargar desde Google Books: {str(e)}'
+            print(f"[DEBUG] Google Books error: {e}")
+            print(f"[DEBUG] Book ID: {book_id}")
+            
+    elif source == 'amazon':
+        try:
+            book_data = amazon_api.get_book_details(book_id)
+            
+            if isinstance(book_data, dict) and 'error' in book_data:
+                error = 'No se pudo cargar la información del libro de Amazon'
+            else:
+                book = {
+                    'title': book_data.get('title', 'N/A'),
+                    'authors': book_data.get('authors', []),
+                    'description': book_data.get('description', 'N/A'),
+                    'thumbnail': book_data.get('image_url', ''),
+                    'categories': book_data.get('categories', []),
+                    'published_date': book_data.get('publication_date', 'N/A'),
+                    'publishedDate': book_data.get('publication_date', 'N/A'),
+                    'page_count': book_data.get('pages', 'N/A'),
+                    'pageCount': book_data.get('pages', 'N/A'),
+                    'publisher': book_data.get('publisher', 'N/A'),
+                    'price': book_data.get('price', 'N/A'),
+                    'rating': book_data.get('rating', 'N/A'),
+                    'amazon_url': book_data.get('amazon_url', '#'),
+                }
+        except Exception as e:
+            error = f'Error al cargar desde Amazon: {str(e)}'
+            print(f"[DEBUG] Amazon error: {e}")
+    
+    elif source == 'database':
+        try:
+            book = _load_database_book(book_id)
+            if book is None:
+                error = 'Libro no encontrado en la base de datos'
+        except Exception as e:
+            error = f'Error al cargar desde base de datos: {str(e)}'
+            print(f"[DEBUG] Database error: {e}")
+
+    else:
+        error = 'Fuente de datos no válida'
+
+    return book, error
+
+
+def build_availability_options(book: dict, source: str) -> list:
+    """
+    Builds the purchase options of a book from its registered sources,
+    Amazon and Google Books.
+
+    Args:
+        book (dict): The book detail payload.
+        source (str): The source the book was loaded from.
+
+    Returns:
+        list: The availability options shown in the detail page.
+    """
+    availability_options = []
+    book_title = book.get('title', '')
+
+    # Sources registered for local books
+    for fuente in book.get('sources', []):
+        availability_options.append({
+            'platform': fuente['plataforma'],
+            'platform_logo': fuente['plataforma'].lower().replace(' ', ''),
+            'price': f"${fuente['precio']:.2f} {fuente['moneda']}",
+            'language': 'Español',
+            'format': 'Físico',
+            'stock': 'Disponible',
+            'link': fuente['url_libro'],
+            'link_text': f"Ver en {fuente['plataforma']}",
+            'show_favorite': False,
+            'rating': None
+        })
+
+    # Try to find on Amazon
+    if book_title:
+        try:
+            amazon_result = amazon_api.search_books(book_title, max_results=1)
+            if isinstance(amazon_result, dict) and 'books' in amazon_result and amazon_result['books']:
+                amazon_book = amazon_result['books'][0]
+                amazon_price = amazon_book.get('price', 'Precio no disponible')
+                availability_options.append({
+                    'platform': 'Amazon',
+                    'platform_logo': 'amazon',
+                    'price': amazon_price,
+                    'language': 'Español',
+                    'format': 'Físico',
+                    'stock': f"{amazon_book.get('availability', 'Consultar')} disponible" if amazon_book.get('availability') else 'Consultar disponibilidad',
+                    'link': amazon_book.get('amazon_url', f'https://www.amazon.com.mx/s?k={book_title.replace(" ", "+")}'),
+                    'link_text': 'Ver en Amazon',
+                    'show_favorite': False,
+                    'rating': amazon_book.get('rating', None)
+                })
+            else:
+                # Fallback Amazon option - link to search
+                availability_options.append({
+                    'platform': 'Amazon',
+                    'platform_logo': 'amazon',
+                    'price': 'Ver precio',
+                    'language': 'Español',
+                    'format': 'Físico',
+                    'stock': 'Consultar disponibilidad',
+                    'link': f'https://www.amazon.com.mx/s?k={book_title.replace(" ", "+")}',
+                    'link_text': 'Buscar en Amazon',
+                    'show_favorite': False,
+                    'rating': None
+                })
+        except Exception as e:
+            print(f"[DEBUG] Error fetching Amazon data: {e}")
+            # Fallback Amazon option
+            availability_options.append({
+                'platform': 'Amazon',
+                'platform_logo': 'amazon',
+                'price': 'Ver precio',
+                'language': 'Español',
+                'format': 'Físico / Digital',
+                'stock': 'Consultar disponibilidad',
+                'link': f'https://www.amazon.com.mx/s?k={book_title.replace(" ", "+")}',
+                'link_text': 'Buscar en Amazon',
+                'show_favorite': False,
+                'rating': None
+            })
+
+    # Google Books option (always available for Google source)
+    if source == 'google':
+        preview_link = book.get('previewLink', '')
+        buy_link = book.get('buyLink', '')
+
+        # Format price from Google Books
+        google_price = None
+        if book.get('price') and book.get('currency'):
+            if book.get('currency') == 'USD':
+                google_price = f"${book.get('price'):.2f} USD"
+            elif book.get('currency') == 'MXN':
+                google_price = f"${book.get('price'):.2f} MXN"
+            else:
+                google_price = f"{book.get('price'):.2f} {book.get('currency')}"
+
+        # Determine the best link (buy link if available, otherwise preview)
+        best_link = buy_link if buy_link else preview_link
+        link_text = 'Comprar en Google Books' if buy_link else 'Ver vista previa'
+
+        # Determine stock based on saleability
+        saleability = book.get('saleability', 'NOT_FOR_SALE')
+        if saleability == 'FOR_SALE':
+            stock_text = 'Disponible para compra'
+        elif saleability == 'FREE':
+            stock_text = 'Gratis'
+            google_price = 'Gratis'
+        else:
+            stock_text = 'Solo vista previa'
+            google_price = google_price or 'No disponible para compra'
+
+        if best_link:
+            availability_options.append({
+                'platform': 'Google Books',
+                'platform_logo': 'google',
+                'price': google_price,
+                'language': 'Múltiples idiomas',
+                'format': 'Digital',
+                'stock': stock_text,
+                'link': best_link,
+                'link_text': link_text,
+                'show_favorite': True,
+                'rating': None
+            })
+    return availability_options
+
+
+def build_related_books(book: dict, user) -> list:
+    """
+    Gets AI recommendations of books related to a book.
+
+    Args:
+        book (dict): The book detail payload.
+        user: The user object, possibly anonymous.
+
+    Returns:
+        list: The related book cards.
+    """
+    related_books = []
+    try:
+        from core.services.ai_recommendations import AIRecommendationService
+
+        ai_service = AIRecommendationService()
+        book_title = book.get('title', '')
+        book_categories = book.get('categories', [])
+
+        # Use the first category if available, otherwise use the book title
+        category_for_search = book_categories[0] if book_categories else book_title
+
+        # Get personalized recommendations, as Google Books cards
+        related_books = ai_service.get_books_by_category(
+            category_name=category_for_search,
+            num_books=6,
+            user=user if user is not None and user.is_authenticated else None
+        )
+
+    except Exception as e:
+        print(f"[DEBUG] Error fetching related books: {e}")
+        related_books = []
+    return related_books
+
+
+def availability_fragment(payload: dict, source: str, book_id: str, build: bool = True) -> SafeString:
+    """
+    Renders the availability section of a book, building and caching the
+    offers on first use. The payload itself is never modified.
+
+    Args:
+        payload (dict): The book detail payload.
+        source (str): The source the book was loaded from.
+        book_id (str): The book ID in that source.
+        build (bool, optional): Build the offers if missing. Defaults to True.
+
+    Returns:
+        SafeString: The HTML, or None if the offers are missing and build is False.
+    """
+    key = _section_key(source, book_id, payload, 'offers')
+    offers = cache.get(key)
+    if offers is None:
+        if not build:
+            return None
+        offers = build_availability_options(payload['book'], source)
+        _store(key, offers)
+    return mark_safe(render_to_string(AVAILABILITY_TEMPLATE, {'availability_options': offers}))
+
+
+def related_fragment(payload: dict, source: str, book_id: str, user, build: bool = True) -> SafeString:
+    """
+    Renders the related books section of a book. The related books are
+    personalized by profile, so one list is cached per segment.
+
+    Args:
+        payload (dict): The book detail payload.
+        source (str): The source the book was loaded from.
+        book_id (str): The book ID in that source.
+        user: The user object, possibly anonymous.
+        build (bool, optional): Build the list if missing. Defaults to True.
+
+    Returns:
+        SafeString: The HTML, or None if the list is missing and build is False.
+    """
+    segment = ':'.join(str(value) for value in user_segment(user))
+    key = _section_key(source, book_id, payload, f'related_{segment}')
+    related_books = cache.get(key)
+    if related_books is None:
+        if not build:
+            return None
+        related_books = build_related_books(payload['book'], user)
+        _store(key, related_books)
+    return mark_safe(render_to_string(RELATED_TEMPLATE, {'related_books': related_books}))
+
+
+def render_sections(payload: dict, source: str, book_id: str, user, deadline: float = None) -> dict:
+    """
+    Builds the availability and related sections concurrently. Each worker
+    caches only its own section, so they share nothing but the read-only
+    payload. Sections not ready by the deadline are left out, so the page
+    can load them later.
+
+    Args:
+        payload (dict): The book detail payload.
+        source (str): The source the book was loaded from.
+        book_id (str): The book ID in that source.
+        user: The user object, possibly anonymous.
+        deadline (float, optional): Seconds to wait for both sections.
+            Defaults to BOOK_DETAIL_SECTIONS_DEADLINE.
+
+    Returns:
+        dict: 'availability_html' and 'related_html', None when not ready.
+    """
+    if deadline is None:
+        deadline = getattr(settings, 'BOOK_DETAIL_SECTIONS_DEADLINE', DEFAULT_DETAIL_SECTIONS_DEADLINE)
+    futures = {
+        'availability_html': _sections_executor.submit(
+            availability_fragment, payload, source, book_id),
+        'related_html': _sections_executor.submit(
+            related_fragment, payload, source, book_id, user),
+    }
+    wait(futures.values(), timeout=deadline)
+    sections = {}
+    for name, future in futures.items():
+        # Unfinished sections keep running and fill the cache for the page fetch
+        if future.done() and future.exception() is None:
+            sections[name] = future.result()
+        else:
+            sections[name] = None
+    return sections
@@ -0,0 +1,148 @@
+"""
+Incremental maintenance of the CategoriaStats read model.
+"""
+# pylint: disable=E1101
+from decimal                      import Decimal
+from django.db                    import transaction
+from django.db.models             import Count, DecimalField, F, Max, Min, Q, Sum, Value
+from django.db.models.functions   import Coalesce, Greatest, Least
+from libros.models                import Categoria, CategoriaStats, Libro
+from core.services.fragment_cache import STATS_VERSION, bump_version
+
+
+def _precio(precio) -> Decimal:
+    if precio is None:
+        return None
+    return Decimal(str(precio)).quantize(Decimal('0.01'))
+
+
+def contribucion(libro: Libro) -> tuple:
+    """
+    Gets the part of a book that the category statistics depend on.
+
+    Args:
+        libro (Libro): The book.
+
+    Returns:
+        tuple: (categoria_id, disponible, calificacion, precio), or None if
+            the book has no category.
+    """
+    if libro.categoria_id is None:
+        return None
+    calificacion = float(libro.calificacion) if libro.calificacion is not None else None
+    return (libro.categoria_id, bool(libro.disponible), calificacion, _precio(libro.precio))
+
+
+def contribucion_guardada(libro_id: int) -> tuple:
+    """
+    Gets the contribution of a book as currently stored in the database.
+
+    Args:
+        libro_id (int): The book ID, None for unsaved books.
+
+    Returns:
+        tuple: The stored contribution, or None.
+    """
+    if libro_id is None:
+        return None
+    libro = Libro.objects.filter(pk=libro_id).only(
+        'categoria_id', 'disponible', 'calificacion', 'precio').first()
+    return contribucion(libro) if libro else None
+
+
+def aplicar_cambio(previa: tuple, nueva: tuple) -> None:
+    """
+    Moves a book contribution in the statistics: removes the previous one
+    and adds the new one. Saves that do not touch the relevant fields cost
+    no writes.
+
+    Args:
+        previa (tuple): The contribution before the change, None on insert.
+        nueva (tuple): The contribution after the change, None on delete.
+    """
+    if previa == nueva:
+        return
+    with transaction.atomic():
+        if previa is not None:
+            _sumar(previa, -1)
+        if nueva is not None:
+            _sumar(nueva, 1)
+    bump_version(STATS_VERSION)
+
+
+def _sumar(aporte: tuple, signo: int) -> None:
+    categoria_id, disponible, calificacion, precio = aporte
+    CategoriaStats.objects.get_or_create(categoria_id=categoria_id)
+
+    campos = {'total_libros': F('total_libros') + signo}
+    if disponible:
+        campos['libros_disponibles'] = F('libros_disponibles') + signo
+        if calificacion is not None:
+            campos['libros_calificados'] = F('libros_calificados') + signo
+            campos['suma_calificaciones'] = F('suma_calificaciones') + signo * calificacion
+        if signo > 0 and precio is not None:
+            valor = Value(precio, output_field=DecimalField(max_digits=10, decimal_places=2))
+            campos['precio_minimo'] = Least(Coalesce('precio_minimo', valor), valor)
+            campos['precio_maximo'] = Greatest(Coalesce('precio_maximo', valor), valor)
+    CategoriaStats.objects.filter(categoria_id=categoria_id).update(**campos)
+
+    # The price range cannot be shrunk incrementally
+    if disponible and signo < 0 and precio is not None:
+        CategoriaStats.objects.filter(categoria_id=categoria_id).update(
+            **_rango_precios(categoria_id))
+
+
+def _rango_precios(categoria_id: int) -> dict:
+    return Libro.objects.filter(categoria_id=categoria_id, disponible=True).aggregate(
+        precio_minimo=Min('precio'),
+        precio_maximo=Max('precio'),
+    )
+
+
+def reconstruir() -> int:
+    """
+    Rebuilds the statistics of every category from the books table with a
+    single grouped query. Needed after bulk writes that skip the signals,
+    such as QuerySet.update() or bulk_create().
+
+    Returns:
+        int: The number of categories rebuilt.
+    """
+    disponibles = Q(disponible=True)
+    calificados = Q(disponible=True, calificacion__isnull=False)
+    filas = {
+        fila.pop('categoria_id'): fila
+        for fila in Libro.objects.filter(categoria__isnull=False).order_by().values(
+            'categoria_id'
+        ).annotate(
+            total_libros        = Count('id'),
+            libros_disponibles  = Count('id', filter=disponibles),
+            libros_calificados  = Count('id', filter=calificados),
+            suma_calificaciones = Coalesce(Sum('calificacion', filter=calificados), 0.0),
+            precio_minimo       = Min('precio', filter=disponibles),
+            precio_maximo       = Max('precio', filter=disponibles),
+        )
+    }
+    estadisticas = [
+        CategoriaStats(categoria_id=categoria_id, **filas.get(categoria_id, {}))
+        for categoria_id in Categoria.objects.values_list('id', flat=True)
+    ]
+    with transaction.atomic():
+        CategoriaStats.objects.all().delete()
+        CategoriaStats.objects.bulk_create(estadisticas)
+    bump_version(STATS_VERSION)
+    return len(estadisticas)
+
+
+def estadisticas_de(categoria: Categoria) -> CategoriaStats:
+    """
+    Gets the statistics of a category with a single-row read.
+
+    Args:
+        categoria (Categoria): The category.
+
+    Returns:
+        CategoriaStats: The statistics, empty if the category has no books.
+    """
+    return (CategoriaStats.objects.filter(categoria_id=categoria.id).first()
+            or CategoriaStats(categoria=categoria))
@@ -0,0 +1,71 @@
+"""
+Per-user favorite set cache used to mark favorite books in any listing.
+"""
+# pylint: disable=E1101
+from django.core.cache import cache
+from profiles.models   import Favorito
+
+
+FAVORITE_IDS_TIMEOUT = 3600
+
+
+def favorite_ids_cache_key(user_id: int) -> str:
+    """
+    Gets the cache key of the favorite set of a user.
+    """
+    return f'favorite_ids_user_{user_id}'
+
+
+def get_favorite_ids(user) -> frozenset:
+    """
+    Gets the IDs of the favorite books of a user, cached until the user adds
+    or removes a favorite.
+
+    Args:
+        user: The user object, possibly anonymous.
+
+    Returns:
+        frozenset: The favorite book IDs.
+    """
+    if user is None or not user.is_authenticated:
+        return frozenset()
+    cache_key = favorite_ids_cache_key(user.id)
+    favorite_ids = cache.get(cache_key)
+    if favorite_ids is None:
+        favorite_ids = frozenset(
+            Favorito.objects.filter(usuario_id=user.id).values_list('libro_id', flat=True))
+        cache.set(cache_key, favorite_ids, FAVORITE_IDS_TIMEOUT)
+    return favorite_ids
+
+
+def invalidate_favorite_ids(user_id: int) -> None:
+    """
+    Drops the cached favorite set of a user.
+
+    Args:
+        user_id (int): The user ID.
+    """
+    cache.delete(favorite_ids_cache_key(user_id))
+
+
+def annotate_favorites(books, user) -> list:
+    """
+    Sets 'is_favorite' on every book of a listing with a single cache read.
+    Works with Libro objects, BookCard objects and book card dicts; only
+    database books can be favorites.
+
+    Args:
+        books: The Libro objects, cards or card dicts.
+        user: The user object, possibly anonymous.
+
+    Returns:
+        list: The same books, annotated.
+    """
+    favorite_ids = get_favorite_ids(user)
+    books = list(books)
+    for book in books:
+        if isinstance(book, dict):
+            book['is_favorite'] = book.get('is_local', False) and book.get('id') in favorite_ids
+        else:
+            book.is_favorite = getattr(book, 'is_local', True) and book.id in favorite_ids
+    return books
@@ -0,0 +1,118 @@
+"""
+Shared HTML fragment cache for the heavy pages, invalidated by version keys.
+"""
+import hashlib
+from django.core.cache         import cache
+from django.template.loader    import render_to_string
+from django.utils.safestring   import SafeString, mark_safe
+
+
+CATALOG_VERSION  = 'catalog'
+STATS_VERSION    = 'stats'
+FRAGMENT_TIMEOUT = 600
+
+
+def _version_key(name: str) -> str:
+    return f'fragment_version_{name}'
+
+
+def get_versions(*names: str) -> list:
+    """
+    Gets the current value of some version keys with a single cache read.
+
+    Args:
+        *names (str): The version names, e.g. CATALOG_VERSION.
+
+    Returns:
+        list: The versions, in the same order.
+    """
+    found = cache.get_many([_version_key(name) for name in names])
+    return [found.get(_version_key(name), 0) for name in names]
+
+
+def bump_version(name: str) -> None:
+    """
+    Invalidates every fragment that depends on a version key.
+
+    Args:
+        name (str): The version name, e.g. CATALOG_VERSION.
+    """
+    try:
+        cache.incr(_version_key(name))
+    except ValueError:
+        cache.set(_version_key(name), 1, None)
+
+
+def _fragment_key(name: str, vary: tuple, versions: tuple) -> str:
+    parts = [f'{version}{value}' for version, value in zip(versions, get_versions(*versions))]
+    parts += [str(value) for value in vary]
+    digest = hashlib.md5(':'.join(parts).encode('utf-8')).hexdigest()
+    return f'fragment_{name}_{digest}'
+
+
+def cached_fragment(name: str, vary: tuple, builder, versions: tuple = (CATALOG_VERSION,),
+                    timeout: int = FRAGMENT_TIMEOUT):
+    """
+    Gets a cached value shared by every request with the same vary values,
+    building it only on a miss. A builder returning None is not cached, so
+    failures are retried on the next request.
+
+    Args:
+        name (str): The fragment name.
+        vary (tuple): The values the fragment depends on.
+        builder (callable): Builds the value on a cache miss.
+        versions (tuple, optional): The version keys that invalidate it.
+            Defaults to (CATALOG_VERSION,).
+        timeout (int, optional): Cache timeout in seconds. Defaults to 600.
+
+    Returns:
+        The cached or freshly built value.
+    """
+    cache_key = _fragment_key(name, vary, versions)
+    value = cache.get(cache_key)
+    if value is None:
+        value = builder()
+        if value is not None:
+            cache.set(cache_key, value, timeout)
+    return value
+
+
+def render_fragment(name: str, template_name: str, vary: tuple, build_context,
+                    versions: tuple = (CATALOG_VERSION,), timeout: int = FRAGMENT_TIMEOUT) -> SafeString:
+    """
+    Renders a template fragment shared between users. The fragment must not
+    contain per-user data; favorite flags and greetings are overlaid by the
+    page itself.
+
+    Args:
+        name (str): The fragment name.
+        template_name (str): The fragment template.
+        vary (tuple): The values the fragment depends on.
+        build_context (callable): Builds the template context on a cache miss.
+        versions (tuple, optional): The version keys that invalidate it.
+            Defaults to (CATALOG_VERSION,).
+        timeout (int, optional): Cache timeout in seconds. Defaults to 600.
+
+    Returns:
+        SafeString: The rendered HTML.
+    """
+    html = cached_fragment(
+        name, vary, lambda: render_to_string(template_name, build_context()), versions, timeout)
+    return mark_safe(html)
+
+
+def user_segment(user) -> tuple:
+    """
+    Gets the profile fields the AI recommendations are personalized with, so
+    users with the same profile share the same fragments.
+
+    Args:
+        user: The user object, possibly anonymous.
+
+    Returns:
+        tuple: The segment values.
+    """
+    if user is None or not user.is_authenticated:
+        return ('anonymous',)
+    return (getattr(user, 'carrera', ''), getattr(user, 'nivel_academico', ''),
+            getattr(user, 'universidad', ''))
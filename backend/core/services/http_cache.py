@@ -0,0 +1,92 @@
+"""
+HTTP validators and caching headers for the catalog API endpoints.
+"""
+# pylint: disable=E1101
+import hashlib
+from datetime                     import datetime
+from functools                    import wraps
+from django.conf                  import settings
+from django.db.models             import Count, Max
+from django.http                  import HttpRequest
+from django.utils.cache           import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+from libros.models                import Categoria, Libro
+
+
+DEFAULT_CATALOG_API_MAX_AGE = 60
+
+
+def _catalog_state(request: HttpRequest) -> tuple:
+    """
+    Gets the last write time and the size of the books and categories a
+    catalog response is built from, with one aggregate per table. Counts
+    catch deletes, which leave no timestamp behind. The result is kept on
+    the request, so the ETag and Last-Modified functions share it.
+    """
+    if not hasattr(request, '_catalog_state'):
+        libros = Libro.objects.all()
+        categoria_id = request.GET.get('categoria_id')
+        if categoria_id and categoria_id.isdigit():
+            libros = libros.filter(categoria_id=categoria_id)
+        estado_libros = libros.order_by().aggregate(ultimo=Max('fecha_actualizacion'), total=Count('id'))
+        estado_categorias = Categoria.objects.order_by().aggregate(
+            ultimo=Max('fecha_actualizacion'), total=Count('id'))
+        request._catalog_state = (
+            estado_libros['ultimo'], estado_libros['total'],
+            estado_categorias['ultimo'], estado_categorias['total'],
+        )
+    return request._catalog_state
+
+
+def catalog_etag(request: HttpRequest, *args, **kwargs) -> str:
+    """
+    Gets the ETag of a catalog response.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        str: A digest of the catalog state and the query string.
+    """
+    partes = [request.path, request.GET.urlencode()] + [str(valor) for valor in _catalog_state(request)]
+    return hashlib.md5('|'.join(partes).encode('utf-8')).hexdigest()
+
+
+def catalog_last_modified(request: HttpRequest, *args, **kwargs) -> datetime:
+    """
+    Gets the Last-Modified time of a catalog response.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        datetime: The latest book or category write, None if there is none.
+    """
+    ultimo_libro, _, ultima_categoria, _ = _catalog_state(request)
+    fechas = [fecha for fecha in (ultimo_libro, ultima_categoria) if fecha is not None]
+    return max(fechas) if fechas else None
+
+
+def catalog_cache(view_func):
+    """
+    Decorator for the catalog API endpoints. Answers conditional requests
+    with 304 Not Modified before the view runs, and lets browsers and shared
+    proxies keep anonymous responses for CATALOG_API_MAX_AGE seconds.
+    Authenticated responses must be revalidated on every use.
+    """
+    conditional_view = condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)(
+        view_func)
+
+    @wraps(view_func)
+    def wrapper(request: HttpRequest, *args, **kwargs):
+        response = conditional_view(request, *args, **kwargs)
+        if response.status_code not in (200, 304):
+            return response
+        if request.user.is_authenticated:
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            max_age = getattr(settings, 'CATALOG_API_MAX_AGE', DEFAULT_CATALOG_API_MAX_AGE)
+            patch_cache_control(response, public=True, max_age=max_age)
+        patch_vary_headers(response, ('Cookie',))
+        return response
+    return wrapper
@@ -0,0 +1,114 @@
+"""
+Speculative background prefetch of book detail data.
+"""
+import logging
+import queue
+import threading
+import time
+from django.conf           import settings
+from django.core.cache     import cache
+from core.api.google_books import GoogleBooksAPI
+from core.api.amazon_books import AmazonBooksAPI
+from core.api.rate_limit   import background_priority
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREFETCH_TOP_N = 3
+PREFETCH_QUEUE_SIZE    = 100
+PREFETCH_DEDUP_TIMEOUT = 600
+PREFETCH_PAUSE         = 0.2
+
+
+class DetailPrefetcher:
+    """
+    Warms the caches used by book_detail_view for the top results of a search:
+    the Google Books volume detail, the Amazon product detail and the Amazon
+    title search used for availability.
+
+    A single daemon thread drains a bounded queue, and its requests run at
+    background priority, so they are dropped whenever the provider budget is
+    needed by interactive traffic.
+    """
+
+    def __init__(self: 'DetailPrefetcher') -> None:
+        self.google_api = GoogleBooksAPI()
+        self.amazon_api = AmazonBooksAPI()
+        self._queue: queue.Queue = queue.Queue(maxsize=PREFETCH_QUEUE_SIZE)
+        self._worker = None
+        self._lock = threading.Lock()
+
+    @property
+    def top_n(self: 'DetailPrefetcher') -> int:
+        """
+        Number of results prefetched per search, from SEARCH_PREFETCH_TOP_N.
+        """
+        return getattr(settings, 'SEARCH_PREFETCH_TOP_N', DEFAULT_PREFETCH_TOP_N)
+
+    def enqueue(self: 'DetailPrefetcher', books: list) -> int:
+        """
+        Schedules the prefetch of the first results of a search. Never blocks:
+        when the queue is full the remaining books are skipped.
+
+        Args:
+            books (list): The search cards, best result first.
+
+        Returns:
+            int: The number of books scheduled.
+        """
+        scheduled = 0
+        for book in books[:self.top_n]:
+            source = book.get('source')
+            book_id = book.get('book_id', book.get('id'))
+            if not book_id or book_id == 'unknown':
+                continue
+            if not cache.add(f'prefetch_{source}_{book_id}', True, PREFETCH_DEDUP_TIMEOUT):
+                continue
+            try:
+                self._queue.put_nowait((source, book_id, book.get('title', '')))
+            except queue.Full:
+                break
+            scheduled += 1
+        if scheduled:
+            self._ensure_worker()
+        return scheduled
+
+    def _ensure_worker(self: 'DetailPrefetcher') -> None:
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name='detail-prefetch', daemon=True)
+                self._worker.start()
+
+    def _run(self: 'DetailPrefetcher') -> None:
+        while True:
+            source, book_id, title = self._queue.get()
+            try:
+                with background_priority():
+                    self.prefetch(source, book_id, title)
+            except Exception as e:
+                logger.warning("Error prefetching %s %s: %s", source, book_id, str(e))
+            finally:
+                self._queue.task_done()
+            time.sleep(PREFETCH_PAUSE)
+
+    def prefetch(self: 'DetailPrefetcher', source: str, book_id: str, title: str) -> None:
+        """
+        Fetches the detail payload and the availability offers of a book.
+
+        Args:
+            source (str): The search card source ('google', 'amazon' or 'database').
+            book_id (str): The book ID in that source.
+            title (str): The book title, used for the availability search.
+        """
+        if source == 'google':
+            book = self.google_api.get_book_by_id(book_id)
+            title = book.get('title', title) if isinstance(book, dict) else title
+        elif source == 'amazon':
+            book = self.amazon_api.get_book_details(book_id)
+            title = book.get('title', title) if isinstance(book, dict) else title
+        if title:
+            self.amazon_api.search_books(title, max_results=1)
+
+
+detail_prefetcher = DetailPrefetcher()
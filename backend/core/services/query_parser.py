@@ -0,0 +1,183 @@
+"""
+Parser for structured book search queries.
+"""
+import re
+import unicodedata
+
+
+FIELD_ALIASES = {
+    'autor': 'autores',
+    'titulo': 'titulos',
+    'categoria': 'categorias',
+}
+FIELD_PATTERN  = re.compile(r'(\w+):(?:"([^"]*)"|(\S+))')
+PHRASE_PATTERN = re.compile(r'"([^"]+)"')
+ISBN_PATTERN   = re.compile(r'^(?:\d[\d-]{8,15}[\dXx])$')
+WORD_PATTERN   = re.compile(r'\w+')
+MAX_WORD_LENGTH = 50
+
+
+def _strip_accents(text: str) -> str:
+    """
+    Removes the accents of a text so 'título' and 'titulo' are the same field.
+    """
+    return ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+
+
+def word_tokens(text: str) -> list:
+    """
+    Splits a text in its distinct words, lowercased and without accents, as
+    they are stored in PalabraLibro.
+
+    Args:
+        text (str): The text, e.g. a title or an author.
+
+    Returns:
+        list: The words, in order of appearance.
+    """
+    words = WORD_PATTERN.findall(_strip_accents(text or '').casefold())
+    return list(dict.fromkeys(word[:MAX_WORD_LENGTH] for word in words))
+
+
+def normalize_isbn(token: str) -> str | None:
+    """
+    Validates an ISBN-10 or ISBN-13 and returns it as ISBN-13.
+
+    Args:
+        token (str): The candidate ISBN, with or without hyphens.
+
+    Returns:
+        str | None: The ISBN-13 digits, or None when the token is not a valid ISBN.
+    """
+    if not ISBN_PATTERN.match(token):
+        return None
+    digits = token.replace('-', '').upper()
+
+    if len(digits) == 10:
+        if not digits[:9].isdigit() or digits[9] not in '0123456789X':
+            return None
+        total = sum((10 - i) * (10 if d == 'X' else int(d)) for i, d in enumerate(digits))
+        if total % 11:
+            return None
+        digits = '978' + digits[:9]
+        check = (10 - sum((3 if i % 2 else 1) * int(d) for i, d in enumerate(digits)) % 10) % 10
+        return digits + str(check)
+
+    if len(digits) == 13 and digits.isdigit():
+        total = sum((3 if i % 2 else 1) * int(d) for i, d in enumerate(digits))
+        return digits if total % 10 == 0 else None
+    return None
+
+
+def isbn13_to_isbn10(isbn13: str) -> str | None:
+    """
+    Converts a 978-prefixed ISBN-13 to its ISBN-10 form.
+
+    Args:
+        isbn13 (str): The ISBN-13 digits.
+
+    Returns:
+        str | None: The ISBN-10, or None when it has no ISBN-10 form.
+    """
+    if not isbn13.startswith('978'):
+        return None
+    body = isbn13[3:12]
+    check = (11 - sum((10 - i) * int(d) for i, d in enumerate(body)) % 11) % 11
+    return body + ('X' if check == 10 else str(check))
+
+
+class ParsedQuery:
+    """
+    A search query split in the parts that can be resolved by the cheapest path.
+    """
+
+    def __init__(self: 'ParsedQuery') -> None:
+        self.isbns: list      = []
+        self.autores: list    = []
+        self.titulos: list    = []
+        self.categorias: list = []
+        self.frases: list     = []
+        self.texto: str       = ''
+
+    @property
+    def is_structured(self: 'ParsedQuery') -> bool:
+        """
+        True when the query has any part other than free text.
+        """
+        return bool(self.isbns or self.autores or self.titulos or self.categorias or self.frases)
+
+    def google_query(self: 'ParsedQuery') -> str:
+        """
+        Builds the Google Books query using its search operators.
+
+        Returns:
+            str: The query for the Google Books 'q' parameter.
+        """
+        if self.isbns:
+            return f'isbn:{self.isbns[0]}'
+        terms = [self.texto] if self.texto else []
+        terms += [f'"{frase}"' for frase in self.frases]
+        terms += [f'inauthor:"{autor}"' for autor in self.autores]
+        terms += [f'intitle:"{titulo}"' for titulo in self.titulos]
+        terms += [f'subject:"{categoria}"' for categoria in self.categorias]
+        return ' '.join(terms)
+
+    def plain_text(self: 'ParsedQuery') -> str:
+        """
+        Joins every part of the query as plain text, for providers without operators.
+
+        Returns:
+            str: The plain text query.
+        """
+        if self.isbns:
+            return self.isbns[0]
+        parts = self.titulos + self.autores + self.frases + self.categorias
+        return ' '.join(parts + ([self.texto] if self.texto else []))
+
+
+def parse_query(query: str) -> ParsedQuery:
+    """
+    Parses a search query. Recognizes ISBN-10/13, the 'autor:', 'titulo:' and
+    'categoria:' fields and quoted phrases; everything else is free text.
+
+    Args:
+        query (str): The search query.
+
+    Returns:
+        ParsedQuery: The parsed query.
+    """
+    parsed = ParsedQuery()
+
+    def take_field(match: re.Match) -> str:
+        field = FIELD_ALIASES.get(_strip_accents(match.group(1)).lower())
+        value = (match.group(2) if match.group(2) is not None else match.group(3)).strip()
+        if not field:
+            return match.group(0)
+        if value:
+            getattr(parsed, field).append(value)
+        return ' '
+
+    rest = FIELD_PATTERN.sub(take_field, query)
+
+    def take_phrase(match: re.Match) -> str:
+        parsed.frases.append(match.group(1).strip())
+        return ' '
+
+    rest = PHRASE_PATTERN.sub(take_phrase, rest)
+
+    words = []
+    for token in rest.split():
+        isbn = normalize_isbn(token)
+        if isbn:
+            parsed.isbns.append(isbn)
+        else:
+            words.append(token)
+    parsed.texto = ' '.join(words)
+
+    # A query that is only digits and hyphens may be an ISBN with spaces
+    if not parsed.isbns and parsed.texto and not parsed.is_structured:
+        isbn = normalize_isbn(parsed.texto.replace(' ', '-'))
+        if isbn:
+            parsed.isbns.append(isbn)
+            parsed.texto = ''
+    return parsed
@@ -2,170 +2,668 @@
 Recommendation service
 """
 # pylint: disable=E1101
-from pathlib                  import Path
-import pickle
+from collections                    import Counter, defaultdict
+from datetime                       import datetime, timezone
+from pathlib                        import Path
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing                         import NamedTuple
 import numpy as np
-import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing    import MinMaxScaler
-from django.core.cache        import cache
-from django.db.models         import Count, QuerySet
-from libros.models            import Libro
-from profiles.models          import InteresUsuario, Favorito, Recomendacion
+from scipy                          import sparse
+from sklearn.preprocessing          import MaxAbsScaler, normalize
+from django.conf                    import settings
+from django.core.cache              import cache
+from django.db                      import IntegrityError, transaction
+from django.db.models               import Avg, Count, F, QuerySet, Subquery
+from core.services.ann_index        import DEFAULT_BITS, DEFAULT_TABLES, HyperplaneLSH
+from core.services.fragment_cache   import CATALOG_VERSION, get_versions
+from core.services.similar_books    import CONTENIDO, similares
+from libros.models                  import Libro
+from profiles.models                import (InteresUsuario, Favorito, Recomendacion,
+                                            RecomendacionPrecalculada, VersionUsuario)
+
+
+DEFAULT_RELOAD_INTERVAL = 30
+MODEL_FORMAT            = 1
+MODEL_POINTER           = 'current'
+MODEL_MANIFEST          = 'manifest.json'
+MODEL_KEEP_VERSIONS     = 2
+DEFAULT_NEIGHBORS       = 10
+DEFAULT_EXACT_MAX_USERS = 20000
+SIMILARITY_BLOCK_SIZE   = 1024
+DEFAULT_PRECOMPUTE_TOP  = 50
+PRECOMPUTE_CHUNK_SIZE   = 1000
+USER_FEATURES_WEIGHT    = 0.7
+COLLAB_FEATURES_WEIGHT  = 0.3
+DEFAULT_NEIGHBOR_WEIGHT = 1.0
+DEFAULT_INTEREST_WEIGHT = 1.0
+
+
+def _model_path() -> Path:
+    return Path(getattr(settings, 'RECOMMENDATION_MODEL_PATH',
+                        Path(settings.BASE_DIR) / 'ml_models' / 'recommendation_model'))
+
+
+def _top_k(similarities: np.ndarray, k: int) -> tuple:
+    """
+    Gets the K best columns of every row of a similarity block, best first.
+    """
+    top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(similarities, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def top_k_neighbors(vectors, k: int, block_size: int = SIMILARITY_BLOCK_SIZE) -> tuple:
+    """
+    Gets the K most similar rows of every row by cosine similarity. The
+    similarities are computed one block of rows at a time, so memory is
+    O(block_size * N) while computing and O(N * K) for the result.
+
+    Args:
+        vectors: The row vectors, dense or sparse.
+        k (int): Neighbors per row; capped to N - 1.
+        block_size (int, optional): Rows per block. Defaults to 1024.
+
+    Returns:
+        tuple: (neighbors, scores), int32 and float32 arrays of shape (N, K)
+            holding the neighbor rows and their similarities.
+    """
+    n = vectors.shape[0]
+    k = max(min(k, n - 1), 0)
+    neighbors = np.empty((n, k), dtype=np.int32)
+    scores = np.empty((n, k), dtype=np.float32)
+    if k == 0:
+        return neighbors, scores
+    vectors = normalize(vectors)
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        block = vectors[start:stop] @ vectors.T
+        block = np.array(block.toarray() if hasattr(block, 'toarray') else block, dtype=np.float32)
+        # A user is never its own neighbor
+        block[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+        neighbors[start:stop], scores[start:stop] = _top_k(block, k)
+    return neighbors, scores
+
+
+def _triples(rows) -> tuple:
+    rows = list(rows)
+    if not rows:
+        return None
+    usuario_ids, categoria_ids, weights = zip(*rows)
+    return (np.array(usuario_ids, dtype=np.int64), np.array(categoria_ids, dtype=np.int64),
+            np.array(weights, dtype=np.float32))
+
+
+def feature_matrix(parts: list) -> tuple:
+    """
+    Builds the sparse user-category matrix from weighted sets of (user,
+    category, weight) triples. The triples of every set are scaled by its
+    weight and stacked into a single COO matrix, whose repeated entries are
+    added up on the conversion to CSR, so the matrix costs O(nnz) memory
+    however many users and categories there are.
+
+    Args:
+        parts (list): ((usuario_ids, categoria_ids, weights), weight) pairs.
+
+    Returns:
+        tuple: (matrix, user_ids, categoria_ids), the CSR matrix and the
+            sorted user and category IDs of its rows and columns.
+    """
+    usuarios = np.concatenate([triples[0] for triples, _ in parts])
+    categorias = np.concatenate([triples[1] for triples, _ in parts])
+    pesos = np.concatenate([triples[2] * weight for triples, weight in parts])
+    user_ids, rows = np.unique(usuarios, return_inverse=True)
+    categoria_ids, cols = np.unique(categorias, return_inverse=True)
+    matrix = sparse.coo_matrix(
+        (pesos.astype(np.float32), (rows, cols)), shape=(len(user_ids), len(categoria_ids)))
+    return matrix.tocsr(), user_ids, categoria_ids
+
+
+class TrainedModel(NamedTuple):
+    """
+    Snapshot of a trained model. Loaded from disk, its arrays are read-only
+    memory maps of the model files. The neighbors recomputed for the users
+    whose data changed after the training are kept in changed, by user ID,
+    as (user version, neighbor IDs). trained_at is in nanoseconds since the
+    epoch, like the user versions.
+    """
+    neighbors: np.ndarray
+    scores: np.ndarray
+    user_ids: np.ndarray
+    rows: dict
+    index: HyperplaneLSH
+    categoria_ids: np.ndarray
+    scale: np.ndarray
+    trained_at: int
+    changed: dict
+
+
+def get_user_versions(*user_ids: int) -> list:
+    """
+    Gets the data version of some users with a single query. The version of
+    a user is the time their favorites or interests last changed, in
+    nanoseconds, so it can be compared with the training time.
+
+    Args:
+        *user_ids (int): The user IDs.
+
+    Returns:
+        list: The versions, in the same order; 0 for unchanged users.
+    """
+    found = dict(VersionUsuario.objects.filter(usuario_id__in=user_ids).values_list(
+        'usuario_id', 'version'))
+    return [found.get(user_id, 0) for user_id in user_ids]
+
+
+def _books_in_order(libro_ids: list) -> list:
+    """
+    Loads some books keeping the order of their IDs, which Libro's default
+    ordering would otherwise replace.
+    """
+    libros = Libro.objects.select_related('categoria').in_bulk(libro_ids)
+    return [libros[libro_id] for libro_id in libro_ids if libro_id in libros]
+
+
+def bump_user_version(user_id: int) -> None:
+    """
+    Marks the data of a user as changed. Their recommendations, and those
+    of every user who has them as neighbor, are no longer read from cache.
+
+    Args:
+        user_id (int): The user ID.
+    """
+    version = time.time_ns()
+    if VersionUsuario.objects.filter(usuario_id=user_id).update(version=version):
+        return
+    try:
+        with transaction.atomic():
+            VersionUsuario.objects.create(usuario_id=user_id, version=version)
+    except IntegrityError:
+        # Another change of the user created the row in between
+        VersionUsuario.objects.filter(usuario_id=user_id).update(version=version)
+
+
+class BookCategoryIndex:
+    """
+    The category of every book as numpy arrays, so the categories of many
+    books are looked up at once: the sorted book IDs, and the category of
+    each one as a code into the sorted category IDs. Books without a
+    category get the extra last code. It is reloaded when the catalog
+    version changes, or when asked about a book it does not know, e.g.
+    after the version key was evicted from the cache.
+    """
+    def __init__(self: 'BookCategoryIndex') -> None:
+        # (libro_ids, codes, categoria_ids) is swapped as a whole
+        self._data = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32),
+                      np.empty(0, dtype=np.int64))
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _known(self: 'BookCategoryIndex', libro_ids: np.ndarray) -> tuple:
+        all_ids = self._data[0]
+        positions = np.searchsorted(all_ids, libro_ids)
+        found = positions < len(all_ids)
+        found[found] = all_ids[positions[found]] == libro_ids[found]
+        return positions, found
+
+    def refresh(self: 'BookCategoryIndex', libro_ids: np.ndarray = None) -> None:
+        """
+        Reloads the index if the catalog changed since it was loaded.
+
+        Args:
+            libro_ids (np.ndarray, optional): Books about to be looked up;
+                the index is also reloaded if one of them is missing.
+        """
+        version, = get_versions(CATALOG_VERSION)
+        if version == self._version and (libro_ids is None or self._known(libro_ids)[1].all()):
+            return
+        with self._lock:
+            filas = Libro.objects.order_by('id').values_list('id', 'categoria_id')
+            libros = np.fromiter(
+                ((libro_id, -1 if categoria_id is None else categoria_id)
+                 for libro_id, categoria_id in filas.iterator(chunk_size=5000)),
+                dtype=np.dtype((np.int64, 2))).reshape(-1, 2)
+            libro_ids, categorias = libros[:, 0], libros[:, 1]
+            categoria_ids, codes = np.unique(categorias[categorias >= 0], return_inverse=True)
+            book_codes = np.full(len(libro_ids), len(categoria_ids), dtype=np.int32)
+            book_codes[categorias >= 0] = codes
+            self._data = (libro_ids, book_codes, categoria_ids)
+            self._version = version
+
+    def interest_boost(self: 'BookCategoryIndex', libro_ids: np.ndarray, intereses: dict) -> np.ndarray:
+        """
+        Gets the interest level of a user in the category of every book.
+
+        Args:
+            libro_ids (np.ndarray): The book IDs.
+            intereses (dict): The interest level of the user by category ID.
+
+        Returns:
+            np.ndarray: A float32 array; 0 for books in other categories and
+                for books the index does not know yet.
+        """
+        _, book_codes, categoria_ids = self._data
+        # The interest vector: one weight per category code, plus the code
+        # of the books without a category
+        weights = np.zeros(len(categoria_ids) + 1, dtype=np.float32)
+        for categoria_id, nivel in intereses.items():
+            col = np.searchsorted(categoria_ids, categoria_id)
+            if col < len(categoria_ids) and categoria_ids[col] == categoria_id:
+                weights[col] = nivel
+
+        positions, found = self._known(np.asarray(libro_ids, dtype=np.int64))
+        codes = np.full(len(libro_ids), len(categoria_ids), dtype=np.int32)
+        codes[found] = book_codes[positions[found]]
+        return weights[codes]
+
+
+_book_categories = BookCategoryIndex()
+
+
+def rank_books(libro_ids: np.ndarray, counts: np.ndarray, intereses: dict, top_n: int) -> tuple:
+    """
+    Ranks the candidate books of a user: the number of neighbors who like
+    each book, blended with the interest of the user in its category. The
+    weights of both come from RECOMMENDATION_NEIGHBOR_WEIGHT and
+    RECOMMENDATION_INTEREST_WEIGHT.
+
+    Args:
+        libro_ids (np.ndarray): The candidate book IDs.
+        counts (np.ndarray): How many neighbors favorited each candidate.
+        intereses (dict): The interest level of the user by category ID.
+        top_n (int): The number of books to return.
+
+    Returns:
+        tuple: (libro_ids, scores) of the best books, best first; ties go
+            to the lower book ID.
+    """
+    libro_ids = np.asarray(libro_ids, dtype=np.int64)
+    top_n = min(top_n, len(libro_ids))
+    if top_n <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    scores = getattr(settings, 'RECOMMENDATION_NEIGHBOR_WEIGHT', DEFAULT_NEIGHBOR_WEIGHT) * \
+        np.asarray(counts, dtype=np.float32)
+    if intereses:
+        _book_categories.refresh(libro_ids)
+        scores += getattr(settings, 'RECOMMENDATION_INTEREST_WEIGHT', DEFAULT_INTEREST_WEIGHT) * \
+            _book_categories.interest_boost(libro_ids, intereses)
+    top = np.argpartition(-scores, top_n - 1)[:top_n]
+    top = top[np.lexsort((libro_ids[top], -scores[top]))]
+    return libro_ids[top], scores[top]
+
+
+def build_index(vectors) -> HyperplaneLSH:
+    """
+    Builds the nearest neighbor index of the user vectors, with the number
+    of tables and bits from RECOMMENDATION_LSH_TABLES and RECOMMENDATION_LSH_BITS.
+    """
+    return HyperplaneLSH(
+        vectors,
+        n_tables = getattr(settings, 'RECOMMENDATION_LSH_TABLES', DEFAULT_TABLES),
+        n_bits   = getattr(settings, 'RECOMMENDATION_LSH_BITS', DEFAULT_BITS),
+    )
 
 
 class RecomendationEngine:
     """
-    Recommendation
+    Recommendation engine based on the similarity between users.
+
+    The trained model keeps the top-K most similar users of every user, as
+    (N, K) arrays of neighbor rows and scores, and a hyperplane LSH index of
+    the user vectors, so users who signed up after the training still get
+    neighbors. It is held as one immutable TrainedModel snapshot that is
+    swapped as a whole, so the process-wide engine can be shared between
+    threads and reloaded while requests are being served.
+
+    On disk, every trained model is a directory of .npy arrays with a JSON
+    manifest, inside RECOMMENDATION_MODEL_PATH. A 'current' file names the
+    directory in use. The arrays are memory-mapped, so the processes serving
+    the same model share one copy of it through the page cache.
     """
     def __init__(self):
-        self.user_similarity_matrix = None
-        self.user_ids = None
-        self.model_path = Path('ml_models/recommendation_model.pkl')
+        self.model_path = _model_path()
+        self._model = None
+        self._version = None
+        self.last_checked = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def neighbors(self: 'RecomendationEngine') -> np.ndarray:
+        """
+        The rows of the most similar users of every user, best first.
+        """
+        return self._model[0] if self._model else None
 
+    @property
+    def neighbor_scores(self: 'RecomendationEngine') -> np.ndarray:
+        """
+        The similarity of every stored neighbor.
+        """
+        return self._model[1] if self._model else None
 
-    def prepare_user_features(self: 'RecomendationEngine') -> pd.DataFrame:
+    @property
+    def user_ids(self: 'RecomendationEngine') -> np.ndarray:
         """
-        Get and prepare the user features to train the model based in this cols.
+        The user ID of every row, None before a model is loaded.
+        """
+        return self._model[2] if self._model else None
 
-        Returns:
-            pd.DataFrame: The dataframe with the user features.
+    @property
+    def index(self: 'RecomendationEngine') -> HyperplaneLSH:
         """
-        intereses    = InteresUsuario.objects.select_related('usuario', 'categoria').all()
-        df_intereses = pd.DataFrame(
-            list(intereses.values('usuario_id', 'categoria_id', 'nivel_interes')))
-        favoritos = Favorito.objects.select_related('libro__categoria').values(
-            'usuario_id', 'libro__categoria_id'
-        ).annotate(count=Count('id'))
-        df_favoritos = pd.DataFrame(list(favoritos))
+        The nearest neighbor index of the user vectors.
+        """
+        return self._model.index if self._model else None
 
-        if not df_favoritos.empty:
-            df_favoritos.columns = ['usuario_id', 'categoria_id', 'peso']
-            df_favoritos['peso'] = df_favoritos['peso'] * 5
+    def _set_model(self: 'RecomendationEngine', neighbors: np.ndarray, scores: np.ndarray,
+                   user_ids: np.ndarray, index: HyperplaneLSH, categoria_ids: np.ndarray,
+                   scale: np.ndarray, trained_at: int) -> None:
+        rows = {user_id: row for row, user_id in enumerate(user_ids.tolist())}
+        self._model = TrainedModel(
+            neighbors, scores, user_ids, rows, index, categoria_ids, scale, trained_at, {})
 
-        if df_intereses.empty and df_favoritos.empty:
+    def _current_version(self: 'RecomendationEngine') -> str:
+        """
+        Gets the name of the model directory in use, None if there is none.
+        """
+        try:
+            return (self.model_path / MODEL_POINTER).read_text(encoding='utf-8').strip() or None
+        except OSError:
             return None
 
-        if df_intereses.empty:
-            df_combined = df_favoritos
-            feature_col = 'peso'
-        elif df_favoritos.empty:
-            df_combined = df_intereses
-            feature_col = 'nivel_interes'
-        else:
-            df_intereses.rename(columns={'nivel_interes': 'valor'}, inplace=True)
-            df_favoritos.rename(columns={'peso': 'valor'}, inplace=True)
-            df_combined = pd.concat([df_intereses, df_favoritos])
-            feature_col = 'valor'
-
-        user_features = df_combined.pivot_table(
-            index      = 'usuario_id',
-            columns    = 'categoria_id',
-            values     = feature_col,
-            aggfunc    = 'sum',
-            fill_value = 0
-        )
-        return user_features
+    def reload_if_changed(self: 'RecomendationEngine', force: bool = False) -> bool:
+        """
+        Loads the model again if a new one was saved since it was loaded. The
+        pointer file is checked at most every RECOMMENDATION_RELOAD_INTERVAL
+        seconds.
+
+        Args:
+            force (bool, optional): Check even if the last check was recent.
+
+        Returns:
+            bool: True if a new model was loaded.
+        """
+        interval = getattr(settings, 'RECOMMENDATION_RELOAD_INTERVAL', DEFAULT_RELOAD_INTERVAL)
+        if not force and time.monotonic() - self.last_checked < interval:
+            return False
+        with self._lock:
+            self.last_checked = time.monotonic()
+            version = self._current_version()
+            if version is None or version == self._version:
+                return False
+            try:
+                return self._load_model(version)
+            except (OSError, KeyError, ValueError) as e:
+                # Keep serving the current model until the new one is readable
+                print(f"Error loading the recommendation model: {e}")
+                return False
+
+
+    def prepare_user_features(self: 'RecomendationEngine', user_id: int = None) -> tuple:
+        """
+        Gets the user features as (user, category, weight) triples: every
+        interest level, plus five points per favorite book of the category.
+        Repeated pairs are added up when the matrix is built.
 
+        Args:
+            user_id (int, optional): Only get the features of this user.
 
-    def prepare_collaborative_features(self: 'RecomendationEngine') -> pd.DataFrame:
+        Returns:
+            tuple: (usuario_ids, categoria_ids, weights) arrays, None if
+                there are no interests nor favorites.
+        """
+        intereses = InteresUsuario.objects.all()
+        favoritos = Favorito.objects.filter(libro__categoria__isnull=False)
+        if user_id is not None:
+            intereses = intereses.filter(usuario_id=user_id)
+            favoritos = favoritos.filter(usuario_id=user_id)
+        intereses = intereses.values_list('usuario_id', 'categoria_id', 'nivel_interes')
+        favoritos = favoritos.values_list(
+            'usuario_id', 'libro__categoria_id').annotate(peso=Count('id') * 5).order_by()
+        return _triples(list(intereses) + list(favoritos))
+
+
+    def prepare_collaborative_features(self: 'RecomendationEngine', user_id: int = None) -> tuple:
         """
-        Prepare the collaborative features for the categories and recomendations
+        Gets the collaborative features as (user, category, weight) triples,
+        the mean rating each user gave to the recommendations of a category.
+
+        Args:
+            user_id (int, optional): Only get the features of this user.
 
         Returns:
-            pd.DataFrame: The dataframe with the collaborative features.
+            tuple: (usuario_ids, categoria_ids, weights) arrays, None if
+                there are no rated recommendations.
         """
-        recomendaciones = Recomendacion.objects.select_related(
-            'libro').values('usuario_id', 'libro__categoria_id', 'calificacion_recomendacion')
-        df = pd.DataFrame(list(recomendaciones))
-        if df.empty:
-            return None
-        collab_features = df.pivot_table(
-            index = 'usuario_id',
-            columns="libro__categoria_id",
-            values="calificacion_recomendacion",
-            aggfunc='mean',
-            fill_value=0
-        )
-        return collab_features
+        recomendaciones = Recomendacion.objects.filter(libro__categoria__isnull=False)
+        if user_id is not None:
+            recomendaciones = recomendaciones.filter(usuario_id=user_id)
+        recomendaciones = recomendaciones.values_list(
+            'usuario_id', 'libro__categoria_id').annotate(
+            media=Avg('calificacion_recomendacion')).order_by()
+        return _triples(recomendaciones)
+
+
+    def _feature_parts(self: 'RecomendationEngine', user_id: int = None) -> list:
+        user_features = self.prepare_user_features(user_id)
+        collab_features = self.prepare_collaborative_features(user_id)
+        if user_features is not None and collab_features is not None:
+            return [(user_features, USER_FEATURES_WEIGHT), (collab_features, COLLAB_FEATURES_WEIGHT)]
+        return [(features, 1.0) for features in (user_features, collab_features)
+                if features is not None]
 
 
     def train(self: 'RecomendationEngine') -> 'RecomendationEngine':
         """
-        Method to train the model with the features previously loaded.
+        Method to train the model with the features previously loaded. The
+        neighbors are exact up to RECOMMENDATION_EXACT_MAX_USERS users, and
+        are read from the LSH index above that.
 
         Args:
-            self (RecomendationEngine): The recommendation engine object. 
+            self (RecomendationEngine): The recommendation engine object.
 
         Returns:
             RecomendationEngine: The trained recommendation engine object.
         """
-        user_features = self.prepare_user_features()
-        collab_features = self.prepare_collaborative_features()
-        if user_features is not None and collab_features is not None:
-            all_cols = sorted(set(user_features.columns) | set(collab_features.columns))
-            user_features = user_features.reindex(columns=all_cols, fill_value=0)
-            collab_features = collab_features.reindex(columns=all_cols, fill_value=0)
-            all_users = sorted(set(user_features.index) | set(collab_features.index))
-            user_features = user_features.reindex(index=all_users, fill_value=0)
-            collab_features = collab_features.reindex(index=all_users, fill_value=0)
-            combined = user_features * 0.7 + collab_features * 0.3
-        elif user_features is not None:
-            combined = user_features
-        else:
-            combined = collab_features
-        
-        if combined is None or getattr(combined, 'empty', True):
+        trained_at = time.time_ns()
+        parts = self._feature_parts()
+        if not parts:
             raise ValueError("Not enough data to train the recommendation model.")
 
-        combined = combined.fillna(0)
-        scaler = MinMaxScaler()
-        normalized = scaler.fit_transform(combined)
+        features, user_ids, categoria_ids = feature_matrix(parts)
+        scaler = MaxAbsScaler().fit(features)
+        index = build_index(scaler.transform(features))
 
-        self.user_similarity_matrix = cosine_similarity(normalized)
-        self.user_ids = combined.index.tolist()
+        k = getattr(settings, 'RECOMMENDATION_NEIGHBORS', DEFAULT_NEIGHBORS)
+        exact_max = getattr(settings, 'RECOMMENDATION_EXACT_MAX_USERS', DEFAULT_EXACT_MAX_USERS)
+        if len(user_ids) <= exact_max:
+            neighbors, scores = top_k_neighbors(index.vectors, k)
+        else:
+            neighbors, scores = index.top_k_neighbors(min(k, len(user_ids) - 1))
+        self._set_model(neighbors, scores, user_ids, index, categoria_ids.astype(np.int64),
+                        scaler.scale_.astype(np.float32), trained_at)
         self._save_model()
         return self
 
 
+    def user_vector(self: 'RecomendationEngine', user_id: int, model: TrainedModel = None) -> np.ndarray:
+        """
+        Computes the feature vector of a user from the current data, in the
+        columns and scale of the trained model. Categories created after the
+        training are ignored.
+
+        Args:
+            user_id (int): The user ID.
+            model (TrainedModel, optional): The model snapshot. Defaults to
+                the current one.
+
+        Returns:
+            np.ndarray: The dense vector, None if the model has no feature
+                columns stored.
+        """
+        model = model or self._model
+        if model is None or model.categoria_ids is None:
+            return None
+        vector = np.zeros(len(model.categoria_ids), dtype=np.float32)
+        for (_, categorias, pesos), weight in self._feature_parts(user_id):
+            cols = np.minimum(np.searchsorted(model.categoria_ids, categorias), len(vector) - 1)
+            known = model.categoria_ids[cols] == categorias
+            np.add.at(vector, cols[known], pesos[known] * weight)
+        return vector / model.scale
+
+
+    def _similar_user_ids(self: 'RecomendationEngine', model: TrainedModel, user_id: int,
+                          version: int = 0) -> list:
+        """
+        Gets the neighbors of a user. They are the trained ones, unless the
+        user changed after the training or the model has not seen them; then
+        they are found in the index for the current vector of the user, once
+        per version.
+        """
+        row = model.rows.get(user_id)
+        if row is not None and version <= model.trained_at:
+            similar = model.neighbors[row]
+            return model.user_ids[similar[similar >= 0]].tolist()
+
+        changed = model.changed.get(user_id)
+        if changed is not None and changed[0] == version:
+            return changed[1]
+        similar, _ = model.index.query(
+            self.user_vector(user_id, model), model.neighbors.shape[1], exclude=row)
+        similar_user_ids = model.user_ids[similar].tolist()
+        model.changed[user_id] = (version, similar_user_ids)
+        return similar_user_ids
+
+
+    def user_changed(self: 'RecomendationEngine', user_id: int) -> None:
+        """
+        Called when the favorites or interests of a user change. The model
+        is not retrained: the neighbors of the user are recomputed from the
+        user's new vector on their next request, and the cached
+        recommendations of the users who have them as neighbor are dropped,
+        as their cache keys include the versions of their neighbors. The
+        version is stored in the database, so this holds in every process,
+        including precompute_recommendations, whatever the cache backend.
+        The stored vector of the user, which other users are compared to, is
+        only updated by the next training.
+
+        Args:
+            user_id (int): The user ID.
+        """
+        bump_user_version(user_id)
+
+
     def _save_model(self: 'RecomendationEngine') -> None:
         """
-        Method to save the model into a file.
+        Method to save the model into a new directory and point 'current' to
+        it. The directory is written under a temporary name and renamed, and
+        the pointer is replaced in one rename too, so a reloading process
+        never sees a partial model. The previous version is kept for the
+        processes still mapping it; older ones are deleted.
 
         Args:
             self (RecomendationEngine): The recommendation engine object.
         """
-        parent = self.model_path.parent
-        parent.mkdir(exist_ok=True, parents=True)
-        if self.model_path.exists() and self.model_path.is_dir():
-            raise PermissionError("Cannot save model: path is a directory.")
-        with open(self.model_path, 'wb') as f:
-            pickle.dump({
-                'similarity_matrix': self.user_similarity_matrix,
-                'user_ids': self.user_ids
-            }, f)
+        root = self.model_path
+        if root.exists() and not root.is_dir():
+            raise PermissionError("Cannot save model: path is not a directory.")
+        root.mkdir(exist_ok=True, parents=True)
+
+        model = self._model
+        features = model.index.vectors
+        arrays = {
+            'neighbors': model.neighbors.astype(np.int32),
+            'scores': model.scores.astype(np.float32),
+            'user_ids': model.user_ids,
+            'categoria_ids': model.categoria_ids,
+            'scale': model.scale.astype(np.float32),
+            'features_data': features.data.astype(np.float32),
+            'features_indices': features.indices.astype(np.int32),
+            'features_indptr': features.indptr.astype(np.int32),
+            **{f'lsh_{name}': array for name, array in model.index.to_arrays().items()},
+        }
+        trained_at = datetime.fromtimestamp(model.trained_at / 1e9, tz=timezone.utc)
+        version = f'{trained_at:%Y%m%dT%H%M%S%f}'
+        manifest = {
+            'format': MODEL_FORMAT,
+            'version': version,
+            'trained_at': trained_at.isoformat(),
+            'shape': list(features.shape),
+            'neighbors': model.neighbors.shape[1],
+            'arrays': {name: str(array.dtype) for name, array in arrays.items()},
+        }
+
+        temp_dir = Path(tempfile.mkdtemp(prefix='.tmp-', dir=root))
+        try:
+            for name, array in arrays.items():
+                np.save(temp_dir / f'{name}.npy', array)
+            (temp_dir / MODEL_MANIFEST).write_text(json.dumps(manifest, indent=2), encoding='utf-8')
+            os.replace(temp_dir, root / version)
+        except BaseException:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+        pointer = root / f'.{MODEL_POINTER}-{version}'
+        pointer.write_text(version, encoding='utf-8')
+        os.replace(pointer, root / MODEL_POINTER)
+        self._version = version
+        self._remove_old_versions(version)
+
+
+    def _remove_old_versions(self: 'RecomendationEngine', version: str) -> None:
+        versions = sorted(
+            path.name for path in self.model_path.iterdir()
+            if path.is_dir() and (path / MODEL_MANIFEST).exists() and path.name <= version
+        )
+        for name in versions[:-MODEL_KEEP_VERSIONS]:
+            # Files still mapped by another process cannot be deleted everywhere
+            shutil.rmtree(self.model_path / name, ignore_errors=True)
 
 
-    def _load_model(self: 'RecomendationEngine') -> bool:
+    def _load_model(self: 'RecomendationEngine', version: str = None) -> bool:
         """
-        Method to load the existing model.
+        Method to load a saved model, memory-mapping its arrays.
 
         Args:
             self (RecomendationEngine): The recomendation engine object.
+            version (str, optional): The model directory. Defaults to the
+                one 'current' points to.
 
         Returns:
             bool: True if exists and was loaded. False otherwise
         """
-        if self.model_path.exists() and self.model_path.is_file():
-            with open(self.model_path, 'rb') as f:
-                data = pickle.load(f)
-                self.user_similarity_matrix = data['similarity_matrix']
-                self.user_ids = data['user_ids']
-            return True
-        return False
+        version = version or self._current_version()
+        if version is None:
+            return False
+        directory = self.model_path / version
+        manifest = json.loads((directory / MODEL_MANIFEST).read_text(encoding='utf-8'))
+        if manifest.get('format') != MODEL_FORMAT:
+            raise ValueError(f"Unsupported model format: {manifest.get('format')}")
+        arrays = {
+            name: np.load(directory / f'{name}.npy', mmap_mode='r') for name in manifest['arrays']
+        }
+        features = sparse.csr_matrix(
+            (arrays['features_data'], arrays['features_indices'], arrays['features_indptr']),
+            shape=tuple(manifest['shape']), copy=False)
+        index = HyperplaneLSH(
+            features,
+            planes = arrays['lsh_planes'],
+            codes  = arrays['lsh_codes'],
+            order  = arrays['lsh_order'],
+        )
+        trained_at = datetime.fromisoformat(manifest['trained_at'])
+        self._set_model(arrays['neighbors'], arrays['scores'], arrays['user_ids'], index,
+                        arrays['categoria_ids'], arrays['scale'], int(trained_at.timestamp() * 1e9))
+        self._version = version
+        return True
 
 
-    def get_recommendations(self: 'RecomendationEngine', user_id: int, top_n: int = 10) -> QuerySet:
+    def get_recommendations(self: 'RecomendationEngine', user_id: int, top_n: int = 10) -> list:
         """
         Method to get the recommendations for a specific user.
 
@@ -175,42 +673,145 @@ class RecomendationEngine:
             top_n (int, optional): The number of recommendations to return. Defaults to 10.
 
         Returns:
-            QuerySet: A queryset containing the recommended books.
+            list: The recommended books, best first.
         """
-        cache_key = f'recommendations_user_{user_id}_top_{top_n}'
+        precalculadas = self._precomputed_recommendations(user_id, top_n)
+        if precalculadas is not None:
+            return precalculadas
+
+        version, = get_user_versions(user_id)
+        self.reload_if_changed()
+        model = self._model
+        if model is None:
+            return list(self._cold_start_recommendations(user_id, top_n))
+        similar_user_ids = self._similar_user_ids(model, user_id, version)
+        if not similar_user_ids: # No data about the user
+            return list(self._cold_start_recommendations(user_id, top_n))
+
+        versions  = [self._version, version] + get_user_versions(*similar_user_ids)
+        digest    = hashlib.md5(':'.join(map(str, versions)).encode('utf-8')).hexdigest()
+        cache_key = f'recommendations_user_{user_id}_top_{top_n}_{digest}'
         cached    = cache.get(cache_key)
         if cached:
-            return Libro.objects.filter(id__in=cached)
-
-        if self.user_similarity_matrix is None:
-            if not self._load_model(): # Initial
-                return self._cold_start_recommendations(user_id, top_n)
-
-        if user_id not in self.user_ids: # If not exists the user
-            return self._cold_start_recommendations(user_id, top_n)
-
-        user_idx = self.user_ids.index(user_id)
-        similarities = self.user_similarity_matrix[user_idx]
-        similar_users_idx = np.argsort(similarities)[::-1][1:11]
-        similar_user_ids = [self.user_ids[idx] for idx in similar_users_idx]
-
-        recommended_books = Favorito.objects.filter(
-            usuario_id__in=similar_user_ids
-        ).values('libro_id').annotate(
-            score=Count('libro_id')
-        ).order_by('-score')
+            return _books_in_order(cached)
 
         user_favorites = Favorito.objects.filter(
             usuario_id=user_id
         ).values_list('libro_id', flat=True)
-        recommended_books = recommended_books.exclude(
+        candidatos = list(Favorito.objects.filter(
+            usuario_id__in=similar_user_ids
+        ).exclude(
             libro_id__in=user_favorites
-        )
-        recommended_books = self._boost_by_interests(user_id, recommended_books)
+        ).values('libro_id').annotate(
+            score=Count('libro_id')
+        ).order_by().values_list('libro_id', 'score'))
+        intereses = dict(InteresUsuario.objects.filter(
+            usuario_id=user_id
+        ).values_list('categoria_id', 'nivel_interes'))
 
-        libro_ids = [item['libro_id'] for item in recommended_books[:top_n]]
+        libro_ids, _ = rank_books(
+            [libro_id for libro_id, _ in candidatos], [score for _, score in candidatos],
+            intereses, top_n)
+        libro_ids = libro_ids.tolist()
         cache.set(cache_key, libro_ids, timeout=3600)
-        return Libro.objects.filter(id__in=libro_ids)
+        return _books_in_order(libro_ids)
+
+
+    def _precomputed_recommendations(self: 'RecomendationEngine', user_id: int, top_n: int) -> list:
+        """
+        Reads the precomputed recommendations of a user, and the version of
+        the user they are compared with, with one index scan.
+        Only the version of the user is checked: new favorites of their
+        neighbors show up at the next precompute run, not before, since
+        finding the neighbors would mean loading the model.
+
+        Args:
+            self (RecomendationEngine): The recomendation engine object.
+            user_id (int): The user ID.
+            top_n (int): The number of recommendations to return.
+
+        Returns:
+            list: The recommended books, None if there is no list for the
+                user, it is shorter than requested or the user changed after
+                it was computed.
+        """
+        if top_n > getattr(settings, 'RECOMMENDATION_PRECOMPUTE_TOP_N', DEFAULT_PRECOMPUTE_TOP):
+            return None
+        libros = list(Libro.objects.select_related('categoria').filter(
+            recomendaciones_precalculadas__usuario_id=user_id,
+            recomendaciones_precalculadas__posicion__lt=top_n
+        ).annotate(
+            fecha_calculo=F('recomendaciones_precalculadas__fecha_calculo'),
+            version_usuario=Subquery(VersionUsuario.objects.filter(
+                usuario_id=user_id).values('version')[:1])
+        ).order_by('recomendaciones_precalculadas__posicion'))
+        if len(libros) < top_n:
+            return None
+        if libros[0].fecha_calculo.timestamp() * 1e9 < (libros[0].version_usuario or 0):
+            return None
+        return libros
+
+
+    def precompute(self: 'RecomendationEngine', top_n: int = None,
+                   chunk_size: int = PRECOMPUTE_CHUNK_SIZE) -> int:
+        """
+        Computes the top-N recommendations of every user of the model and
+        stores them in RecomendacionPrecalculada. Users are processed in
+        chunks; each chunk reads the favorites of its users and of their
+        neighbors only, so memory does not grow with the number of users.
+        The lists of users who are no longer in the model are deleted.
+
+        Args:
+            self (RecomendationEngine): The recomendation engine object.
+            top_n (int, optional): Books per user. Defaults to
+                RECOMMENDATION_PRECOMPUTE_TOP_N.
+            chunk_size (int, optional): Users per chunk. Defaults to 1000.
+
+        Returns:
+            int: The number of users with a stored list.
+        """
+        self.reload_if_changed(force=True)
+        model = self._model
+        if model is None:
+            raise ValueError("There is no trained recommendation model to precompute from.")
+        top_n = top_n or getattr(settings, 'RECOMMENDATION_PRECOMPUTE_TOP_N', DEFAULT_PRECOMPUTE_TOP)
+        fecha_calculo = datetime.now(timezone.utc)
+        total = 0
+        for start in range(0, len(model.user_ids), chunk_size):
+            user_ids = model.user_ids[start:start + chunk_size].tolist()
+            vecinos = {
+                user_id: self._similar_user_ids(model, user_id, version)
+                for user_id, version in zip(user_ids, get_user_versions(*user_ids))
+            }
+            favoritos = defaultdict(list)
+            lectores = set(user_ids).union(*vecinos.values())
+            for usuario_id, libro_id in Favorito.objects.filter(usuario_id__in=lectores).values_list(
+                    'usuario_id', 'libro_id').iterator(chunk_size=5000):
+                favoritos[usuario_id].append(libro_id)
+            intereses = defaultdict(dict)
+            for usuario_id, categoria_id, nivel in InteresUsuario.objects.filter(
+                    usuario_id__in=user_ids).values_list('usuario_id', 'categoria_id', 'nivel_interes'):
+                intereses[usuario_id][categoria_id] = nivel
+
+            filas = []
+            for user_id in user_ids:
+                counts = Counter(
+                    libro_id for vecino in vecinos[user_id] for libro_id in favoritos[vecino])
+                for libro_id in favoritos[user_id]:
+                    counts.pop(libro_id, None)
+                libro_ids, scores = rank_books(
+                    list(counts.keys()), list(counts.values()), intereses[user_id], top_n)
+                filas.extend(
+                    RecomendacionPrecalculada(usuario_id=user_id, libro_id=libro_id, posicion=posicion,
+                                              puntuacion=score, fecha_calculo=fecha_calculo)
+                    for posicion, (libro_id, score) in enumerate(zip(libro_ids.tolist(), scores.tolist()))
+                )
+            with transaction.atomic():
+                RecomendacionPrecalculada.objects.filter(usuario_id__in=user_ids).delete()
+                RecomendacionPrecalculada.objects.bulk_create(filas, batch_size=1000)
+            total += len({fila.usuario_id for fila in filas})
+        RecomendacionPrecalculada.objects.filter(fecha_calculo__lt=fecha_calculo).delete()
+        return total
 
 
     def _cold_start_recommendations(self: 'RecomendationEngine',
@@ -236,20 +837,27 @@ class RecomendationEngine:
                 disponible=True
             ).exclude(
                 favoritos__usuario_id=user_id
-            ).order_by('-calification')[:top_n]
+            ).order_by('-calificacion')[:top_n]
             if libros.exists():
                 return libros
+        tendencia = Libro.objects.filter(
+            disponible=True,
+            tendencia__isnull=False
+        ).order_by('-tendencia__puntuacion')[:top_n]
+        if tendencia.exists():
+            return tendencia
         populares = Libro.objects.filter(
             disponible=True
-        ).annotate(
-            num_favoritos=Count('favoritos')
-        ).order_by('-num_favoritos', '-calificacion')[:top_n]
+        ).order_by('-total_favoritos', '-calificacion')[:top_n]
         return populares
 
 
     def get_similar_books(self: 'RecomendationEngine', libro_id: int, top_n: int = 6):
         """
-        Method to get books that are related to others.
+        Method to get books that are related to others: the stored
+        co-favorite list of the book, completed with its content-based list
+        when few users favorited it, or books of its category when it has
+        neither.
 
         Args:
             self (RecomendationEngine): The recommendation engine object.
@@ -259,33 +867,36 @@ class RecomendationEngine:
         Returns:
             QuerySet: A queryset containing the similar books.
         """
+        libros = similares(libro_id, top_n)
+        if len(libros) < top_n:
+            vistos = {libro.id for libro in libros}
+            libros += [
+                libro for libro in similares(libro_id, top_n, CONTENIDO) if libro.id not in vistos
+            ][:top_n - len(libros)]
+        if libros:
+            return libros
         try:
             libro = Libro.objects.get(id=libro_id)
         except Libro.DoesNotExist:
             return Libro.objects.none()
-        similares = Libro.objects.filter(
+        return Libro.objects.filter(
             categoria=libro.categoria,
             disponible=True
         ).exclude(
             id=libro_id
-        ).annotate(
-            num_favoritos=Count('favoritos')
-        ).order_by('-calificacion', '-num_favoritos')[:top_n]
-        return similares
+        ).order_by('-calificacion', '-total_favoritos')[:top_n]
 
-    def _boost_by_interests(self: 'RecomendationEngine', user_id: int, queryset: QuerySet) -> list:
-        interests = InteresUsuario.objects.filter(
-            usuario_id=user_id
-        ).values('categoria_id', 'nivel_interes')
-
-        if not interests:
-            return queryset
-        boost_map = {i['categoria_id']: i['nivel_interes'] for i in interests}
-        results= list(queryset)
-
-        for item in results:
-            libro = Libro.objects.get(id=item['libro_id'])
-            if libro.categoria_id in boost_map:
-                item['score'] += boost_map[libro.categoria_id]
-        results.sort(key=lambda x: x['score'], reverse=True)
-        return results
+
+_engine = RecomendationEngine()
+
+
+def get_engine() -> RecomendationEngine:
+    """
+    Gets the process-wide recommendation engine, reloading the model if the
+    file changed since the last check.
+
+    Returns:
+        RecomendationEngine: The shared engine.
+    """
+    _engine.reload_if_changed()
+    return _engine
@@ -0,0 +1,198 @@
+"""
+Buffered search query log and popularity tables.
+"""
+# pylint: disable=E1101
+import atexit
+import logging
+import threading
+import time
+from collections       import Counter
+from django.core.cache import cache
+from django.db         import IntegrityError, connection, transaction
+from django.db.models  import F
+from django.utils      import timezone
+from libros.models     import BusquedaRegistro, BusquedaPopular
+
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SIZE     = 50
+FLUSH_INTERVAL = 30
+POPULAR_QUERIES_CACHE_TIMEOUT = 600
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a search query so equivalent searches share log rows and cache keys.
+
+    Args:
+        query (str): The search query.
+
+    Returns:
+        str: The query lowercased and with collapsed whitespace.
+    """
+    return ' '.join(query.casefold().split())[:255]
+
+
+class SearchQueryLog:
+    """
+    Keeps the searches in memory and writes them to the database in batches,
+    so logging never adds a write to the search request itself: a daemon
+    thread owned by the log flushes the buffer when it is full and every
+    flush interval. The searches still buffered when the process exits are
+    written by an exit hook.
+    """
+
+    def __init__(self: 'SearchQueryLog', flush_size: int = FLUSH_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL) -> None:
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._buffer: list = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._wakeup = threading.Event()
+        self._worker = None
+        self._database = None
+
+    def record(self: 'SearchQueryLog', query: str, metrics: dict) -> None:
+        """
+        Adds a search to the buffer and wakes the flush thread when it is
+        full or old enough.
+
+        Args:
+            query (str): The search query.
+            metrics (dict): Provider name mapped to a (result count, latency ms) tuple.
+        """
+        normalized = normalize_query(query)
+        if not normalized:
+            return
+        entry = BusquedaRegistro(
+            consulta             = query[:255],
+            consulta_normalizada = normalized,
+            fecha                = timezone.now(),
+        )
+        for provider in ('db', 'google', 'amazon'):
+            if provider in metrics:
+                count, latency = metrics[provider]
+                setattr(entry, f'resultados_{provider}', count)
+                setattr(entry, f'latencia_{provider}_ms', latency)
+
+        with self._lock:
+            self._buffer.append(entry)
+            self._database = connection.settings_dict['NAME']
+            should_flush = (len(self._buffer) >= self.flush_size or
+                            time.monotonic() - self._last_flush >= self.flush_interval)
+        if should_flush:
+            self._wakeup.set()
+            self._ensure_worker()
+
+    def _ensure_worker(self: 'SearchQueryLog') -> None:
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name='search-log-flush', daemon=True)
+                self._worker.start()
+
+    def _run(self: 'SearchQueryLog') -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                # The thread lives as long as the process; do not keep its
+                # connection open between flushes
+                connection.close()
+
+    def flush_at_exit(self: 'SearchQueryLog') -> int:
+        """
+        Writes the searches still buffered when the process exits, unless
+        the database they were recorded against is no longer the configured
+        one, as after a test run swapped in its own.
+
+        Returns:
+            int: The number of searches written.
+        """
+        if self._database != connection.settings_dict['NAME']:
+            return 0
+        return self.flush()
+
+    def flush(self: 'SearchQueryLog') -> int:
+        """
+        Writes the buffered searches and updates the popularity table.
+
+        Returns:
+            int: The number of searches written.
+        """
+        with self._lock:
+            entries, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+        if not entries:
+            return 0
+
+        try:
+            with transaction.atomic():
+                BusquedaRegistro.objects.bulk_create(entries)
+                self._update_popularity(entries)
+        except Exception as e:
+            logger.error("Error guardando el registro de búsquedas: %s", str(e))
+            return 0
+        return len(entries)
+
+    def _update_popularity(self: 'SearchQueryLog', entries: list) -> None:
+        """
+        Adds the searches of a batch to the aggregated popularity rows.
+
+        Args:
+            entries (list): The BusquedaRegistro objects of the batch.
+        """
+        counts = Counter(entry.consulta_normalizada for entry in entries)
+        latest = {entry.consulta_normalizada: entry for entry in entries}
+
+        for normalized, count in counts.items():
+            entry = latest[normalized]
+            results = entry.resultados_db + entry.resultados_google + entry.resultados_amazon
+            updated = BusquedaPopular.objects.filter(consulta_normalizada=normalized).update(
+                total_busquedas    = F('total_busquedas') + count,
+                ultimos_resultados = results,
+                ultima_busqueda    = entry.fecha,
+            )
+            if updated:
+                continue
+            try:
+                with transaction.atomic():
+                    BusquedaPopular.objects.create(
+                        consulta_normalizada = normalized,
+                        total_busquedas      = count,
+                        ultimos_resultados   = results,
+                        ultima_busqueda      = entry.fecha,
+                    )
+            except IntegrityError:
+                # Another process created the row in between
+                BusquedaPopular.objects.filter(consulta_normalizada=normalized).update(
+                    total_busquedas = F('total_busquedas') + count,
+                )
+
+
+def popular_queries(limit: int = 10) -> list:
+    """
+    Gets the most searched normalized queries.
+
+    Args:
+        limit (int, optional): Maximum number of queries. Defaults to 10.
+
+    Returns:
+        list: The normalized queries, most popular first.
+    """
+    cache_key = f'popular_search_queries_{limit}'
+    queries = cache.get(cache_key)
+    if queries is None:
+        queries = list(BusquedaPopular.objects.filter(
+            ultimos_resultados__gt=0
+        ).order_by('-total_busquedas').values_list('consulta_normalizada', flat=True)[:limit])
+        cache.set(cache_key, queries, POPULAR_QUERIES_CACHE_TIMEOUT)
+    return queries
+
+
+search_log = SearchQueryLog()
+atexit.register(search_log.flush_at_exit)
@@ -0,0 +1,297 @@
+"""
+Search service that queries the local database and the external providers.
+"""
+# pylint: disable=E1101
+import json
+import time
+from concurrent.futures               import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing                           import Callable, Iterator
+from django.db.models                 import Q, QuerySet
+from core.api.google_books            import GoogleBooksAPI
+from core.api.amazon_books            import AmazonBooksAPI
+from core.services.book_card          import BookCard, card_queryset
+from core.services.prefetch           import detail_prefetcher
+from core.services.query_parser       import ParsedQuery, isbn13_to_isbn10, parse_query, word_tokens
+from core.services.search_log         import normalize_query, search_log
+from core.services.semantic_search    import semantic_search
+from libros.models                    import Libro, PalabraLibro
+
+
+PROVIDER_DEADLINE = 15
+_provider_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='search-provider')
+
+
+def format_database_book(libro: Libro) -> BookCard:
+    """
+    Builds the search card for a book stored in the database.
+
+    Args:
+        libro (Libro): The book object.
+
+    Returns:
+        BookCard: The search card for the book.
+    """
+    return BookCard.from_libro(libro)
+
+
+class SearchService:
+    """
+    Runs a book search against the database, Google Books and Amazon.
+    """
+
+    def __init__(self: 'SearchService') -> None:
+        self.google_api = GoogleBooksAPI()
+        self.amazon_api = AmazonBooksAPI()
+        self.metrics: dict = {}
+
+    def search_database(self: 'SearchService', query: str) -> list:
+        """
+        Searches the local database. ISBNs go to the unique ISBN index, the
+        'autor:', 'titulo:' and 'categoria:' fields to their indexed columns,
+        and only the free text left goes through the title/author/ISBN scan.
+
+        Args:
+            query (str): The search term.
+
+        Returns:
+            list: The matching Libro objects.
+        """
+        started = time.perf_counter()
+        parsed = parse_query(query)
+        if not parsed.is_structured:
+            libros = list(card_queryset(self._free_text_queryset(parsed.texto)).order_by('-fecha_creacion'))
+            if not libros:
+                # Conceptual queries rarely match lexically; use the vector index
+                libros = semantic_search(parsed.texto, k=10)
+        elif parsed.isbns:
+            isbns = set(parsed.isbns) | {isbn13_to_isbn10(isbn) for isbn in parsed.isbns}
+            libros = list(card_queryset(Libro.objects.filter(isbn__in=isbns - {None})))
+        else:
+            libros = list(card_queryset(self._structured_queryset(parsed)).order_by('-fecha_creacion'))
+        self._measure('db', libros, started)
+        return libros
+
+    def _free_text_queryset(self: 'SearchService', text: str) -> QuerySet:
+        """
+        Builds the free text scan over title, author and ISBN.
+
+        Args:
+            text (str): The free text.
+
+        Returns:
+            QuerySet: The matching books.
+        """
+        return Libro.objects.filter(
+            Q(titulo__icontains=text) |
+            Q(autor__icontains=text) |
+            Q(isbn__icontains=text)
+        )
+
+    def _structured_queryset(self: 'SearchService', parsed: ParsedQuery) -> QuerySet:
+        """
+        Builds the queryset for the fields of a structured query. Author and
+        title match at the start of any word, so 'autor:Borges' also finds
+        'Jorge Luis Borges': every word of the value must be the prefix of a
+        word of the field, looked up in the indexed PalabraLibro table.
+
+        Args:
+            parsed (ParsedQuery): The parsed query.
+
+        Returns:
+            QuerySet: The matching books.
+        """
+        libros = Libro.objects.all()
+        for autor in parsed.autores:
+            libros = self._word_prefix_filter(libros, PalabraLibro.Campo.AUTOR, autor)
+        for titulo in parsed.titulos:
+            libros = self._word_prefix_filter(libros, PalabraLibro.Campo.TITULO, titulo)
+        for categoria in parsed.categorias:
+            libros = libros.filter(categoria__nombre__iexact=categoria)
+        for frase in parsed.frases:
+            libros = libros.filter(Q(titulo__icontains=frase) | Q(autor__icontains=frase))
+        if parsed.texto:
+            libros = libros.filter(pk__in=self._free_text_queryset(parsed.texto).values('pk'))
+        return libros
+
+    def _word_prefix_filter(self: 'SearchService', libros: QuerySet, campo: str, valor: str) -> QuerySet:
+        """
+        Keeps the books with a word of a field starting with every word of a
+        value. The words are stored normalized, so the prefix is a
+        case-sensitive LIKE 'x%' that the index of PalabraLibro.palabra serves.
+
+        Args:
+            libros (QuerySet): The books to filter.
+            campo (str): The PalabraLibro field, 'titulo' or 'autor'.
+            valor (str): The value searched for.
+
+        Returns:
+            QuerySet: The matching books.
+        """
+        for palabra in word_tokens(valor):
+            libros = libros.filter(pk__in=PalabraLibro.objects.filter(
+                campo=campo, palabra__startswith=palabra).values('libro_id'))
+        return libros
+
+    def search_google(self: 'SearchService', query: str, force_refresh: bool = False) -> tuple:
+        """
+        Searches Google Books.
+
+        Args:
+            query (str): The search term.
+            force_refresh (bool, optional): Ignore and replace the cached result.
+
+        Returns:
+            tuple: The formatted books and the error message, if any.
+        """
+        started = time.perf_counter()
+        books, error = [], None
+        try:
+            parsed = parse_query(query)
+            if parsed.is_structured:
+                google_result = self.google_api.search_by_operators(
+                    parsed.google_query(), force_refresh=force_refresh)
+            else:
+                google_result = self.google_api.fetch_book_details(
+                    normalize_query(query), force_refresh=force_refresh)
+            if isinstance(google_result, dict) and 'error' in google_result:
+                error = google_result['error']
+            elif isinstance(google_result, list):
+                books = google_result
+        except Exception as e:
+            error = f"Error buscando en Google Books: {str(e)}"
+        self._measure('google', books, started)
+        return books, error
+
+    def search_amazon(self: 'SearchService', query: str, max_results: int = 10,
+                      force_refresh: bool = False) -> tuple:
+        """
+        Searches Amazon.
+
+        Args:
+            query (str): The search term.
+            max_results (int, optional): Maximum number of results. Defaults to 10.
+            force_refresh (bool, optional): Ignore and replace the cached result.
+
+        Returns:
+            tuple: The formatted books and the error message, if any.
+        """
+        started = time.perf_counter()
+        books, error = [], None
+        try:
+            amazon_query = normalize_query(parse_query(query).plain_text())
+            amazon_result = self.amazon_api.search_books(
+                amazon_query, max_results=max_results, force_refresh=force_refresh)
+            if isinstance(amazon_result, dict) and 'error' in amazon_result:
+                error = amazon_result['error']
+            elif isinstance(amazon_result, dict) and 'books' in amazon_result:
+                books = amazon_result['books']
+        except Exception as e:
+            error = f"Error buscando en Amazon: {str(e)}"
+        self._measure('amazon', books, started)
+        return books, error
+
+    def _measure(self: 'SearchService', provider: str, books: list, started: float) -> None:
+        """
+        Stores the result count and latency of a provider for the search log.
+
+        Args:
+            provider (str): The provider name.
+            books (list): The results returned by the provider.
+            started (float): The perf_counter value when the call started.
+        """
+        self.metrics[provider] = (len(books), (time.perf_counter() - started) * 1000)
+
+    def log(self: 'SearchService', query: str) -> None:
+        """
+        Records the search and the provider metrics in the search log.
+
+        Args:
+            query (str): The search term.
+        """
+        search_log.record(query, self.metrics)
+
+    def providers(self: 'SearchService', source: str = 'all', max_results: int = 10) -> dict:
+        """
+        Gets the external providers enabled for a search.
+
+        Args:
+            source (str, optional): 'google', 'amazon' or 'all'. Defaults to 'all'.
+            max_results (int, optional): Maximum number of Amazon results. Defaults to 10.
+
+        Returns:
+            dict: Provider name mapped to the callable that searches it.
+        """
+        providers: dict = {}
+        if source in ['google', 'all']:
+            providers['google'] = self.search_google
+        if source in ['amazon', 'all']:
+            providers['amazon'] = lambda query: self.search_amazon(query, max_results)
+        return providers
+
+    def stream(self: 'SearchService', query: str, source: str = 'all',
+               max_results: int = 10, deadline: float = PROVIDER_DEADLINE) -> Iterator[dict]:
+        """
+        Yields the search results by batches: the database hits first and then
+        each provider batch as soon as it completes, so the first result never
+        waits for the slowest provider.
+
+        Args:
+            query (str): The search term.
+            source (str, optional): 'google', 'amazon' or 'all'. Defaults to 'all'.
+            max_results (int, optional): Maximum number of Amazon results. Defaults to 10.
+            deadline (float, optional): Seconds to wait for all the providers,
+                counted from their start. Defaults to 15.
+
+        Yields:
+            dict: One event per batch, followed by a final 'done' event.
+        """
+        providers: dict[str, Callable] = self.providers(source, max_results)
+        # Providers start before the database query so they overlap with it
+        pending = {
+            _provider_executor.submit(search, query): name
+            for name, search in providers.items()
+        }
+        end = time.monotonic() + deadline
+        batches = {}
+
+        db_books = [format_database_book(libro) for libro in self.search_database(query)]
+        batches['database'] = db_books
+        yield {'event': 'database', 'books': db_books, 'count': len(db_books)}
+
+        remaining = set(pending)
+        while remaining:
+            done, remaining = wait(remaining, timeout=max(0, end - time.monotonic()),
+                                   return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                books, error = future.result()
+                batches[pending[future]] = books
+                yield {'event': pending[future], 'books': books, 'count': len(books), 'error': error}
+
+        for future in remaining:
+            future.cancel()
+            yield {'event': pending[future], 'books': [], 'count': 0,
+                   'error': 'Tiempo de espera agotado'}
+
+        self.log(query)
+        ranked = [book for name in ('database', 'google', 'amazon') for book in batches.get(name, [])]
+        detail_prefetcher.enqueue(ranked)
+        yield {'event': 'done', 'total_results': len(ranked)}
+
+
+def encode_event(event: dict, fmt: str = 'ndjson') -> str:
+    """
+    Encodes a search event for a streaming response.
+
+    Args:
+        event (dict): The event to encode.
+        fmt (str, optional): 'ndjson' or 'sse'. Defaults to 'ndjson'.
+
+    Returns:
+        str: The encoded event.
+    """
+    data = json.dumps(event, default=lambda value: value.to_dict() if isinstance(value, BookCard) else str(value))
+    if fmt == 'sse':
+        return f"event: {event['event']}\ndata: {data}\n\n"
+    return f"{data}\n"
@@ -0,0 +1,289 @@
+"""
+Local semantic search over the catalog with hashed TF-IDF vectors.
+"""
+# pylint: disable=E1101
+from datetime                        import timedelta
+import logging
+import threading
+import time
+import numpy as np
+from scipy                           import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing           import normalize
+from django.db                       import connection
+from django.db.models                import Count, Max, Q
+from core.services.book_card         import card_queryset
+from libros.models                   import Libro
+
+
+logger = logging.getLogger(__name__)
+
+N_FEATURES       = 2 ** 18
+REFRESH_INTERVAL = 60
+# Rows committed late carry an older timestamp than the last refresh saw
+REFRESH_OVERLAP  = timedelta(minutes=5)
+MIN_SCORE        = 0.05
+STOP_WORDS = [
+    'a', 'al', 'con', 'de', 'del', 'el', 'en', 'es', 'la', 'las', 'lo', 'los',
+    'para', 'por', 'que', 'se', 'sobre', 'su', 'sus', 'un', 'una', 'y',
+    'libro', 'libros', 'the', 'of', 'and', 'to', 'for', 'in', 'book', 'books',
+]
+
+
+def libro_text(titulo: str, descripcion: str | None, categoria: str | None,
+               autor: str | None = None) -> str:
+    """
+    Builds the text that is indexed for a book. The title is repeated so it
+    weighs more than the description.
+    """
+    return ' '.join(filter(None, [titulo, titulo, autor, categoria, descripcion]))
+
+
+class CatalogVectorIndex:
+    """
+    Vector index over the books of the catalog.
+
+    Documents are stored as log-tf vectors normalized to unit length in a
+    float32 CSC matrix, so a query only reads the columns of its terms, and the IDF weights are only applied to the query
+    (the SMART lnc.ltc scheme). Rows do not depend on each other, so the
+    index is refreshed incrementally: only the new or updated books are
+    vectorized and the document frequencies are patched. Serving code
+    refreshes it on a background thread, so no request waits for a build.
+    """
+
+    def __init__(self: 'CatalogVectorIndex', n_features: int = N_FEATURES) -> None:
+        self.n_features = n_features
+        self.vectorizer = HashingVectorizer(
+            n_features     = n_features,
+            alternate_sign = False,
+            norm           = None,
+            strip_accents  = 'unicode',
+            stop_words     = STOP_WORDS,
+            dtype          = np.float32,
+        )
+        # (libro_ids, matrix, doc_freq) is swapped as a whole so searches
+        # running during a refresh always see a consistent snapshot
+        self._data = (
+            np.empty(0, dtype=np.int64),
+            sparse.csc_matrix((0, n_features), dtype=np.float32),
+            np.zeros(n_features, dtype=np.int32),
+        )
+        self.last_refresh = None
+        self.last_checked = 0.0
+        self._lock        = threading.Lock()
+        self._refresher   = None
+        self._start_lock  = threading.Lock()
+
+    def __len__(self: 'CatalogVectorIndex') -> int:
+        return len(self._data[0])
+
+    @property
+    def libro_ids(self: 'CatalogVectorIndex') -> np.ndarray:
+        """
+        The book ID of every row of the matrix.
+        """
+        return self._data[0]
+
+    @property
+    def matrix(self: 'CatalogVectorIndex') -> sparse.csc_matrix:
+        """
+        The unit-length log-tf document vectors.
+        """
+        return self._data[1]
+
+    @property
+    def doc_freq(self: 'CatalogVectorIndex') -> np.ndarray:
+        """
+        The number of books that contain every hashed term.
+        """
+        return self._data[2]
+
+    @property
+    def nbytes(self: 'CatalogVectorIndex') -> int:
+        """
+        Memory used by the index arrays, in bytes.
+        """
+        libro_ids, matrix, doc_freq = self._data
+        return (matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes +
+                libro_ids.nbytes + doc_freq.nbytes)
+
+    def _vectorize(self: 'CatalogVectorIndex', texts: list) -> sparse.csr_matrix:
+        """
+        Vectorizes documents as unit-length log-tf rows.
+        """
+        counts = self.vectorizer.transform(texts).tocsr()
+        counts.data = 1 + np.log(counts.data)
+        return normalize(counts, copy=False).astype(np.float32)
+
+    def upsert(self: 'CatalogVectorIndex', rows: list, removed: set | None = None) -> None:
+        """
+        Adds or replaces books in the index and drops the removed ones.
+
+        Args:
+            rows (list): Tuples of (libro_id, text) for the new or updated books.
+            removed (set, optional): IDs of books that no longer exist.
+        """
+        libro_ids, matrix, doc_freq = self._data
+        drop = set(removed or ()) | {libro_id for libro_id, _ in rows}
+        keep = ~np.isin(libro_ids, list(drop)) if drop else np.ones(len(libro_ids), dtype=bool)
+
+        if not keep.all():
+            dropped = matrix[~keep].tocsr()
+            doc_freq = doc_freq - np.bincount(dropped.indices, minlength=self.n_features).astype(np.int32)
+            matrix = matrix[keep]
+            libro_ids = libro_ids[keep]
+
+        if rows:
+            added = self._vectorize([text for _, text in rows])
+            doc_freq = doc_freq + np.bincount(added.indices, minlength=self.n_features).astype(np.int32)
+            matrix = sparse.vstack([matrix, added], format='csc', dtype=np.float32)
+            libro_ids = np.concatenate([
+                libro_ids, np.fromiter((libro_id for libro_id, _ in rows), dtype=np.int64)
+            ])
+        self._data = (libro_ids, matrix, doc_freq)
+
+    def search(self: 'CatalogVectorIndex', query: str, k: int = 10,
+               min_score: float = MIN_SCORE) -> list:
+        """
+        Finds the books closest to a query by cosine similarity.
+
+        Args:
+            query (str): The search query.
+            k (int, optional): Maximum number of results. Defaults to 10.
+            min_score (float, optional): Minimum similarity. Defaults to 0.05.
+
+        Returns:
+            list: Tuples of (libro_id, score), best match first.
+        """
+        libro_ids, matrix, doc_freq = self._data
+        if not len(libro_ids) or k <= 0 or not query.strip():
+            return []
+        vector = self.vectorizer.transform([query]).tocsr()
+        idf = np.log((1 + len(libro_ids)) / (1 + doc_freq[vector.indices])) + 1
+        vector.data = (1 + np.log(vector.data)) * idf
+        vector = normalize(vector).astype(np.float32)
+
+        # Column slicing only touches the postings of the query terms
+        scores = matrix[:, vector.indices] @ vector.data
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(libro_ids[i]), float(scores[i])) for i in top if scores[i] >= min_score]
+
+    def refresh(self: 'CatalogVectorIndex', force: bool = False) -> int:
+        """
+        Brings the index up to date with the database. Only the books updated
+        since the last refresh, or whose category was, are vectorized again.
+        Deleted books, and books committed too late to be seen by their
+        timestamp, are found by comparing the count and the highest ID.
+
+        Args:
+            force (bool, optional): Refresh even if the last check was recent.
+
+        Returns:
+            int: The number of books vectorized.
+        """
+        if not force and time.monotonic() - self.last_checked < REFRESH_INTERVAL:
+            return 0
+        with self._lock:
+            # Another thread may have refreshed while this one waited
+            if not force and time.monotonic() - self.last_checked < REFRESH_INTERVAL:
+                return 0
+            self.last_checked = time.monotonic()
+            libros = Libro.objects.order_by()
+            if self.last_refresh is not None:
+                since = self.last_refresh - REFRESH_OVERLAP
+                libros = libros.filter(
+                    Q(fecha_actualizacion__gte=since) | Q(categoria__fecha_actualizacion__gte=since))
+            changed = list(libros.values_list(
+                'id', 'titulo', 'descripcion', 'categoria__nombre', 'autor',
+                'fecha_actualizacion', 'categoria__fecha_actualizacion'))
+            self.upsert(self._rows(changed))
+
+            total, max_id = Libro.objects.aggregate(Count('id'), Max('id')).values()
+            libro_ids = self.libro_ids
+            if total != len(libro_ids) or (total and max_id != libro_ids.max()):
+                changed += self._reconcile()
+            if changed:
+                self.last_refresh = max(fecha for row in changed for fecha in row[5:] if fecha)
+            return len(changed)
+
+    def _rows(self: 'CatalogVectorIndex', libros: list) -> list:
+        return [
+            (libro_id, libro_text(titulo, descripcion, categoria, autor))
+            for libro_id, titulo, descripcion, categoria, autor, *_ in libros
+        ]
+
+    def _reconcile(self: 'CatalogVectorIndex') -> list:
+        """
+        Drops the deleted books and adds the books the index does not have.
+
+        Returns:
+            list: The rows of the books added.
+        """
+        existing = np.fromiter(Libro.objects.values_list('id', flat=True).iterator(chunk_size=5000),
+                               dtype=np.int64)
+        libro_ids = self.libro_ids
+        removed = set(np.setdiff1d(libro_ids, existing).tolist())
+        missing = np.setdiff1d(existing, libro_ids).tolist()
+        added = []
+        for start in range(0, len(missing), 5000):
+            added += Libro.objects.filter(id__in=missing[start:start + 5000]).values_list(
+                'id', 'titulo', 'descripcion', 'categoria__nombre', 'autor',
+                'fecha_actualizacion', 'categoria__fecha_actualizacion')
+        self.upsert(self._rows(added), removed)
+        return added
+
+    def refresh_in_background(self: 'CatalogVectorIndex') -> None:
+        """
+        Starts a refresh on a daemon thread when one is due and none is
+        running. The first call of a process builds the whole index there;
+        until it finishes, searches see the index as it was.
+        """
+        if time.monotonic() - self.last_checked < REFRESH_INTERVAL:
+            return
+        with self._start_lock:
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            self._refresher = threading.Thread(
+                target=self._refresh_quietly, name='catalog-index-refresh', daemon=True)
+            self._refresher.start()
+
+    def _refresh_quietly(self: 'CatalogVectorIndex') -> None:
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning("Error actualizando el índice del catálogo: %s", str(e))
+        finally:
+            connection.close()
+
+
+_catalog_index = CatalogVectorIndex()
+
+
+def get_catalog_index() -> CatalogVectorIndex:
+    """
+    Gets the process-wide catalog index. It is refreshed at most once per
+    minute, in the background.
+
+    Returns:
+        CatalogVectorIndex: The catalog index.
+    """
+    _catalog_index.refresh_in_background()
+    return _catalog_index
+
+
+def semantic_search(query: str, k: int = 10) -> list:
+    """
+    Finds the books of the catalog closest in meaning to a query.
+
+    Args:
+        query (str): The search query.
+        k (int, optional): Maximum number of results. Defaults to 10.
+
+    Returns:
+        list: The Libro objects, best match first, loaded with the card columns.
+    """
+    hits = get_catalog_index().search(query, k)
+    libros = card_queryset(Libro.objects.all()).in_bulk([libro_id for libro_id, _ in hits])
+    return [libros[libro_id] for libro_id, _ in hits if libro_id in libros]
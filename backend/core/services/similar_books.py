@@ -0,0 +1,412 @@
+"""
+Precomputed similar books: books favorited by the same users, and books
+with similar text.
+"""
+# pylint: disable=E1101
+import logging
+import queue
+import threading
+from contextlib                    import contextmanager
+import numpy as np
+from scipy                         import sparse
+from sklearn.preprocessing         import normalize
+from django.conf                   import settings
+from django.db                     import connection, transaction
+from django.db.models              import Count
+from core.services.semantic_search import (MIN_SCORE, CatalogVectorIndex, get_catalog_index,
+                                           libro_text)
+from libros.models                 import Libro, LibroSimilar
+from profiles.models               import Favorito
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIMILAR_BOOKS = 20
+BLOCK_SIZE            = 1024
+BUILD_CHUNK_SIZE      = 50000
+MAX_DOC_FREQ          = 1000
+CATEGORY_BONUS        = 0.1
+COFAVORITOS           = LibroSimilar.Origen.COFAVORITOS
+CONTENIDO             = LibroSimilar.Origen.CONTENIDO
+
+
+def _k() -> int:
+    return getattr(settings, 'SIMILAR_BOOKS_K', DEFAULT_SIMILAR_BOOKS)
+
+
+def _top(libro_ids: np.ndarray, scores: np.ndarray, k: int) -> list:
+    """
+    Gets the K best (libro_id, score) pairs, best first; ties go to the
+    lower book ID.
+    """
+    if len(libro_ids) > k:
+        top = np.argpartition(-scores, k - 1)[:k]
+        libro_ids, scores = libro_ids[top], scores[top]
+    order = np.lexsort((libro_ids, -scores))
+    return list(zip(libro_ids[order].tolist(), scores[order].tolist()))
+
+
+def _filas(libro_id: int, similares: list, origen: str) -> list:
+    return [
+        LibroSimilar(libro_id=libro_id, similar_id=similar_id, origen=origen,
+                     posicion=posicion, puntuacion=puntuacion)
+        for posicion, (similar_id, puntuacion) in enumerate(similares)
+    ]
+
+
+def _guardar(listas: dict, origen: str) -> None:
+    """
+    Replaces the stored lists of some books.
+
+    Args:
+        listas (dict): The (similar_id, score) pairs by book ID.
+        origen (str): The similarity origin.
+    """
+    with transaction.atomic():
+        LibroSimilar.objects.filter(libro_id__in=list(listas), origen=origen).delete()
+        LibroSimilar.objects.bulk_create([
+            fila for libro_id, similares in listas.items()
+            for fila in _filas(libro_id, similares, origen)
+        ], batch_size=1000)
+
+
+def reconstruir_cofavoritos(k: int = None, block_size: int = BLOCK_SIZE) -> int:
+    """
+    Recomputes the co-favorite lists of every book. The favorites are a
+    sparse users x books matrix X; the co-occurrences of a block of books
+    are a block of rows of X.T @ X, which is scored by cosine, reduced to
+    its top K and written, so memory is bounded by one block.
+
+    Args:
+        k (int, optional): Similar books per book. Defaults to SIMILAR_BOOKS_K.
+        block_size (int, optional): Books per block. Defaults to 1024.
+
+    Returns:
+        int: The number of books with a list.
+    """
+    k = k or _k()
+    pares = np.fromiter(
+        Favorito.objects.order_by().values_list('usuario_id', 'libro_id').iterator(chunk_size=5000),
+        dtype=np.dtype((np.int64, 2))).reshape(-1, 2)
+    usuarios, filas = np.unique(pares[:, 0], return_inverse=True)
+    libro_ids, cols = np.unique(pares[:, 1], return_inverse=True)
+    favoritos = sparse.csr_matrix(
+        (np.ones(len(pares), dtype=np.float32), (filas, cols)),
+        shape=(len(usuarios), len(libro_ids)))
+    favoritos.data[:] = 1
+    inversa = 1 / np.sqrt(np.asarray(favoritos.sum(axis=0), dtype=np.float32).ravel())
+    por_libro = favoritos.T.tocsr()
+
+    total = 0
+    for start in range(0, len(libro_ids), block_size):
+        stop = min(start + block_size, len(libro_ids))
+        coocurrencias = (por_libro[start:stop] @ favoritos).tocsr()
+        listas = {}
+        for i in range(stop - start):
+            inicio, fin = coocurrencias.indptr[i], coocurrencias.indptr[i + 1]
+            columnas = coocurrencias.indices[inicio:fin]
+            valores = coocurrencias.data[inicio:fin]
+            otros = columnas != start + i
+            columnas, valores = columnas[otros], valores[otros]
+            if len(columnas):
+                scores = valores * inversa[start + i] * inversa[columnas]
+                listas[int(libro_ids[start + i])] = _top(libro_ids[columnas], scores, k)
+        _guardar(listas, COFAVORITOS)
+        total += len(listas)
+    # Books whose favorites were all removed
+    LibroSimilar.objects.filter(origen=COFAVORITOS).exclude(
+        libro_id__in=Favorito.objects.values('libro_id')).delete()
+    return total
+
+
+def _coocurrencias(libro_id: int) -> tuple:
+    """
+    Gets the books favorited by the users of a book, with one aggregate.
+
+    Returns:
+        tuple: (libro_ids, co-occurrences, favorites of each book) arrays,
+            and the number of favorites of the book.
+    """
+    lectores = Favorito.objects.filter(libro_id=libro_id).values('usuario_id')
+    filas = list(Favorito.objects.filter(usuario_id__in=lectores).values('libro_id').annotate(
+        co=Count('id')).order_by().values_list('libro_id', 'co', 'libro__total_favoritos'))
+    propia = next((fila for fila in filas if fila[0] == libro_id), None)
+    filas = [fila for fila in filas if fila[0] != libro_id]
+    datos = np.array(filas, dtype=np.float64).reshape(-1, 3)
+    return (datos[:, 0].astype(np.int64), datos[:, 1], np.maximum(datos[:, 2], datos[:, 1]),
+            propia[1] if propia else 0)
+
+
+def actualizar_cofavoritos(usuario_id: int, libro_id: int) -> None:
+    """
+    Updates the co-favorite lists after a user adds or removes a favorite.
+    The list of the book is recomputed, and the score of the book is patched
+    in the lists of the other favorites of the user, with a fixed number of
+    queries. Lists of other books the score of this one depends on are only
+    refreshed by reconstruir_cofavoritos.
+
+    Args:
+        usuario_id (int): The user ID.
+        libro_id (int): The book that was added or removed.
+    """
+    k = _k()
+    libro_ids, co, totales, propios = _coocurrencias(libro_id)
+    scores = co / np.sqrt(max(propios, 1) * totales) if len(libro_ids) else co
+    listas = {libro_id: _top(libro_ids, scores, k)}
+    nuevos = dict(zip(libro_ids.tolist(), scores.tolist()))
+
+    otros = list(Favorito.objects.filter(usuario_id=usuario_id).exclude(
+        libro_id=libro_id).values_list('libro_id', flat=True))
+    actuales = {otro: {} for otro in otros}
+    for otro, similar_id, puntuacion in LibroSimilar.objects.filter(
+            libro_id__in=otros, origen=COFAVORITOS).values_list('libro_id', 'similar_id', 'puntuacion'):
+        actuales[otro][similar_id] = puntuacion
+    for otro, similares in actuales.items():
+        similares.pop(libro_id, None)
+        if nuevos.get(otro):
+            similares[libro_id] = nuevos[otro]
+        ids = np.fromiter(similares.keys(), dtype=np.int64, count=len(similares))
+        listas[otro] = _top(ids, np.fromiter(similares.values(), dtype=np.float64, count=len(similares)), k)
+    _guardar(listas, COFAVORITOS)
+
+
+def contenido_top_k(index: CatalogVectorIndex, categorias: np.ndarray, k: int,
+                    block_size: int = BLOCK_SIZE, max_doc_freq: int = MAX_DOC_FREQ):
+    """
+    Finds the K books with the most similar text of every book of an index,
+    scored like CatalogVectorIndex.search with the book as the query, plus
+    CATEGORY_BONUS for books of the same category. A block of books is
+    weighted by IDF and multiplied by the transposed index, so memory is
+    bounded by one block; terms in more than max_doc_freq books are skipped
+    in the product, as they are common enough to make every block dense
+    while adding little to the score.
+
+    Args:
+        index (CatalogVectorIndex): The vectorized books.
+        categorias (np.ndarray): The category ID of every row of the index,
+            -1 for books without one.
+        k (int): Similar books per book.
+        block_size (int, optional): Books per block. Defaults to 1024.
+        max_doc_freq (int, optional): Document frequency of the terms that
+            are skipped. Defaults to 1000.
+
+    Yields:
+        dict: The (similar_id, score) pairs of the books of a block, by book
+            ID; the list is empty for books with no similar text.
+    """
+    libro_ids, matrix, doc_freq = index.libro_ids, index.matrix, index.doc_freq
+    idf = (np.log((1 + len(libro_ids)) / (1 + doc_freq)) + 1).astype(np.float32)
+    usados = (doc_freq <= max_doc_freq).astype(np.float32)
+    documentos = matrix.tocsr()
+    # The transpose of the CSC index is CSR, without a copy
+    terminos = matrix.T
+    for start in range(0, len(libro_ids), block_size):
+        stop = min(start + block_size, len(libro_ids))
+        consultas = documentos[start:stop]
+        consultas = normalize(sparse.csr_matrix(
+            (consultas.data * idf[consultas.indices], consultas.indices, consultas.indptr),
+            shape=consultas.shape))
+        # Skipped after normalizing, so the scores stay those of search
+        consultas.data *= usados[consultas.indices]
+        consultas.eliminate_zeros()
+        scores = (consultas @ terminos).tocsr()
+        listas = {}
+        for i in range(stop - start):
+            inicio, fin = scores.indptr[i], scores.indptr[i + 1]
+            columnas = scores.indices[inicio:fin]
+            valores = scores.data[inicio:fin]
+            otros = (columnas != start + i) & (valores >= MIN_SCORE)
+            columnas, valores = columnas[otros], valores[otros]
+            if categorias[start + i] >= 0:
+                valores = valores + CATEGORY_BONUS * (categorias[columnas] == categorias[start + i])
+            listas[int(libro_ids[start + i])] = _top(libro_ids[columnas], valores, k)
+        yield listas
+
+
+def reconstruir_contenido(k: int = None, block_size: int = BLOCK_SIZE,
+                          max_doc_freq: int = MAX_DOC_FREQ) -> int:
+    """
+    Recomputes the content-based lists of every book from its title, author,
+    category and description.
+
+    Args:
+        k (int, optional): Similar books per book. Defaults to SIMILAR_BOOKS_K.
+        block_size (int, optional): Books per block. Defaults to 1024.
+        max_doc_freq (int, optional): Document frequency of the terms that
+            are skipped. Defaults to 1000.
+
+    Returns:
+        int: The number of books with a list.
+    """
+    k = k or _k()
+    index = CatalogVectorIndex()
+    categorias, filas = [], []
+    for libro_id, titulo, descripcion, autor, categoria, categoria_id in Libro.objects.order_by(
+            'id').values_list('id', 'titulo', 'descripcion', 'autor', 'categoria__nombre',
+                              'categoria_id').iterator(chunk_size=5000):
+        filas.append((libro_id, libro_text(titulo, descripcion, categoria, autor)))
+        categorias.append(-1 if categoria_id is None else categoria_id)
+        if len(filas) == BUILD_CHUNK_SIZE:
+            index.upsert(filas)
+            filas = []
+    index.upsert(filas)
+
+    total = 0
+    for listas in contenido_top_k(index, np.array(categorias, dtype=np.int64), k,
+                                  block_size, max_doc_freq):
+        _guardar(listas, CONTENIDO)
+        total += sum(1 for similares in listas.values() if similares)
+    return total
+
+
+def actualizar_contenido(libro_id: int) -> None:
+    """
+    Computes the content-based list of a new book by searching its text in
+    the catalog index as it is, and adds the book to the lists of its
+    similar books where it ranks in their top K, with a fixed number of
+    queries. The index is not refreshed for it, so books added since its
+    last refresh, at most a minute ago, only meet at the next rebuild;
+    nothing is stored while the process is still building the index.
+
+    Args:
+        libro_id (int): The book ID.
+    """
+    k = _k()
+    index = get_catalog_index()
+    if not len(index):
+        return
+    libro = Libro.objects.filter(id=libro_id).values_list(
+        'titulo', 'descripcion', 'autor', 'categoria__nombre', 'categoria_id').first()
+    if libro is None:
+        return
+    titulo, descripcion, autor, categoria, categoria_id = libro
+    hits = dict(index.search(libro_text(titulo, descripcion, categoria, autor), 2 * k + 1))
+    hits.pop(libro_id, None)
+    # Also drops the books the index still has but were deleted
+    categorias = dict(Libro.objects.filter(id__in=list(hits)).values_list('id', 'categoria_id'))
+    nuevos = {
+        similar_id: score + (CATEGORY_BONUS if categoria_id is not None and
+                             categorias[similar_id] == categoria_id else 0)
+        for similar_id, score in hits.items() if similar_id in categorias
+    }
+    ids = np.fromiter(nuevos.keys(), dtype=np.int64, count=len(nuevos))
+    listas = {libro_id: _top(ids, np.fromiter(nuevos.values(), dtype=np.float64, count=len(nuevos)), k)}
+
+    actuales = {similar_id: {} for similar_id, _ in listas[libro_id]}
+    for otro, similar_id, puntuacion in LibroSimilar.objects.filter(
+            libro_id__in=list(actuales), origen=CONTENIDO).values_list('libro_id', 'similar_id', 'puntuacion'):
+        actuales[otro][similar_id] = puntuacion
+    for otro, similares in actuales.items():
+        similares[libro_id] = nuevos[otro]
+        ids = np.fromiter(similares.keys(), dtype=np.int64, count=len(similares))
+        listas[otro] = _top(ids, np.fromiter(similares.values(), dtype=np.float64, count=len(similares)), k)
+    _guardar(listas, CONTENIDO)
+
+
+class SimilarBooksUpdater:
+    """
+    Runs the incremental updates of the similar books from a daemon thread
+    once the transaction that triggered them commits, so adding a favorite
+    or a book never waits for them. Updates still queued when the process
+    exits are lost until the next rebuild_similar_books.
+    """
+
+    def __init__(self: 'SimilarBooksUpdater') -> None:
+        self._queue: queue.Queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def schedule(self: 'SimilarBooksUpdater', update, *args) -> None:
+        """
+        Queues an update to run after the current transaction commits; it
+        is dropped if the transaction rolls back or the thread is paused.
+
+        Args:
+            update: The update function, e.g. actualizar_cofavoritos.
+            *args: Its arguments.
+        """
+        if getattr(self._local, 'paused', False):
+            return
+        transaction.on_commit(lambda: self._enqueue(update, args))
+
+    @contextmanager
+    def paused(self: 'SimilarBooksUpdater'):
+        """
+        Skips the updates scheduled by the current thread, for bulk loads
+        that run rebuild_similar_books once they finish.
+        """
+        previous = getattr(self._local, 'paused', False)
+        self._local.paused = True
+        try:
+            yield
+        finally:
+            self._local.paused = previous
+
+    def _enqueue(self: 'SimilarBooksUpdater', update, args: tuple) -> None:
+        self._queue.put((update, args))
+        self._ensure_worker()
+
+    def _ensure_worker(self: 'SimilarBooksUpdater') -> None:
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name='similar-books', daemon=True)
+                self._worker.start()
+
+    def _run(self: 'SimilarBooksUpdater') -> None:
+        while True:
+            update, args = self._queue.get()
+            try:
+                self._apply(update, args)
+            finally:
+                # The thread lives as long as the process; do not keep its
+                # connection open between updates
+                connection.close()
+
+    def _apply(self: 'SimilarBooksUpdater', update, args: tuple) -> None:
+        try:
+            update(*args)
+        except Exception as e:
+            logger.warning("Error actualizando los libros similares: %s", str(e))
+        finally:
+            self._queue.task_done()
+
+    def drain(self: 'SimilarBooksUpdater') -> int:
+        """
+        Runs the queued updates in the calling thread.
+
+        Returns:
+            int: The number of updates run.
+        """
+        total = 0
+        while True:
+            try:
+                update, args = self._queue.get_nowait()
+            except queue.Empty:
+                return total
+            self._apply(update, args)
+            total += 1
+
+
+similar_updates = SimilarBooksUpdater()
+
+
+def similares(libro_id: int, limit: int, origen: str = COFAVORITOS) -> list:
+    """
+    Gets the stored similar books of a book with one index range scan.
+
+    Args:
+        libro_id (int): The book ID.
+        limit (int): Maximum number of books.
+        origen (str, optional): The similarity origin. Defaults to co-favorites.
+
+    Returns:
+        list: The similar books, most similar first.
+    """
+    return list(Libro.objects.select_related('categoria').filter(
+        similar_de__libro_id=libro_id,
+        similar_de__origen=origen,
+        similar_de__posicion__lt=limit,
+        disponible=True
+    ).order_by('similar_de__posicion'))
@@ -0,0 +1,123 @@
+"""
+Time-decayed trending scores maintained from the favorite events.
+"""
+# pylint: disable=E1101
+import math
+from datetime                   import datetime, timedelta
+from django.conf                import settings
+from django.db                  import IntegrityError, transaction
+from django.db.models           import F, Value
+from django.db.models.functions import Greatest
+from django.utils               import timezone
+from libros.models              import EpocaTendencia, Libro, TendenciaLibro
+from profiles.models            import Favorito
+
+
+DEFAULT_TRENDING_HALF_LIFE_HOURS = 72
+MIN_SCORE = 1e-3
+
+
+def _tau() -> float:
+    """
+    Decay time constant in seconds, from TRENDING_HALF_LIFE_HOURS.
+    """
+    half_life = getattr(settings, 'TRENDING_HALF_LIFE_HOURS', DEFAULT_TRENDING_HALF_LIFE_HOURS)
+    return half_life * 3600 / math.log(2)
+
+
+def _epoca(bloquear: bool = False) -> EpocaTendencia:
+    queryset = EpocaTendencia.objects.select_for_update() if bloquear else EpocaTendencia.objects
+    epoca = queryset.filter(pk=1).first()
+    if epoca is None:
+        epoca, _ = EpocaTendencia.objects.get_or_create(pk=1, defaults={'referencia': timezone.now()})
+    return epoca
+
+
+def _peso(fecha: datetime, referencia: datetime) -> float:
+    return math.exp((fecha - referencia).total_seconds() / _tau())
+
+
+def registrar_favorito(libro_id: int, fecha: datetime, signo: int = 1) -> None:
+    """
+    Adds a favorite event to the trending score of a book, or removes it
+    when the favorite is deleted. The epoch is read without a lock, so
+    favorite writes never wait on each other; an event racing with
+    reconstruir may be off until its next run.
+
+    Args:
+        libro_id (int): The book ID.
+        fecha (datetime): When the book was marked as favorite.
+        signo (int, optional): 1 to add the event, -1 to remove it. Defaults to 1.
+    """
+    peso = _peso(fecha, _epoca().referencia)
+    puntuacion = Greatest(F('puntuacion') + signo * peso, Value(0.0))
+    actualizados = TendenciaLibro.objects.filter(libro_id=libro_id).update(puntuacion=puntuacion)
+    if not actualizados and signo > 0:
+        categoria_id = Libro.objects.filter(pk=libro_id).values_list(
+            'categoria_id', flat=True).first()
+        try:
+            with transaction.atomic():
+                TendenciaLibro.objects.create(
+                    libro_id=libro_id, categoria_id=categoria_id, puntuacion=peso)
+        except IntegrityError:
+            # Another favorite of the book created the row in between
+            TendenciaLibro.objects.filter(libro_id=libro_id).update(puntuacion=puntuacion)
+
+
+def reconstruir(ahora: datetime = None) -> int:
+    """
+    Recomputes every trending score from the favorites table relative to a
+    new epoch, dropping the events whose weight falls below MIN_SCORE. Run
+    it periodically (e.g. daily) to keep the stored scores in a safe
+    floating point range; it also repairs the events that
+    registrar_favorito weighted with the previous epoch while it ran.
+
+    Args:
+        ahora (datetime, optional): The new epoch. Defaults to now.
+
+    Returns:
+        int: The number of books trending.
+    """
+    ahora = ahora or timezone.now()
+    horizonte = ahora - timedelta(seconds=_tau() * -math.log(MIN_SCORE))
+    puntuaciones = {}
+    eventos = Favorito.objects.filter(fecha_favorito__gte=horizonte).values_list(
+        'libro_id', 'libro__categoria_id', 'fecha_favorito')
+    for libro_id, categoria_id, fecha in eventos.iterator(chunk_size=5000):
+        _, puntuacion = puntuaciones.get(libro_id, (categoria_id, 0.0))
+        puntuaciones[libro_id] = (categoria_id, puntuacion + _peso(fecha, ahora))
+
+    with transaction.atomic():
+        epoca = _epoca(bloquear=True)
+        TendenciaLibro.objects.all().delete()
+        TendenciaLibro.objects.bulk_create([
+            TendenciaLibro(libro_id=libro_id, categoria_id=categoria_id, puntuacion=puntuacion)
+            for libro_id, (categoria_id, puntuacion) in puntuaciones.items()
+        ], batch_size=1000)
+        epoca.referencia = ahora
+        epoca.save(update_fields=['referencia'])
+    return len(puntuaciones)
+
+
+def tendencias(limit: int = 10, categoria_id: int = None) -> list:
+    """
+    Gets the trending books, overall or in one category, with an index
+    range scan over the stored scores.
+
+    Args:
+        limit (int, optional): Number of books. Defaults to 10.
+        categoria_id (int, optional): Restrict to one category. Defaults to None.
+
+    Returns:
+        list: (libro_id, score) tuples, best first, with the score decayed
+            to the present.
+    """
+    queryset = TendenciaLibro.objects.all()
+    if categoria_id is not None:
+        queryset = queryset.filter(categoria_id=categoria_id)
+    factor = _peso(_epoca().referencia, timezone.now())
+    return [
+        (libro_id, puntuacion * factor)
+        for libro_id, puntuacion in queryset.order_by('-puntuacion').values_list(
+            'libro_id', 'puntuacion')[:limit]
+    ]
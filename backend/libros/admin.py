@@ -3,7 +3,8 @@ Admin configuration for the Libros application.
 """
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models        import Categoria, Libro, FuenteLibro, Resena
+from .models        import (Categoria, Libro, FuenteLibro, Resena, BusquedaPopular,
+                            CategoriaStats)
 
 
 class CategoriaAdmin(admin.ModelAdmin):
@@ -45,6 +46,27 @@ class ResenaAdmin(admin.ModelAdmin):
     ordering      = ('-fecha_creacion',)
 
 
+class BusquedaPopularAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for the BusquedaPopular model.
+    """
+    list_display  = ('consulta_normalizada', 'total_busquedas',
+                     'ultimos_resultados', 'ultima_busqueda', 'ultimo_precalentamiento')
+    search_fields = ('consulta_normalizada',)
+    ordering      = ('-total_busquedas',)
+
+
+class CategoriaStatsAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for the CategoriaStats model.
+    """
+    list_display  = ('categoria', 'total_libros', 'libros_disponibles',
+                     'precio_minimo', 'precio_maximo', 'fecha_actualizacion')
+    ordering      = ('-total_libros',)
+
+
+admin.site.register(CategoriaStats, CategoriaStatsAdmin)
+admin.site.register(BusquedaPopular, BusquedaPopularAdmin)
 admin.site.register(FuenteLibro, FuenteLibroAdmin)
 admin.site.register(Resena, ResenaAdmin)
 admin.site.register(Libro, LibroAdmin)
@@ -10,3 +10,11 @@ class LibrosConfig(AppConfig):
     """
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'libros'
+
+    def ready(self: 'LibrosConfig') -> None:
+        """
+        Loads the recommendation model once per process, so requests never
+        pay for reading it.
+        """
+        from core.services.recommendation_service import get_engine
+        get_engine().reload_if_changed(force=True)
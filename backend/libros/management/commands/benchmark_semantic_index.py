@@ -0,0 +1,72 @@
+"""
+Command to benchmark the semantic search index against the catalog size
+"""
+import time
+import numpy as np
+from django.core.management.base   import BaseCommand
+from core.services.semantic_search import CatalogVectorIndex
+
+
+class Command(BaseCommand):
+    """
+    Command to measure build time, memory and query latency of the semantic
+    index with synthetic catalogs of increasing size. It does not touch the
+    database.
+
+    Args:
+        BaseCommand (BaseCommand): Command base class from Django.
+    """
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[1000, 10000, 100000],
+            help='Catalog sizes to benchmark',
+        )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=100,
+            help='Number of queries to time for every size',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Books added per incremental upsert',
+        )
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(42)
+        vocabulary = np.array([f'termino{i}' for i in range(50000)])
+        # Zipf-like word frequencies, as in natural text
+        weights = 1 / np.arange(1, len(vocabulary) + 1)
+        weights /= weights.sum()
+
+        def random_texts(n_texts: int, n_words: int) -> list:
+            words = vocabulary[rng.choice(len(vocabulary), size=(n_texts, n_words), p=weights)]
+            return [' '.join(row) for row in words]
+
+        self.stdout.write(f'{"books":>10} {"build (s)":>10} {"memory (MB)":>12} '
+                          f'{"p50 (ms)":>9} {"p95 (ms)":>9}')
+        for size in options['sizes']:
+            index = CatalogVectorIndex()
+            build = 0.0
+            for start in range(0, size, options['batch_size']):
+                end = min(start + options['batch_size'], size)
+                rows = list(zip(range(start, end), random_texts(end - start, 60)))
+                started = time.perf_counter()
+                index.upsert(rows)
+                build += time.perf_counter() - started
+
+            latencies = []
+            for query in random_texts(options['queries'], 4):
+                started = time.perf_counter()
+                index.search(query, k=10)
+                latencies.append((time.perf_counter() - started) * 1000)
+
+            self.stdout.write(
+                f'{size:>10} {build:>10.2f} {index.nbytes / 1024 ** 2:>12.1f} '
+                f'{np.percentile(latencies, 50):>9.2f} {np.percentile(latencies, 95):>9.2f}'
+            )
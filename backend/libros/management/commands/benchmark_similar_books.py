@@ -0,0 +1,86 @@
+"""
+Command to benchmark the content-based similar books against the catalog size
+"""
+import time
+import tracemalloc
+import numpy as np
+from django.core.management.base   import BaseCommand
+from core.services.semantic_search import CatalogVectorIndex
+from core.services.similar_books   import (BLOCK_SIZE, BUILD_CHUNK_SIZE, DEFAULT_SIMILAR_BOOKS,
+                                           MAX_DOC_FREQ, contenido_top_k)
+
+
+class Command(BaseCommand):
+    """
+    Command to measure the build time and memory of the content-based
+    similar books with synthetic catalogs of increasing size. The lists are
+    computed but not written, so it does not touch the database.
+
+    Args:
+        BaseCommand (BaseCommand): Command base class from Django.
+    """
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[10000, 100000, 1000000],
+            help='Catalog sizes to benchmark',
+        )
+        parser.add_argument(
+            '--categories',
+            type=int,
+            default=50,
+            help='Number of categories of the synthetic books',
+        )
+        parser.add_argument(
+            '--block-size',
+            type=int,
+            default=BLOCK_SIZE,
+            help='Books scored per block',
+        )
+        parser.add_argument(
+            '--max-doc-freq',
+            type=int,
+            default=MAX_DOC_FREQ,
+            help='Terms in more books than this are skipped',
+        )
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(42)
+        vocabulary = np.array([f'termino{i}' for i in range(50000)])
+        # Zipf-like word frequencies, as in natural text
+        weights = 1 / np.arange(1, len(vocabulary) + 1)
+        weights /= weights.sum()
+
+        def random_texts(n_texts: int, n_words: int) -> list:
+            words = vocabulary[rng.choice(len(vocabulary), size=(n_texts, n_words), p=weights)]
+            return [' '.join(row) for row in words]
+
+        self.stdout.write(f'{"books":>10} {"vectorize (s)":>14} {"top-k (s)":>10} '
+                          f'{"index (MB)":>11} {"peak (MB)":>10} {"avg list":>9}')
+        for size in options['sizes']:
+            index = CatalogVectorIndex()
+            vectorize = 0.0
+            for start in range(0, size, BUILD_CHUNK_SIZE):
+                end = min(start + BUILD_CHUNK_SIZE, size)
+                rows = list(zip(range(start, end), random_texts(end - start, 60)))
+                started = time.perf_counter()
+                index.upsert(rows)
+                vectorize += time.perf_counter() - started
+            categorias = rng.integers(0, options['categories'], size=size)
+
+            tracemalloc.start()
+            started = time.perf_counter()
+            total = 0
+            for listas in contenido_top_k(index, categorias, DEFAULT_SIMILAR_BOOKS,
+                                          options['block_size'], options['max_doc_freq']):
+                total += sum(len(similares) for similares in listas.values())
+            top_k = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            self.stdout.write(
+                f'{size:>10} {vectorize:>14.2f} {top_k:>10.2f} {index.nbytes / 1024 ** 2:>11.1f} '
+                f'{peak / 1024 ** 2:>10.1f} {total / size:>9.1f}'
+            )
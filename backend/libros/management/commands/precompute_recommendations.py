@@ -0,0 +1,38 @@
+"""
+Command to precompute the recommendations of every user
+"""
+from django.core.management.base          import BaseCommand
+from core.services.recommendation_service import PRECOMPUTE_CHUNK_SIZE, RecomendationEngine
+
+
+class Command(BaseCommand):
+    """
+    Command to store the top-N recommendations of every user of the trained
+    model, so recommendation requests are a single indexed read. Run it after
+    train_recommendation, e.g. nightly.
+
+    Args:
+        BaseCommand (BaseCommand): Command base class from Django.
+    """
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-n',
+            type=int,
+            default=None,
+            help='Books stored per user (default: RECOMMENDATION_PRECOMPUTE_TOP_N)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=PRECOMPUTE_CHUNK_SIZE,
+            help='Users processed per chunk',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Precomputing recommendations...')
+        try:
+            total = RecomendationEngine().precompute(options['top_n'], options['chunk_size'])
+        except ValueError as e:
+            self.stdout.write(self.style.WARNING(f'Nothing was precomputed: {e}'))
+            raise
+        self.stdout.write(self.style.SUCCESS(f'Recommendations stored for {total} users'))
@@ -0,0 +1,71 @@
+"""
+Command to refresh the provider cache for the most popular searches
+"""
+# pylint: disable=E1101
+from datetime                     import timedelta
+from django.core.management.base import BaseCommand
+from django.db.models             import Q
+from django.utils                 import timezone
+from core.api.rate_limit          import background_priority
+from core.services.search_log     import search_log
+from core.services.search_service import SearchService
+from libros.models                import BusquedaPopular
+
+
+class Command(BaseCommand):
+    """
+    Command to prewarm the Google Books and Amazon caches with the top-N
+    searched queries. Schedule it more often than the shortest provider TTL
+    (1 hour for Amazon) so popular queries are refreshed before they expire.
+    Queries go through the same SearchService dispatch as live searches, so
+    structured queries warm the cache entries those searches read. Requests
+    run at background priority: once the spare provider budget is spent the
+    remaining queries fail and are retried on the next run.
+
+    Args:
+        BaseCommand (BaseCommand): Command base class from Django.
+    """
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=50,
+            help='Number of popular queries to refresh',
+        )
+        parser.add_argument(
+            '--max-age',
+            type=int,
+            default=3000,
+            help='Only refresh queries prewarmed more than this many seconds ago',
+        )
+
+    def handle(self, *args, **options):
+        search_log.flush()
+        service = SearchService()
+
+        threshold = timezone.now() - timedelta(seconds=options['max_age'])
+        queries = list(BusquedaPopular.objects.filter(
+            Q(ultimo_precalentamiento__isnull=True) | Q(ultimo_precalentamiento__lt=threshold),
+            ultimos_resultados__gt=0
+        ).order_by('-total_busquedas')[:options['top']])
+
+        self.stdout.write(f'Prewarming {len(queries)} queries...')
+        for popular in queries:
+            query = popular.consulta_normalizada
+            with background_priority():
+                errors = [
+                    error for _, error in (
+                        service.search_google(query, force_refresh=True),
+                        service.search_amazon(query, max_results=10, force_refresh=True),
+                    ) if error
+                ]
+            if errors:
+                for error in errors:
+                    self.stdout.write(
+                        self.style.WARNING(f'Could not prewarm "{query}": {error}')
+                    )
+                continue
+            popular.ultimo_precalentamiento = timezone.now()
+            popular.save(update_fields=['ultimo_precalentamiento'])
+
+        self.stdout.write(self.style.SUCCESS('Search cache prewarmed successfully'))
@@ -0,0 +1,18 @@
+"""
+Command to rebuild the category statistics read model
+"""
+from django.core.management.base  import BaseCommand
+from core.services.category_stats import reconstruir
+
+
+class Command(BaseCommand):
+    """
+    Command to recompute CategoriaStats from the books table. Run it after
+    bulk imports or updates that bypass the Libro signals.
+
+    Args:
+        BaseCommand (BaseCommand): Command base class from Django.
+    """
+    def handle(self, *args, **options):
+        total = reconstruir()
+        self.stdout.write(self.style.SUCCESS(f'Statistics rebuilt for {total} categories'))
@@ -0,0 +1,54 @@
+"""
+Command to rebuild the precomputed similar books
+"""
+from django.core.management.base import BaseCommand
+from core.services.similar_books import (BLOCK_SIZE, COFAVORITOS, CONTENIDO, MAX_DOC_FREQ,
+                                         reconstruir_cofavoritos, reconstruir_contenido)
+
+
+class Command(BaseCommand):
+    """
+    Command to recompute the similar books of every book, from the favorites
+    table and from the book texts. New favorites and new books keep the
+    lists updated as they come; schedule it nightly to also refresh the
+    scores those updates do not touch. Run it once after migrating to
+    0009_libros_similares and 0010_similares_por_contenido, which create
+    the lists empty.
+
+    Args:
+        BaseCommand (BaseCommand): Command base class from Django.
+    """
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only',
+            choices=[COFAVORITOS, CONTENIDO],
+            default=None,
+            help='Rebuild a single kind of list',
+        )
+        parser.add_argument(
+            '--k',
+            type=int,
+            default=None,
+            help='Similar books per book (defaults to SIMILAR_BOOKS_K)',
+        )
+        parser.add_argument(
+            '--block-size',
+            type=int,
+            default=BLOCK_SIZE,
+            help='Books scored per block',
+        )
+        parser.add_argument(
+            '--max-doc-freq',
+            type=int,
+            default=MAX_DOC_FREQ,
+            help='Terms in more books than this are skipped by the content lists',
+        )
+
+    def handle(self, *args, **options):
+        if options['only'] in (None, COFAVORITOS):
+            total = reconstruir_cofavoritos(k=options['k'], block_size=options['block_size'])
+            self.stdout.write(self.style.SUCCESS(f'{total} books with co-favorites'))
+        if options['only'] in (None, CONTENIDO):
+            total = reconstruir_contenido(k=options['k'], block_size=options['block_size'],
+                                          max_doc_freq=options['max_doc_freq'])
+            self.stdout.write(self.style.SUCCESS(f'{total} books with similar content'))
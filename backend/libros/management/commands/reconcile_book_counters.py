@@ -0,0 +1,26 @@
+"""
+Command to repair the denormalized popularity counters of the books
+"""
+from django.core.management.base import BaseCommand
+from core.services.book_counters import reconciliar
+
+
+class Command(BaseCommand):
+    """
+    Command to recompute the favorite and review counters of every book and
+    fix the ones that drifted, e.g. after bulk deletes that skip signals.
+
+    Args:
+        BaseCommand (BaseCommand): Command base class from Django.
+    """
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Books processed per batch',
+        )
+
+    def handle(self, *args, **options):
+        reparados = reconciliar(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Counters repaired for {reparados} books'))
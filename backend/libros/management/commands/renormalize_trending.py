@@ -0,0 +1,18 @@
+"""
+Command to recompute the trending scores
+"""
+from django.core.management.base import BaseCommand
+from core.services.trending      import reconstruir
+
+
+class Command(BaseCommand):
+    """
+    Command to move the trending epoch to the present, recomputing every
+    score from the favorites table. Schedule it daily.
+
+    Args:
+        BaseCommand (BaseCommand): Command base class from Django.
+    """
+    def handle(self, *args, **options):
+        total = reconstruir()
+        self.stdout.write(self.style.SUCCESS(f'{total} books trending'))
@@ -1,8 +1,10 @@
 """
 Commands for training recommendation models
 """
-from django.core.management.base import BaseCommand
-from core.services.recommendation_service import RecomendationEngine
+from django.conf                          import settings
+from django.core.management.base          import BaseCommand
+from core.services.ann_index              import sample_recall
+from core.services.recommendation_service import DEFAULT_NEIGHBORS, RecomendationEngine
 
 
 class Command(BaseCommand):
@@ -18,6 +20,13 @@ class Command(BaseCommand):
             action='store_true',
             help='Force the retraining even though an existing model is present',
         )
+        parser.add_argument(
+            '--recall',
+            type=int,
+            default=0,
+            metavar='SAMPLE',
+            help='Measure the recall@K of the LSH index against an exact search on SAMPLE users',
+        )
 
     def handle(self, *args, **options):
         self.stdout.write('Starting recommendation model training...')
@@ -32,6 +41,10 @@ class Command(BaseCommand):
             self.stdout.write(
                 f'Users in the model: {len(engine.user_ids)}'
             )
+            if options['recall']:
+                k = getattr(settings, 'RECOMMENDATION_NEIGHBORS', DEFAULT_NEIGHBORS)
+                recall = sample_recall(engine.index, k, options['recall'])
+                self.stdout.write(f'LSH recall@{k}: {recall:.3f}')
         except ValueError as e:
             self.stdout.write(
                 self.style.WARNING(f'The model was not trained: {e}')
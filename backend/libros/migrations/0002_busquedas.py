@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BusquedaPopular',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('consulta_normalizada', models.CharField(max_length=255, unique=True, verbose_name='Consulta Normalizada')),
+                ('total_busquedas', models.PositiveIntegerField(db_index=True, default=0, verbose_name='Total de Búsquedas')),
+                ('ultimos_resultados', models.PositiveIntegerField(default=0, help_text='Total de resultados de la búsqueda más reciente.', verbose_name='Últimos Resultados')),
+                ('ultima_busqueda', models.DateTimeField(verbose_name='Última Búsqueda')),
+                ('ultimo_precalentamiento', models.DateTimeField(blank=True, help_text='Fecha en que se refrescó la caché de esta consulta.', null=True, verbose_name='Último Precalentamiento')),
+            ],
+            options={
+                'verbose_name': 'Búsqueda Popular',
+                'verbose_name_plural': 'Búsquedas Populares',
+                'ordering': ['-total_busquedas'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BusquedaRegistro',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('consulta', models.CharField(help_text='La consulta tal y como la escribió el usuario.', max_length=255, verbose_name='Consulta')),
+                ('consulta_normalizada', models.CharField(db_index=True, help_text='La consulta en minúsculas y sin espacios repetidos.', max_length=255, verbose_name='Consulta Normalizada')),
+                ('resultados_db', models.PositiveIntegerField(default=0, verbose_name='Resultados en Base de Datos')),
+                ('resultados_google', models.PositiveIntegerField(default=0, verbose_name='Resultados en Google Books')),
+                ('resultados_amazon', models.PositiveIntegerField(default=0, verbose_name='Resultados en Amazon')),
+                ('latencia_db_ms', models.FloatField(blank=True, null=True, verbose_name='Latencia de Base de Datos (ms)')),
+                ('latencia_google_ms', models.FloatField(blank=True, null=True, verbose_name='Latencia de Google Books (ms)')),
+                ('latencia_amazon_ms', models.FloatField(blank=True, null=True, verbose_name='Latencia de Amazon (ms)')),
+                ('fecha', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Fecha de Búsqueda')),
+            ],
+            options={
+                'verbose_name': 'Registro de Búsqueda',
+                'verbose_name_plural': 'Registros de Búsqueda',
+            },
+        ),
+    ]
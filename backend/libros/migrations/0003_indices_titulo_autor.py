@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0002_busquedas'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='libro',
+            name='autor',
+            field=models.CharField(db_index=True, help_text='Ingrese el nombre del autor (máximo 100 caracteres).', max_length=100, verbose_name='Autor'),
+        ),
+        migrations.AlterField(
+            model_name='libro',
+            name='titulo',
+            field=models.CharField(db_index=True, help_text='Ingrese el título del libro (máximo 200 caracteres).', max_length=200, verbose_name='Título'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0003_indices_titulo_autor'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(fields=['categoria', 'disponible', '-calificacion'], name='libro_categoria_calif_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Q, Sum
+
+
+def poblar_estadisticas(apps, schema_editor):
+    Categoria = apps.get_model('libros', 'Categoria')
+    CategoriaStats = apps.get_model('libros', 'CategoriaStats')
+    disponibles = Q(libros__disponible=True)
+    calificados = Q(libros__disponible=True, libros__calificacion__isnull=False)
+    categorias = Categoria.objects.annotate(
+        n_total=Count('libros'),
+        n_disponibles=Count('libros', filter=disponibles),
+        n_calificados=Count('libros', filter=calificados),
+        suma=Sum('libros__calificacion', filter=calificados),
+        minimo=Min('libros__precio', filter=disponibles),
+        maximo=Max('libros__precio', filter=disponibles),
+    )
+    CategoriaStats.objects.bulk_create([
+        CategoriaStats(
+            categoria_id=categoria.id,
+            total_libros=categoria.n_total,
+            libros_disponibles=categoria.n_disponibles,
+            libros_calificados=categoria.n_calificados,
+            suma_calificaciones=categoria.suma or 0.0,
+            precio_minimo=categoria.minimo,
+            precio_maximo=categoria.maximo,
+        )
+        for categoria in categorias
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0004_indice_categoria_calificacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoriaStats',
+            fields=[
+                ('categoria', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='estadisticas', serialize=False, to='libros.categoria', verbose_name='Categoría')),
+                ('total_libros', models.PositiveIntegerField(default=0, verbose_name='Total de Libros')),
+                ('libros_disponibles', models.PositiveIntegerField(default=0, verbose_name='Libros Disponibles')),
+                ('libros_calificados', models.PositiveIntegerField(default=0, help_text='Libros disponibles con calificación.', verbose_name='Libros Calificados')),
+                ('suma_calificaciones', models.FloatField(default=0.0, verbose_name='Suma de Calificaciones')),
+                ('precio_minimo', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Precio Mínimo')),
+                ('precio_maximo', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Precio Máximo')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True, verbose_name='Fecha de Actualización')),
+            ],
+            options={
+                'verbose_name': 'Estadísticas de Categoría',
+                'verbose_name_plural': 'Estadísticas de Categorías',
+            },
+        ),
+        migrations.RunPython(poblar_estadisticas, migrations.RunPython.noop),
+    ]
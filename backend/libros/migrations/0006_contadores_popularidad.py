@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0005_estadisticas_categoria'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='libro',
+            name='promedio_resenas',
+            field=models.FloatField(default=0.0, editable=False, help_text='Calificación media de las reseñas del libro.', verbose_name='Promedio de Reseñas'),
+        ),
+        migrations.AddField(
+            model_name='libro',
+            name='total_favoritos',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, help_text='Número de usuarios que marcaron el libro como favorito.', verbose_name='Total de Favoritos'),
+        ),
+        migrations.AddField(
+            model_name='libro',
+            name='total_resenas',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Total de Reseñas'),
+        ),
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(fields=['categoria', 'disponible', '-total_favoritos'], name='libro_categoria_favs_idx'),
+        ),
+    ]
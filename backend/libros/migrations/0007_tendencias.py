@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0006_contadores_popularidad'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EpocaTendencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('referencia', models.DateTimeField(help_text='Momento respecto al cual se expresan las puntuaciones.', verbose_name='Referencia')),
+            ],
+            options={
+                'verbose_name': 'Época de Tendencias',
+                'verbose_name_plural': 'Épocas de Tendencias',
+            },
+        ),
+        migrations.CreateModel(
+            name='TendenciaLibro',
+            fields=[
+                ('libro', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='tendencia', serialize=False, to='libros.libro', verbose_name='Libro')),
+                ('puntuacion', models.FloatField(db_index=True, default=0.0, verbose_name='Puntuación')),
+                ('categoria', models.ForeignKey(blank=True, help_text='Copia de la categoría del libro para filtrar sin joins.', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='tendencias', to='libros.categoria', verbose_name='Categoría')),
+            ],
+            options={
+                'verbose_name': 'Tendencia de Libro',
+                'verbose_name_plural': 'Tendencias de Libros',
+                'indexes': [models.Index(fields=['categoria', '-puntuacion'], name='tendencia_categoria_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 06:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0007_tendencias'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categoria',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True, help_text='Fecha y hora de la última actualización del registro.', verbose_name='Fecha de Actualización'),
+        ),
+    ]
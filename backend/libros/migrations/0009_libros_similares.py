@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-19 06:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0008_fecha_actualizacion_categoria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibroSimilar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origen', models.CharField(choices=[('cofavoritos', 'Favoritos en común')], max_length=20, verbose_name='Origen')),
+                ('posicion', models.PositiveSmallIntegerField(help_text='Lugar del libro similar en la lista, desde 0.', verbose_name='Posición')),
+                ('puntuacion', models.FloatField(verbose_name='Puntuación')),
+                ('libro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similares', to='libros.libro', verbose_name='Libro')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_de', to='libros.libro', verbose_name='Libro Similar')),
+            ],
+            options={
+                'verbose_name': 'Libro Similar',
+                'verbose_name_plural': 'Libros Similares',
+                'constraints': [models.UniqueConstraint(fields=('libro', 'origen', 'posicion'), name='libro_similar_posicion')],
+            },
+        ),
+    ]
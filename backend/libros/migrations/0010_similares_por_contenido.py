@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 06:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0009_libros_similares'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='librosimilar',
+            name='origen',
+            field=models.CharField(choices=[('cofavoritos', 'Favoritos en común'), ('contenido', 'Contenido similar')], max_length=20, verbose_name='Origen'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.4 on 2026-10-19 06:56
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Frozen copy of core.services.query_parser.word_tokens as of this migration
+def word_tokens(text):
+    text = ''.join(c for c in unicodedata.normalize('NFKD', text or '') if not unicodedata.combining(c))
+    words = re.findall(r'\w+', text.casefold())
+    return list(dict.fromkeys(word[:50] for word in words))
+
+
+def indexar_palabras(apps, schema_editor):
+    Libro = apps.get_model('libros', 'Libro')
+    PalabraLibro = apps.get_model('libros', 'PalabraLibro')
+    palabras = []
+    for libro_id, titulo, autor in Libro.objects.order_by().values_list(
+            'id', 'titulo', 'autor').iterator(chunk_size=5000):
+        palabras.extend(
+            PalabraLibro(libro_id=libro_id, campo=campo, palabra=palabra)
+            for campo, texto in (('titulo', titulo), ('autor', autor))
+            for palabra in word_tokens(texto)
+        )
+        if len(palabras) >= 10000:
+            PalabraLibro.objects.bulk_create(palabras)
+            palabras = []
+    PalabraLibro.objects.bulk_create(palabras)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0010_similares_por_contenido'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PalabraLibro',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('campo', models.CharField(choices=[('titulo', 'Título'), ('autor', 'Autor')], max_length=10, verbose_name='Campo')),
+                ('palabra', models.CharField(db_index=True, max_length=50, verbose_name='Palabra')),
+                ('libro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='palabras', to='libros.libro', verbose_name='Libro')),
+            ],
+            options={
+                'verbose_name': 'Palabra de Libro',
+                'verbose_name_plural': 'Palabras de Libros',
+            },
+        ),
+        migrations.RunPython(indexar_palabras, migrations.RunPython.noop),
+    ]
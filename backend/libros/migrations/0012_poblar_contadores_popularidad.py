@@ -0,0 +1,35 @@
+from django.db import migrations
+from django.db.models import Avg, Count, FloatField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def poblar_contadores(apps, schema_editor):
+    Libro = apps.get_model('libros', 'Libro')
+    Resena = apps.get_model('libros', 'Resena')
+    resenas = Resena.objects.filter(libro=OuterRef('pk')).order_by().values('libro')
+    Libro.objects.update(
+        total_resenas=Coalesce(Subquery(resenas.annotate(total=Count('id')).values('total')), 0),
+        promedio_resenas=Coalesce(Subquery(resenas.annotate(media=Avg('calificacion')).values('media')),
+                                  Value(0.0), output_field=FloatField()),
+    )
+    # profiles has no migrations, so its table is read directly if it exists
+    connection = schema_editor.connection
+    if 'profiles_favorito' not in connection.introspection.table_names():
+        return
+    libros = connection.ops.quote_name(Libro._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {libros} SET total_favoritos = ('
+            f'SELECT COUNT(*) FROM profiles_favorito WHERE profiles_favorito.libro_id = {libros}.id)'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0011_palabras_libro'),
+    ]
+
+    operations = [
+        migrations.RunPython(poblar_contadores, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,10 @@
 """
 Models for the Books application.
 """
-from django.db              import models
-from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db                    import models
+from django.db.models             import F, Window
+from django.db.models.functions   import RowNumber
+from django.core.validators       import MinValueValidator, MaxValueValidator
 
 
 class Categoria(models.Model):
@@ -27,6 +29,11 @@ class Categoria(models.Model):
         verbose_name = "Activa",
         help_text    = "Indica si la categoría está activa."
     )
+    fecha_actualizacion = models.DateTimeField(
+        auto_now     = True,
+        verbose_name = "Fecha de Actualización",
+        help_text    = "Fecha y hora de la última actualización del registro."
+    )
 
     class Meta:
         """
@@ -39,6 +46,42 @@ class Categoria(models.Model):
         return str(self.nombre)
 
 
+CONTADORES_POPULARIDAD = ('total_favoritos', 'total_resenas', 'promedio_resenas')
+
+
+class LibroQuerySet(models.QuerySet):
+    """
+    QuerySet with the reusable book listings.
+    """
+
+    def top_por_categoria(self: 'LibroQuerySet', n: int, *orden: str) -> 'LibroQuerySet':
+        """
+        Gets the first N books of every category in a single query, ranking
+        them with ROW_NUMBER() OVER (PARTITION BY categoria_id ...).
+
+        Args:
+            n (int): Maximum number of books per category.
+            *orden (str): Ranking fields, '-' for descending. Defaults to the
+                best rated first.
+
+        Returns:
+            LibroQuerySet: The books, ordered by category and rank, annotated
+                with 'rango'.
+        """
+        orden = orden or ('-calificacion',)
+        ranking = [
+            F(campo[1:]).desc() if campo.startswith('-') else F(campo).asc()
+            for campo in orden
+        ] + [F('id').asc()]
+        return self.annotate(
+            rango=Window(
+                expression   = RowNumber(),
+                partition_by = [F('categoria_id')],
+                order_by     = ranking,
+            )
+        ).filter(rango__lte=n).order_by('categoria_id', 'rango')
+
+
 class Libro(models.Model):
     """
     Models that represents the book in the system.
@@ -52,11 +95,13 @@ class Libro(models.Model):
     )
     titulo = models.CharField(
         max_length   = 200,
+        db_index     = True,
         verbose_name = "Título",
         help_text    = "Ingrese el título del libro (máximo 200 caracteres)."
     )
     autor = models.CharField(
         max_length   = 100,
+        db_index     = True,
         verbose_name = "Autor",
         help_text    = "Ingrese el nombre del autor (máximo 100 caracteres)."
     )
@@ -115,11 +160,59 @@ class Libro(models.Model):
         verbose_name="Fecha de Actualización",
         help_text="Fecha y hora de la última actualización del registro."
     )
+    total_favoritos = models.PositiveIntegerField(
+        default      = 0,
+        db_index     = True,
+        editable     = False,
+        verbose_name = "Total de Favoritos",
+        help_text    = "Número de usuarios que marcaron el libro como favorito."
+    )
+    total_resenas = models.PositiveIntegerField(
+        default      = 0,
+        editable     = False,
+        verbose_name = "Total de Reseñas"
+    )
+    promedio_resenas = models.FloatField(
+        default      = 0.0,
+        editable     = False,
+        verbose_name = "Promedio de Reseñas",
+        help_text    = "Calificación media de las reseñas del libro."
+    )
+
+    objects = LibroQuerySet.as_manager()
 
     class Meta:
         verbose_name        = "Libro"
         verbose_name_plural = "Libros"
         ordering            = ['-fecha_creacion']
+        indexes             = [
+            models.Index(
+                fields = ['categoria', 'disponible', '-calificacion'],
+                name   = 'libro_categoria_calif_idx',
+            ),
+            models.Index(
+                fields = ['categoria', 'disponible', '-total_favoritos'],
+                name   = 'libro_categoria_favs_idx',
+            ),
+        ]
+
+    def save(self: 'Libro', *args, **kwargs) -> None:
+        """
+        Saves the book without overwriting the popularity counters, which are
+        only written with F-expressions by the Favorito and Resena signals,
+        unless the caller lists them in update_fields. Updates of an existing
+        book default update_fields to its loaded fields minus the counters,
+        so saving a book whose row was deleted raises DatabaseError.
+        """
+        if (not args and kwargs.get('update_fields') is None and not kwargs.get('force_insert')
+                and not self._state.adding):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in deferred
+                and field.name not in CONTADORES_POPULARIDAD
+            ]
+        super().save(*args, **kwargs)
 
     def __str__(self: 'Libro') -> str:
         return f"{self.titulo} - {self.autor}"
@@ -215,6 +308,311 @@ class Resena(models.Model):
     def __str__(self: 'Resena') -> str:
         return f"Reseña de {self.autor_resena} para {self.libro.titulo}"
 
+class BusquedaRegistro(models.Model):
+    """
+    Model that represents a search made by a user, with the result counts
+    and the latency of every provider.
+    """
+    consulta = models.CharField(
+        max_length   = 255,
+        verbose_name = "Consulta",
+        help_text    = "La consulta tal y como la escribió el usuario."
+    )
+    consulta_normalizada = models.CharField(
+        max_length   = 255,
+        db_index     = True,
+        verbose_name = "Consulta Normalizada",
+        help_text    = "La consulta en minúsculas y sin espacios repetidos."
+    )
+    resultados_db = models.PositiveIntegerField(
+        default      = 0,
+        verbose_name = "Resultados en Base de Datos"
+    )
+    resultados_google = models.PositiveIntegerField(
+        default      = 0,
+        verbose_name = "Resultados en Google Books"
+    )
+    resultados_amazon = models.PositiveIntegerField(
+        default      = 0,
+        verbose_name = "Resultados en Amazon"
+    )
+    latencia_db_ms = models.FloatField(
+        blank        = True,
+        null         = True,
+        verbose_name = "Latencia de Base de Datos (ms)"
+    )
+    latencia_google_ms = models.FloatField(
+        blank        = True,
+        null         = True,
+        verbose_name = "Latencia de Google Books (ms)"
+    )
+    latencia_amazon_ms = models.FloatField(
+        blank        = True,
+        null         = True,
+        verbose_name = "Latencia de Amazon (ms)"
+    )
+    fecha = models.DateTimeField(
+        auto_now_add = True,
+        db_index     = True,
+        verbose_name = "Fecha de Búsqueda"
+    )
+
+    class Meta:
+        verbose_name        = "Registro de Búsqueda"
+        verbose_name_plural = "Registros de Búsqueda"
+
+    def __str__(self: 'BusquedaRegistro') -> str:
+        return f"{self.consulta_normalizada} ({self.fecha})"
+
+
+class BusquedaPopular(models.Model):
+    """
+    Model that aggregates the search log by normalized query.
+    """
+    consulta_normalizada = models.CharField(
+        max_length   = 255,
+        unique       = True,
+        verbose_name = "Consulta Normalizada"
+    )
+    total_busquedas = models.PositiveIntegerField(
+        default      = 0,
+        db_index     = True,
+        verbose_name = "Total de Búsquedas"
+    )
+    ultimos_resultados = models.PositiveIntegerField(
+        default      = 0,
+        verbose_name = "Últimos Resultados",
+        help_text    = "Total de resultados de la búsqueda más reciente."
+    )
+    ultima_busqueda = models.DateTimeField(
+        verbose_name = "Última Búsqueda"
+    )
+    ultimo_precalentamiento = models.DateTimeField(
+        blank        = True,
+        null         = True,
+        verbose_name = "Último Precalentamiento",
+        help_text    = "Fecha en que se refrescó la caché de esta consulta."
+    )
+
+    class Meta:
+        verbose_name        = "Búsqueda Popular"
+        verbose_name_plural = "Búsquedas Populares"
+        ordering            = ['-total_busquedas']
+
+    def __str__(self: 'BusquedaPopular') -> str:
+        return f"{self.consulta_normalizada} ({self.total_busquedas})"
+
+
+class CategoriaStats(models.Model):
+    """
+    Read model with the statistics of a category. Counts and sums are
+    maintained incrementally by the Libro signals; the average rating and
+    the price range only consider available books, as the listings do.
+    """
+    categoria = models.OneToOneField(
+        Categoria,
+        on_delete    = models.CASCADE,
+        primary_key  = True,
+        related_name = "estadisticas",
+        verbose_name = "Categoría"
+    )
+    total_libros = models.PositiveIntegerField(
+        default      = 0,
+        verbose_name = "Total de Libros"
+    )
+    libros_disponibles = models.PositiveIntegerField(
+        default      = 0,
+        verbose_name = "Libros Disponibles"
+    )
+    libros_calificados = models.PositiveIntegerField(
+        default      = 0,
+        verbose_name = "Libros Calificados",
+        help_text    = "Libros disponibles con calificación."
+    )
+    suma_calificaciones = models.FloatField(
+        default      = 0.0,
+        verbose_name = "Suma de Calificaciones"
+    )
+    precio_minimo = models.DecimalField(
+        max_digits     = 10,
+        decimal_places = 2,
+        blank          = True,
+        null           = True,
+        verbose_name   = "Precio Mínimo"
+    )
+    precio_maximo = models.DecimalField(
+        max_digits     = 10,
+        decimal_places = 2,
+        blank          = True,
+        null           = True,
+        verbose_name   = "Precio Máximo"
+    )
+    fecha_actualizacion = models.DateTimeField(
+        auto_now     = True,
+        verbose_name = "Fecha de Actualización"
+    )
+
+    class Meta:
+        verbose_name        = "Estadísticas de Categoría"
+        verbose_name_plural = "Estadísticas de Categorías"
+
+    @property
+    def calificacion_promedio(self: 'CategoriaStats') -> float:
+        """
+        Average rating of the available books of the category.
+        """
+        if not self.libros_calificados:
+            return 0.0
+        return self.suma_calificaciones / self.libros_calificados
+
+    def __str__(self: 'CategoriaStats') -> str:
+        return f"Estadísticas de {self.categoria_id} ({self.total_libros} libros)"
+
+
+class EpocaTendencia(models.Model):
+    """
+    Single-row table with the reference time of the trending scores. Scores
+    are stored relative to it so favorite events only add to them; moving it
+    forward re-normalizes every score.
+    """
+    referencia = models.DateTimeField(
+        verbose_name = "Referencia",
+        help_text    = "Momento respecto al cual se expresan las puntuaciones."
+    )
+
+    class Meta:
+        verbose_name        = "Época de Tendencias"
+        verbose_name_plural = "Épocas de Tendencias"
+
+    def __str__(self: 'EpocaTendencia') -> str:
+        return f"Tendencias desde {self.referencia}"
+
+
+class TendenciaLibro(models.Model):
+    """
+    Trending score of a book: the sum of its favorite events weighted by an
+    exponential decay, scaled to EpocaTendencia.referencia.
+    """
+    libro = models.OneToOneField(
+        Libro,
+        on_delete    = models.CASCADE,
+        primary_key  = True,
+        related_name = "tendencia",
+        verbose_name = "Libro"
+    )
+    categoria = models.ForeignKey(
+        Categoria,
+        on_delete    = models.CASCADE,
+        blank        = True,
+        null         = True,
+        related_name = "tendencias",
+        verbose_name = "Categoría",
+        help_text    = "Copia de la categoría del libro para filtrar sin joins."
+    )
+    puntuacion = models.FloatField(
+        default      = 0.0,
+        db_index     = True,
+        verbose_name = "Puntuación"
+    )
+
+    class Meta:
+        verbose_name        = "Tendencia de Libro"
+        verbose_name_plural = "Tendencias de Libros"
+        indexes             = [
+            models.Index(
+                fields = ['categoria', '-puntuacion'],
+                name   = 'tendencia_categoria_idx',
+            ),
+        ]
+
+    def __str__(self: 'TendenciaLibro') -> str:
+        return f"Tendencia de {self.libro_id}: {self.puntuacion:.3f}"
+
+
+class LibroSimilar(models.Model):
+    """
+    One of the K most similar books of a book, precomputed so the similar
+    books are a single index range scan. Each origin of the similarity
+    keeps its own list.
+    """
+    class Origen(models.TextChoices):
+        COFAVORITOS = 'cofavoritos', 'Favoritos en común'
+        CONTENIDO   = 'contenido', 'Contenido similar'
+
+    libro = models.ForeignKey(
+        Libro,
+        on_delete    = models.CASCADE,
+        related_name = "similares",
+        verbose_name = "Libro"
+    )
+    similar = models.ForeignKey(
+        Libro,
+        on_delete    = models.CASCADE,
+        related_name = "similar_de",
+        verbose_name = "Libro Similar"
+    )
+    origen = models.CharField(
+        max_length   = 20,
+        choices      = Origen.choices,
+        verbose_name = "Origen"
+    )
+    posicion = models.PositiveSmallIntegerField(
+        verbose_name = "Posición",
+        help_text    = "Lugar del libro similar en la lista, desde 0."
+    )
+    puntuacion = models.FloatField(
+        verbose_name = "Puntuación"
+    )
+
+    class Meta:
+        verbose_name        = "Libro Similar"
+        verbose_name_plural = "Libros Similares"
+        constraints         = [
+            models.UniqueConstraint(
+                fields = ['libro', 'origen', 'posicion'],
+                name   = 'libro_similar_posicion',
+            ),
+        ]
+
+    def __str__(self: 'LibroSimilar') -> str:
+        return f"{self.libro_id} ~ {self.similar_id} ({self.origen}, {self.puntuacion:.3f})"
+
+
+class PalabraLibro(models.Model):
+    """
+    A word of the title or author of a book, lowercased and without accents,
+    so both fields are matched at the start of any word with a prefix
+    lookup on an indexed column instead of a scan.
+    """
+    class Campo(models.TextChoices):
+        TITULO = 'titulo', 'Título'
+        AUTOR  = 'autor', 'Autor'
+
+    libro = models.ForeignKey(
+        Libro,
+        on_delete    = models.CASCADE,
+        related_name = "palabras",
+        verbose_name = "Libro"
+    )
+    campo = models.CharField(
+        max_length   = 10,
+        choices      = Campo.choices,
+        verbose_name = "Campo"
+    )
+    palabra = models.CharField(
+        max_length   = 50,
+        db_index     = True,
+        verbose_name = "Palabra"
+    )
+
+    class Meta:
+        verbose_name        = "Palabra de Libro"
+        verbose_name_plural = "Palabras de Libros"
+
+    def __str__(self: 'PalabraLibro') -> str:
+        return f"{self.libro_id} {self.campo}: {self.palabra}"
+
+
 def crear_categorias_por_defecto():
     """Create default categories if they do not exist."""
     categorias = [
@@ -237,10 +635,130 @@ def crear_categorias_por_defecto():
 """
 Signals to handle post-migration actions.
 """
-from django.db.models.signals import post_migrate
+from django.db.models.signals import post_migrate, pre_save, post_save, post_delete
 from django.dispatch import receiver
 
 @receiver(post_migrate)
 def ejecutar_despues_migracion(sender, **kwargs):
     if sender.name == 'libros':
-        crear_categorias_por_defecto()
\ No newline at end of file
+        crear_categorias_por_defecto()
+
+
+@receiver(pre_save, sender=Libro)
+def guardar_estado_previo_libro(sender, instance, **kwargs):
+    """
+    Keeps the stored state of a book so post_save can apply the difference
+    to the category statistics.
+    """
+    from core.services.category_stats import contribucion_guardada
+    instance._contribucion_previa = contribucion_guardada(instance.pk)
+
+
+@receiver(post_save, sender=Libro)
+def actualizar_estadisticas_libro(sender, instance, **kwargs):
+    """
+    Applies a book insert or update to the category statistics.
+    """
+    from core.services.category_stats import aplicar_cambio, contribucion
+    aplicar_cambio(getattr(instance, '_contribucion_previa', None), contribucion(instance))
+
+
+@receiver(post_save, sender=Libro)
+def indexar_palabras_libro(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Rewrites the title and author words of a book when they may have changed.
+    """
+    if update_fields is not None and not {'titulo', 'autor'} & set(update_fields):
+        return
+    from core.services.query_parser import word_tokens
+    if not created:
+        PalabraLibro.objects.filter(libro=instance).delete()
+    PalabraLibro.objects.bulk_create([
+        PalabraLibro(libro=instance, campo=campo, palabra=palabra)
+        for campo, texto in ((PalabraLibro.Campo.TITULO, instance.titulo),
+                             (PalabraLibro.Campo.AUTOR, instance.autor))
+        for palabra in word_tokens(texto)
+    ])
+
+
+@receiver(post_save, sender=Libro)
+def mover_tendencia_libro(sender, instance, created, **kwargs):
+    """
+    Keeps the category copied into TendenciaLibro in sync with the book.
+    """
+    previa = getattr(instance, '_contribucion_previa', None)
+    categoria_previa = previa[0] if previa else None
+    if not created and categoria_previa != instance.categoria_id:
+        TendenciaLibro.objects.filter(libro_id=instance.pk).update(
+            categoria_id=instance.categoria_id)
+
+
+@receiver(post_delete, sender=Libro)
+def descontar_estadisticas_libro(sender, instance, **kwargs):
+    """
+    Removes a deleted book from the category statistics.
+    """
+    from core.services.category_stats import aplicar_cambio, contribucion
+    aplicar_cambio(contribucion(instance), None)
+
+
+@receiver([post_save, post_delete], sender=Libro)
+@receiver([post_save, post_delete], sender=Categoria)
+@receiver([post_save, post_delete], sender=FuenteLibro)
+def invalidar_fragmentos_catalogo(sender, instance, **kwargs):
+    """
+    Invalidates the cached page fragments built from the catalog.
+    """
+    from core.services.fragment_cache import CATALOG_VERSION, bump_version
+    bump_version(CATALOG_VERSION)
+
+
+@receiver([post_save, post_delete], sender=Libro)
+@receiver([post_save, post_delete], sender=FuenteLibro)
+def invalidar_detalle_libro(sender, instance, **kwargs):
+    """
+    Drops the cached detail payload of the book that was written.
+    """
+    from core.services.book_detail import invalidate_detail
+    invalidate_detail(instance.pk if sender is Libro else instance.libro_id)
+
+
+@receiver(post_save, sender=Libro)
+def calcular_similares_contenido(sender, instance, created, **kwargs):
+    """
+    Schedules the content-based similar books of a new book, which has no
+    favorites to find co-favorites from yet.
+    """
+    if created and not kwargs.get('raw'):
+        from core.services.similar_books import actualizar_contenido, similar_updates
+        similar_updates.schedule(actualizar_contenido, instance.pk)
+
+
+@receiver(pre_save, sender=Resena)
+def guardar_estado_previo_resena(sender, instance, **kwargs):
+    """
+    Keeps the stored book and rating of a review being updated.
+    """
+    instance._resena_previa = None
+    if instance.pk is not None:
+        instance._resena_previa = Resena.objects.filter(pk=instance.pk).values_list(
+            'libro_id', 'calificacion').first()
+
+
+@receiver(post_save, sender=Resena)
+def contar_resena(sender, instance, **kwargs):
+    """
+    Applies a review insert or update to the book counters.
+    """
+    from core.services.book_counters import mover_resena
+    mover_resena(getattr(instance, '_resena_previa', None),
+                 (instance.libro_id, float(instance.calificacion)))
+
+
+@receiver(post_delete, sender=Resena)
+def descontar_resena(sender, instance, **kwargs):
+    """
+    Removes a deleted review from the book counters.
+    """
+    from core.services.book_counters import mover_resena
+    mover_resena((instance.libro_id, float(instance.calificacion)), None)
\ No newline at end of file
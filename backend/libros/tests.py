@@ -1,8 +1,25 @@
 """
 Unit tests for the 'libros' app models.
 """
-from django.test  import TestCase
-from .models 	  import Categoria, Libro, FuenteLibro, Resena
+import json
+from io            import StringIO
+from unittest.mock import patch
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db     import DatabaseError, connection
+from django.test   import TestCase
+from django.urls   import reverse
+from django.utils  import timezone
+from core.services.book_card      import BookCard, card_queryset, decode_cards, encode_cards
+from core.services.book_counters  import reconciliar
+from core.services.category_stats import reconstruir
+from core.services.query_parser   import normalize_isbn, parse_query
+from core.services.search_log     import SearchQueryLog, normalize_query
+from core.services.search_service import SearchService
+from core.services.semantic_search import CatalogVectorIndex
+from core.api.rate_limit           import RateLimiter, get_limiter
+from .models 	   import (Categoria, Libro, FuenteLibro, Resena, BusquedaPopular, BusquedaRegistro,
+						   CategoriaStats)
 
 
 class CategoriaModelTest(TestCase):
@@ -144,3 +161,821 @@ class ResenaModelTest(TestCase):
 		self.assertEqual(resena.fuente_resena, 'Goodreads')
 		self.assertEqual(resena.calificacion, 5.0)
 		self.assertEqual(resena.autor_resena, 'Pedro López')
+
+
+class BookSearchStreamTest(TestCase):
+	"""
+	Test cases for the streaming book search endpoint.
+	"""
+	def setUp(self: 'BookSearchStreamTest') -> None:
+		"""
+		Set up a book that matches the search.
+		"""
+		self.categoria: Categoria = Categoria.objects.create(nombre='Novela', activa=True)
+		self.libro: Libro = Libro.objects.create(
+			categoria		  = self.categoria,
+			titulo			  = 'Ficciones',
+			autor		      = 'Jorge Luis Borges',
+			isbn		      = '9780307474728',
+			fecha_publicacion = '1944-01-01',
+			paginas			  = 200,
+			precio			  = 20.0,
+			disponible		  = True
+		)
+
+	@patch('core.services.search_service.detail_prefetcher.enqueue')
+	@patch('core.services.search_service.SearchService.search_amazon',
+		   return_value=([{'source': 'Amazon', 'id': 'a1', 'title': 'A'}], None))
+	@patch('core.services.search_service.SearchService.search_google',
+		   return_value=([], 'Sin resultados'))
+	def test_database_batch_comes_first(self: 'BookSearchStreamTest', *mocks) -> None:
+		"""
+		Test that the database hits are emitted before the provider batches.
+		"""
+		response = self.client.get(reverse('book_search_stream'), {'q': 'Ficciones'})
+		self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+		events = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+		self.assertEqual(events[0]['event'], 'database')
+		self.assertEqual(events[0]['books'][0]['id'], self.libro.id)
+		self.assertEqual({e['event'] for e in events[1:-1]}, {'google', 'amazon'})
+		self.assertEqual(events[-1], {'event': 'done', 'total_results': 2})
+
+	@patch('core.services.search_service.detail_prefetcher.enqueue')
+	def test_deadline_covers_all_providers(self: 'BookSearchStreamTest', *mocks) -> None:
+		"""
+		Test that a provider finishing near the deadline does not extend it
+		for the next one.
+		"""
+		import time
+		def provider(delay: float):
+			return lambda query: (time.sleep(delay), ([], None))[1]
+		providers = {'google': provider(0.3), 'amazon': provider(0.6)}
+		with patch.object(SearchService, 'providers', return_value=providers):
+			events = list(SearchService().stream('Ficciones', deadline=0.45))
+
+		errors = {event['event']: event.get('error') for event in events}
+		self.assertIsNone(errors['google'])
+		self.assertEqual(errors['amazon'], 'Tiempo de espera agotado')
+
+	def test_query_is_required(self: 'BookSearchStreamTest') -> None:
+		"""
+		Test that an empty query is rejected.
+		"""
+		response = self.client.get(reverse('book_search_stream'))
+		self.assertEqual(response.status_code, 400)
+
+
+class SearchQueryLogTest(TestCase):
+	"""
+	Test cases for the buffered search query log.
+	"""
+	def test_normalize_query(self: 'SearchQueryLogTest') -> None:
+		"""
+		Test that case and repeated whitespace are normalized.
+		"""
+		self.assertEqual(normalize_query('  Cien   Años de SOLEDAD '), 'cien años de soledad')
+
+	def test_flush_aggregates_popularity(self: 'SearchQueryLogTest') -> None:
+		"""
+		Test that searches are buffered, a full buffer wakes the flush thread
+		instead of writing on the request, and they are aggregated on flush.
+		"""
+		search_log = SearchQueryLog(flush_size=3, flush_interval=3600)
+		with patch.object(search_log, '_ensure_worker') as ensure_worker:
+			search_log.record('Borges', {'db': (1, 2.0), 'google': (10, 120.0)})
+			search_log.record('borges ', {'db': (1, 1.5)})
+			ensure_worker.assert_not_called()
+
+			search_log.record('Dune', {'amazon': (3, 300.0)})
+			ensure_worker.assert_called_once()
+		self.assertEqual(BusquedaRegistro.objects.count(), 0)
+		self.assertEqual(search_log.flush(), 3)
+		self.assertEqual(BusquedaRegistro.objects.count(), 3)
+		popular = BusquedaPopular.objects.get(consulta_normalizada='borges')
+		self.assertEqual(popular.total_busquedas, 2)
+
+		search_log.record('BORGES', {'db': (1, 1.0)})
+		search_log.flush()
+		popular.refresh_from_db()
+		self.assertEqual(popular.total_busquedas, 3)
+		self.assertEqual(BusquedaRegistro.objects.get(consulta='Dune').latencia_amazon_ms, 300.0)
+
+	def test_exit_flush_writes_to_the_recorded_database(self: 'SearchQueryLogTest') -> None:
+		"""
+		Test that the exit hook writes the buffered searches, but not to a
+		database other than the one they were recorded against.
+		"""
+		search_log = SearchQueryLog(flush_size=50, flush_interval=3600)
+		search_log.record('Rayuela', {'db': (1, 1.0)})
+		with patch.dict(connection.settings_dict, NAME='otra.sqlite3'):
+			self.assertEqual(search_log.flush_at_exit(), 0)
+		self.assertEqual(search_log.flush_at_exit(), 1)
+		self.assertTrue(BusquedaRegistro.objects.filter(consulta='Rayuela').exists())
+
+	@patch('libros.management.commands.prewarm_search_cache.search_log')
+	@patch('core.api.amazon_books.AmazonBooksAPI.search_books', return_value={'books': []})
+	@patch('core.api.google_books.GoogleBooksAPI.fetch_book_details', return_value=[])
+	@patch('core.api.google_books.GoogleBooksAPI.search_by_operators', return_value=[])
+	def test_prewarm_uses_the_search_dispatch(self: 'SearchQueryLogTest', operators, details, amazon, _) -> None:
+		"""
+		Test that structured popular queries warm the operator search that
+		live searches read.
+		"""
+		BusquedaPopular.objects.create(consulta_normalizada='autor:borges', total_busquedas=5,
+									   ultimos_resultados=3, ultima_busqueda=timezone.now())
+		call_command('prewarm_search_cache', stdout=StringIO())
+
+		operators.assert_called_once_with('inauthor:"borges"', force_refresh=True)
+		details.assert_not_called()
+		self.assertTrue(amazon.call_args.kwargs['force_refresh'])
+		self.assertIsNotNone(BusquedaPopular.objects.get().ultimo_precalentamiento)
+
+	@patch('libros.management.commands.prewarm_search_cache.search_log')
+	@patch('requests.get', side_effect=AssertionError('No request should be sent'))
+	def test_prewarm_stops_without_budget(self: 'SearchQueryLogTest', *_) -> None:
+		"""
+		Test that a query is not marked as prewarmed when the spare provider
+		budget is spent.
+		"""
+		cache.clear()
+		self.addCleanup(cache.clear)
+		for provider in ('google', 'amazon'):
+			limiter = get_limiter(provider)
+			for _ in range(limiter.burst):
+				limiter.consume()
+		BusquedaPopular.objects.create(consulta_normalizada='borges', total_busquedas=5,
+									   ultimos_resultados=3, ultima_busqueda=timezone.now())
+		output = StringIO()
+		call_command('prewarm_search_cache', stdout=output)
+		self.assertIn('No spare amazon budget', output.getvalue())
+		self.assertIsNone(BusquedaPopular.objects.get().ultimo_precalentamiento)
+
+
+class QueryParserTest(TestCase):
+	"""
+	Test cases for the structured query parser and its database routing.
+	"""
+	def setUp(self: 'QueryParserTest') -> None:
+		"""
+		Set up books to search for.
+		"""
+		self.categoria: Categoria = Categoria.objects.create(nombre='Cuento', activa=True)
+		self.ficciones: Libro = Libro.objects.create(
+			categoria		  = self.categoria,
+			titulo			  = 'Ficciones',
+			autor		      = 'Borges',
+			isbn		      = '9780307474728',
+			fecha_publicacion = '1944-01-01',
+			paginas			  = 200,
+			precio			  = 20.0
+		)
+		self.aleph: Libro = Libro.objects.create(
+			categoria		  = self.categoria,
+			titulo			  = 'El Aleph',
+			autor		      = 'Jorge Luis Borges',
+			isbn		      = '9788499089522',
+			fecha_publicacion = '1949-01-01',
+			paginas			  = 180,
+			precio			  = 18.0
+		)
+
+	def test_isbn_validation(self: 'QueryParserTest') -> None:
+		"""
+		Test that ISBN-10 are converted to ISBN-13 and bad checksums are rejected.
+		"""
+		self.assertEqual(normalize_isbn('0307474720'), '9780307474728')
+		self.assertEqual(normalize_isbn('978-0-307-47472-8'), '9780307474728')
+		self.assertIsNone(normalize_isbn('9780307474729'))
+		self.assertIsNone(normalize_isbn('1234567890'))
+
+	def test_parse_fields_and_phrases(self: 'QueryParserTest') -> None:
+		"""
+		Test that fields, quoted phrases and free text are split.
+		"""
+		parsed = parse_query('autor:Borges título:"El Aleph" "casa tomada" cuentos')
+		self.assertEqual(parsed.autores, ['Borges'])
+		self.assertEqual(parsed.titulos, ['El Aleph'])
+		self.assertEqual(parsed.frases, ['casa tomada'])
+		self.assertEqual(parsed.texto, 'cuentos')
+		self.assertEqual(parse_query('0307474720').google_query(), 'isbn:9780307474728')
+
+	def test_database_routing(self: 'QueryParserTest') -> None:
+		"""
+		Test that structured queries find the expected books.
+		"""
+		service = SearchService()
+		self.assertEqual(service.search_database('0307474720'), [self.ficciones])
+		self.assertEqual(set(service.search_database('autor:Borges')), {self.ficciones, self.aleph})
+		self.assertEqual(service.search_database('titulo:aleph categoria:cuento'), [self.aleph])
+
+	def test_word_prefix_lookup(self: 'QueryParserTest') -> None:
+		"""
+		Test that author and title words are matched by prefix on the word
+		table, without a leading wildcard, and follow renames.
+		"""
+		from django.db import connection
+		from django.test.utils import CaptureQueriesContext
+		service = SearchService()
+		with CaptureQueriesContext(connection) as queries:
+			libros = service.search_database('autor:BORG')
+		self.assertEqual(set(libros), {self.ficciones, self.aleph})
+		self.assertNotIn("'%borg", queries[0]['sql'].lower())
+
+		self.aleph.titulo = 'El Álef'
+		self.aleph.save()
+		self.assertEqual(service.search_database('titulo:alef'), [self.aleph])
+		self.assertEqual(service.search_database('titulo:aleph'), [])
+
+
+class CatalogVectorIndexTest(TestCase):
+	"""
+	Test cases for the semantic search index over the catalog.
+	"""
+	def setUp(self: 'CatalogVectorIndexTest') -> None:
+		"""
+		Set up books with descriptive text.
+		"""
+		self.categoria: Categoria = Categoria.objects.create(nombre='Ciencias Exactas', activa=True)
+		self.estadistica: Libro = Libro.objects.create(
+			categoria		  = self.categoria,
+			titulo			  = 'Probabilidad y Estadística para Ingeniería',
+			autor		      = 'Walpole',
+			isbn		      = '9786073214179',
+			descripcion		  = 'Introducción a la estadística inferencial y la probabilidad.',
+			fecha_publicacion = '2012-01-01',
+			paginas			  = 800,
+			precio			  = 90.0
+		)
+		self.cocina: Libro = Libro.objects.create(
+			categoria		  = self.categoria,
+			titulo			  = 'La Química de la Cocina',
+			autor		      = 'Hervé This',
+			isbn		      = '9788420682693',
+			descripcion		  = 'Recetas explicadas con química.',
+			fecha_publicacion = '2005-01-01',
+			paginas			  = 300,
+			precio			  = 30.0
+		)
+
+	def test_conceptual_query(self: 'CatalogVectorIndexTest') -> None:
+		"""
+		Test that a query without lexical matches finds the closest book.
+		"""
+		index = CatalogVectorIndex()
+		self.assertEqual(index.refresh(force=True), 2)
+		hits = index.search('libros para aprender estadistica', k=5)
+		self.assertEqual(hits[0][0], self.estadistica.id)
+		self.assertNotIn(self.cocina.id, [libro_id for libro_id, _ in hits])
+
+	def test_incremental_refresh(self: 'CatalogVectorIndexTest') -> None:
+		"""
+		Test that updates and deletions are applied without rebuilding the index.
+		"""
+		index = CatalogVectorIndex()
+		index.refresh(force=True)
+		self.cocina.descripcion = 'Manual de estadística aplicada a la gastronomía.'
+		self.cocina.save()
+		self.estadistica.delete()
+
+		index.refresh(force=True)
+		self.assertEqual(len(index), 1)
+		self.assertEqual(index.search('estadística')[0][0], self.cocina.id)
+
+	def test_refresh_detects_swaps_and_category_renames(self: 'CatalogVectorIndexTest') -> None:
+		"""
+		Test that a delete plus an insert missed by its timestamp is found,
+		and that renaming a category re-vectorizes its books.
+		"""
+		index = CatalogVectorIndex()
+		index.refresh(force=True)
+		self.cocina.delete()
+		nuevo = Libro.objects.create(
+			categoria		  = self.categoria,
+			titulo			  = 'Astronomía Moderna',
+			autor		      = 'Sagan',
+			isbn		      = '9780000000017',
+			fecha_publicacion = '1990-01-01',
+			paginas			  = 250,
+			precio			  = 25.0
+		)
+		# Committed late: older than anything the index has seen
+		Libro.objects.filter(pk=nuevo.pk).update(fecha_actualizacion='2000-01-01T00:00:00Z')
+		index.refresh(force=True)
+		self.assertEqual(sorted(index.libro_ids.tolist()), sorted([self.estadistica.id, nuevo.id]))
+
+		self.categoria.nombre = 'Cosmología'
+		self.categoria.save()
+		index.refresh(force=True)
+		self.assertEqual({libro_id for libro_id, _ in index.search('cosmologia')}, {self.estadistica.id, nuevo.id})
+
+
+class ContentSimilarBooksTest(TestCase):
+	"""
+	Test cases for the content-based similar books.
+	"""
+	def setUp(self: 'ContentSimilarBooksTest') -> None:
+		"""
+		Set up two statistics books and a cooking book.
+		"""
+		self.categoria: Categoria = Categoria.objects.create(nombre='Ciencias Exactas', activa=True)
+		textos = [
+			('Probabilidad y Estadística', 'Walpole', 'Estadística inferencial y probabilidad.'),
+			('Estadística Aplicada', 'Montgomery', 'Probabilidad y estadística para ingenieros.'),
+			('La Química de la Cocina', 'Hervé This', 'Recetas explicadas con química.'),
+		]
+		self.libros = [
+			Libro.objects.create(
+				categoria		  = self.categoria,
+				titulo			  = titulo,
+				autor		      = autor,
+				isbn		      = f'978000000{i}000',
+				descripcion		  = descripcion,
+				fecha_publicacion = '2012-01-01',
+				paginas			  = 300,
+				precio			  = 30.0
+			)
+			for i, (titulo, autor, descripcion) in enumerate(textos)
+		]
+
+	def test_new_books_get_similar_books(self: 'ContentSimilarBooksTest') -> None:
+		"""
+		Test that a new book gets a list once committed, without refreshing
+		the catalog index, is added to the lists of its similar books, and
+		that a rebuild agrees.
+		"""
+		from core.services.recommendation_service import get_engine
+		from core.services.semantic_search import CatalogVectorIndex, get_catalog_index
+		from core.services.similar_books import CONTENIDO, reconstruir_contenido, similar_updates, similares
+		primero, segundo, cocina = self.libros
+		with patch.object(CatalogVectorIndex, 'refresh_in_background'):
+			index = get_catalog_index()
+		index.refresh(force=True)
+		with patch.object(similar_updates, '_ensure_worker'), patch.object(index, 'refresh') as refresh:
+			with self.captureOnCommitCallbacks(execute=True):
+				nuevo = Libro.objects.create(
+					categoria		  = self.categoria,
+					titulo			  = 'Estadística y Probabilidad',
+					autor		      = 'Devore',
+					isbn		      = '9780000000900',
+					descripcion		  = 'Probabilidad y estadística para ciencias.',
+					fecha_publicacion = '2015-01-01',
+					paginas			  = 400,
+					precio			  = 35.0
+				)
+				self.assertEqual(similares(nuevo.id, 5, CONTENIDO), [])
+			self.assertEqual(similar_updates.drain(), 1)
+		refresh.assert_not_called()
+		incremental = similares(nuevo.id, 5, CONTENIDO)
+		self.assertEqual(set(incremental[:2]), {primero, segundo})
+		self.assertIn(nuevo, similares(segundo.id, 5, CONTENIDO))
+		self.assertEqual(get_engine().get_similar_books(nuevo.id, 2), incremental[:2])
+
+		reconstruir_contenido()
+		self.assertEqual(similares(nuevo.id, 5, CONTENIDO), incremental)
+		self.assertEqual(similares(primero.id, 5, CONTENIDO)[-1], cocina)
+
+	def test_bulk_loads_skip_the_updates(self: 'ContentSimilarBooksTest') -> None:
+		"""
+		Test that books created while the updates are paused schedule nothing.
+		"""
+		from core.services.similar_books import similar_updates
+		with similar_updates.paused(), self.captureOnCommitCallbacks() as callbacks:
+			Libro.objects.create(
+				categoria		  = self.categoria,
+				titulo			  = 'Cálculo',
+				autor		      = 'Stewart',
+				isbn		      = '9780000000901',
+				fecha_publicacion = '2015-01-01',
+				paginas			  = 400,
+				precio			  = 35.0
+			)
+		self.assertEqual(callbacks, [])
+
+
+class RateLimiterTest(TestCase):
+	"""
+	Test cases for the provider rate limiter.
+	"""
+	def test_background_keeps_interactive_reserve(self: 'RateLimiterTest') -> None:
+		"""
+		Test that background requests stop before the interactive reserve.
+		"""
+		cache.clear()
+		limiter = RateLimiter('test', rate=0.0, burst=4)
+		self.assertTrue(limiter.try_acquire(reserve=0.5))
+		self.assertTrue(limiter.try_acquire(reserve=0.5))
+		self.assertFalse(limiter.try_acquire(reserve=0.5))
+
+		limiter.consume()
+		limiter.consume()
+		self.assertEqual(limiter.used, 4)
+		self.assertFalse(limiter.try_acquire(reserve=0.0))
+
+		# Another process sees the same budget through the cache
+		self.assertEqual(RateLimiter('test', rate=0.0, burst=4).used, 4)
+
+
+class TopPorCategoriaTest(TestCase):
+	"""
+	Test cases for the top books per category queryset.
+	"""
+	def setUp(self: 'TopPorCategoriaTest') -> None:
+		"""
+		Set up two categories with three rated books each.
+		"""
+		self.categorias = [
+			Categoria.objects.create(nombre=nombre, activa=True)
+			for nombre in ('Poesía', 'Teatro')
+		]
+		for i, categoria in enumerate(self.categorias):
+			for calificacion in (3.0, 5.0, 4.0):
+				Libro.objects.create(
+					categoria		  = categoria,
+					titulo			  = f'{categoria.nombre} {calificacion}',
+					autor		      = 'Autor',
+					isbn		      = f'97800000{i}{int(calificacion)}000',
+					fecha_publicacion = '2000-01-01',
+					paginas			  = 100,
+					precio			  = 10.0,
+					calificacion	  = calificacion
+				)
+
+	def test_top_por_categoria(self: 'TopPorCategoriaTest') -> None:
+		"""
+		Test that the best rated books of every category come in one query.
+		"""
+		with self.assertNumQueries(1):
+			libros = list(Libro.objects.filter(
+				categoria__in=self.categorias
+			).top_por_categoria(2, '-calificacion'))
+		self.assertEqual(
+			[(libro.categoria_id, libro.calificacion, libro.rango) for libro in libros],
+			[
+				(self.categorias[0].id, 5.0, 1), (self.categorias[0].id, 4.0, 2),
+				(self.categorias[1].id, 5.0, 1), (self.categorias[1].id, 4.0, 2),
+			]
+		)
+
+
+class CategoriaStatsTest(TestCase):
+	"""
+	Test cases for the incrementally maintained category statistics.
+	"""
+	def setUp(self: 'CategoriaStatsTest') -> None:
+		"""
+		Set up a category with two available books.
+		"""
+		self.categoria: Categoria = Categoria.objects.create(nombre='Ensayo', activa=True)
+		self.libros = [
+			Libro.objects.create(
+				categoria		  = self.categoria,
+				titulo			  = f'Ensayo {precio}',
+				autor		      = 'Autor',
+				isbn		      = f'97811111{precio:05d}',
+				fecha_publicacion = '2000-01-01',
+				paginas			  = 100,
+				precio			  = precio,
+				calificacion	  = calificacion
+			)
+			for precio, calificacion in ((10, 4.0), (30, 2.0))
+		]
+
+	def estadisticas(self: 'CategoriaStatsTest') -> tuple:
+		"""
+		Reads the current statistics of the category.
+		"""
+		stats = CategoriaStats.objects.get(categoria=self.categoria)
+		return (stats.total_libros, stats.libros_disponibles, stats.calificacion_promedio,
+				stats.precio_minimo, stats.precio_maximo)
+
+	def test_incremental_updates(self: 'CategoriaStatsTest') -> None:
+		"""
+		Test that inserts, updates and deletes keep the statistics current.
+		"""
+		self.assertEqual(self.estadisticas(), (2, 2, 3.0, 10, 30))
+
+		self.libros[1].disponible = False
+		self.libros[1].save()
+		self.assertEqual(self.estadisticas(), (2, 1, 4.0, 10, 10))
+
+		self.libros[0].delete()
+		self.assertEqual(self.estadisticas(), (1, 0, 0.0, None, None))
+
+	def test_rebuild_matches_incremental(self: 'CategoriaStatsTest') -> None:
+		"""
+		Test that a full rebuild gives the same result after bulk updates.
+		"""
+		Libro.objects.filter(categoria=self.categoria).update(precio=20)
+		reconstruir()
+		self.assertEqual(self.estadisticas(), (2, 2, 3.0, 20, 20))
+
+
+class ContadoresPopularidadTest(TestCase):
+	"""
+	Test cases for the denormalized review counters of Libro.
+	"""
+	def setUp(self: 'ContadoresPopularidadTest') -> None:
+		"""
+		Set up a book without reviews.
+		"""
+		self.libro: Libro = Libro.objects.create(
+			categoria		  = Categoria.objects.create(nombre='Crónica', activa=True),
+			titulo			  = 'Los Rituales del Caos',
+			autor		      = 'Carlos Monsiváis',
+			isbn		      = '9789684115736',
+			fecha_publicacion = '1995-01-01',
+			paginas			  = 250,
+			precio			  = 15.0
+		)
+
+	def resena(self: 'ContadoresPopularidadTest', calificacion: float) -> Resena:
+		"""
+		Creates a review for the book.
+		"""
+		return Resena.objects.create(
+			libro			 = self.libro,
+			fuente_resena	 = 'Blog',
+			contenido_resena = 'Reseña',
+			calificacion	 = calificacion,
+			autor_resena	 = 'Lector'
+		)
+
+	def contadores(self: 'ContadoresPopularidadTest') -> tuple:
+		"""
+		Reads the current review counters of the book.
+		"""
+		self.libro.refresh_from_db()
+		return (self.libro.total_resenas, self.libro.promedio_resenas)
+
+	def test_review_counters(self: 'ContadoresPopularidadTest') -> None:
+		"""
+		Test that review inserts, updates and deletes keep count and mean current.
+		"""
+		primera = self.resena(4.0)
+		self.resena(2.0)
+		self.assertEqual(self.contadores(), (2, 3.0))
+
+		primera.calificacion = 5.0
+		primera.save()
+		self.assertEqual(self.contadores(), (2, 3.5))
+
+		self.libro.titulo = 'Los rituales del caos'
+		self.libro.save()
+		self.assertEqual(self.contadores(), (2, 3.5))
+
+		primera.delete()
+		self.assertEqual(self.contadores(), (1, 2.0))
+
+	def test_reconcile_repairs_drift(self: 'ContadoresPopularidadTest') -> None:
+		"""
+		Test that reconciliation fixes counters changed behind the signals.
+		"""
+		self.resena(4.0)
+		Libro.objects.filter(pk=self.libro.pk).update(total_resenas=7, total_favoritos=3)
+		self.assertEqual(reconciliar(), 1)
+		self.assertEqual(self.contadores(), (1, 4.0))
+		self.assertEqual(self.libro.total_favoritos, 0)
+		self.assertEqual(reconciliar(), 0)
+
+	def test_save_leaves_counters_alone(self: 'ContadoresPopularidadTest') -> None:
+		"""
+		Test that a plain save skips the counters, a deferred instance is
+		saved in one query, and a book whose row is gone is not inserted again.
+		"""
+		stale = Libro.objects.get(pk=self.libro.pk)
+		self.resena(4.0)
+		stale.paginas = 260
+		stale.save()
+		self.assertEqual(self.contadores(), (1, 4.0))
+
+		diferido = Libro.objects.only('id', 'titulo').get(pk=self.libro.pk)
+		diferido.titulo = 'Rituales'
+		# Without the signals, which read other fields of the book
+		with patch('libros.models.post_save.send'), patch('libros.models.pre_save.send'):
+			with self.assertNumQueries(1):
+				diferido.save()
+
+		Libro.objects.filter(pk=self.libro.pk).delete()
+		with self.assertRaises(DatabaseError):
+			stale.save()
+
+
+class FragmentCacheTest(TestCase):
+	"""
+	Test cases for the shared page fragments.
+	"""
+	def setUp(self: 'FragmentCacheTest') -> None:
+		"""
+		Start every test with an empty cache.
+		"""
+		cache.clear()
+		self.categoria: Categoria = Categoria.objects.create(nombre='Aventura', activa=True)
+
+	def crear_libro(self: 'FragmentCacheTest', titulo: str, isbn: str) -> Libro:
+		"""
+		Creates an available book in the category.
+		"""
+		return Libro.objects.create(
+			categoria		  = self.categoria,
+			titulo			  = titulo,
+			autor		      = 'Julio Verne',
+			isbn		      = isbn,
+			fecha_publicacion = '1870-01-01',
+			paginas			  = 300,
+			precio			  = 12.0,
+			calificacion	  = 4.0
+		)
+
+	def test_books_grid_is_cached_until_catalog_changes(self: 'FragmentCacheTest') -> None:
+		"""
+		Test that the category grid is reused and invalidated by a catalog write.
+		"""
+		self.crear_libro('Veinte Mil Leguas', '9788497940221')
+		self.client.get(reverse('libros'))
+		with self.assertNumQueries(0):
+			response = self.client.get(reverse('libros'))
+		self.assertContains(response, 'Veinte Mil Leguas')
+
+		self.crear_libro('La Isla Misteriosa', '9788497940238')
+		self.assertContains(self.client.get(reverse('libros')), 'La Isla Misteriosa')
+
+
+class CatalogApiConditionalTest(TestCase):
+	"""
+	Test cases for the conditional requests of the catalog APIs.
+	"""
+	def setUp(self: 'CatalogApiConditionalTest') -> None:
+		"""
+		Set up a category with one book.
+		"""
+		self.categoria: Categoria = Categoria.objects.create(nombre='Viajes', activa=True)
+		self.libro: Libro = Libro.objects.create(
+			categoria		  = self.categoria,
+			titulo			  = 'En el Camino',
+			autor		      = 'Jack Kerouac',
+			isbn		      = '9788433973900',
+			fecha_publicacion = '1957-01-01',
+			paginas			  = 400,
+			precio			  = 20.0
+		)
+		self.url = f"{reverse('api_libros_categoria')}?categoria_id={self.categoria.id}"
+
+	def test_not_modified_until_catalog_changes(self: 'CatalogApiConditionalTest') -> None:
+		"""
+		Test that a matching ETag gets a 304 without running the view queries.
+		"""
+		response = self.client.get(self.url)
+		self.assertEqual(response.status_code, 200)
+		self.assertIn('public', response['Cache-Control'])
+		etag = response['ETag']
+
+		with self.assertNumQueries(2):
+			response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 304)
+
+		self.libro.delete()
+		response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.json()['total_libros'], 0)
+
+	def test_all_catalog_apis_are_routed(self: 'CatalogApiConditionalTest') -> None:
+		"""
+		Test that every catalog API answers with validators.
+		"""
+		for name in ('api_categorias', 'category_statistics_api', 'books_by_category_api'):
+			response = self.client.get(f'{reverse(name)}?categoria_id={self.categoria.id}')
+			self.assertEqual(response.status_code, 200)
+			self.assertTrue(response.has_header('ETag'))
+			self.assertTrue(response.has_header('Last-Modified'))
+
+
+class BookDetailSectionsTest(TestCase):
+	"""
+	Test cases for the secondary sections of the book detail page.
+	"""
+	def setUp(self: 'BookDetailSectionsTest') -> None:
+		"""
+		Set up a local book and mock the external APIs.
+		"""
+		cache.clear()
+		self.libro: Libro = Libro.objects.create(
+			categoria		  = Categoria.objects.create(nombre='Crónica', activa=True),
+			titulo			  = 'Relato de un Náufrago',
+			autor		      = 'Gabriel García Márquez',
+			isbn		      = '9780000000035',
+			fecha_publicacion = '1970-01-01',
+			paginas			  = 160,
+			precio			  = 15.0
+		)
+		amazon = patch('core.services.book_detail.amazon_api.search_books', return_value={'books': [{
+			'price': '$199.00', 'amazon_url': 'https://www.amazon.com.mx/dp/1'}]})
+		related = patch('core.services.book_detail.build_related_books', return_value=[])
+		self.search_books = amazon.start()
+		related.start()
+		self.addCleanup(amazon.stop)
+		self.addCleanup(related.stop)
+
+	def test_sections_are_deferred_until_cached(self: 'BookDetailSectionsTest') -> None:
+		"""
+		Test that the page does not wait for uncached sections and inlines them once cached.
+		"""
+		url = reverse('book_detail', args=[self.libro.id])
+		response = self.client.get(url)
+		self.assertContains(response, 'Relato de un Náufrago')
+		self.assertContains(response, reverse('book_availability', args=[self.libro.id]))
+		self.search_books.assert_not_called()
+
+		response = self.client.get(reverse('book_availability', args=[self.libro.id]))
+		self.assertContains(response, '$199.00')
+		response = self.client.get(url)
+		self.assertContains(response, '$199.00')
+		self.assertNotContains(response, reverse('book_availability', args=[self.libro.id]))
+		self.assertEqual(self.search_books.call_count, 1)
+
+	def test_full_render_builds_sections_concurrently(self: 'BookDetailSectionsTest') -> None:
+		"""
+		Test that ?render=full inlines both sections in the first response.
+		"""
+		response = self.client.get(f"{reverse('book_detail', args=[self.libro.id])}?render=full")
+		self.assertContains(response, '$199.00')
+		self.assertNotContains(response, reverse('book_related', args=[self.libro.id]))
+
+	def test_section_workers_leave_the_payload_alone(self: 'BookDetailSectionsTest') -> None:
+		"""
+		Test that the concurrent sections cache themselves without touching the shared payload.
+		"""
+		import copy
+		from django.contrib.auth.models import AnonymousUser
+		from core.services.book_detail import availability_fragment, get_detail, render_sections
+		source, payload, _ = get_detail(str(self.libro.id))
+		original = copy.deepcopy(payload)
+		sections = render_sections(payload, source, str(self.libro.id), AnonymousUser())
+		self.assertIn('$199.00', sections['availability_html'])
+		self.assertEqual(payload, original)
+		self.assertIsNotNone(availability_fragment(payload, source, str(self.libro.id), build=False))
+
+	def test_detail_payload_is_cached_until_book_changes(self: 'BookDetailSectionsTest') -> None:
+		"""
+		Test that a repeat visit runs no queries and a new source shows up.
+		"""
+		url = f"{reverse('book_detail', args=[self.libro.id])}?render=full"
+		self.client.get(url)
+		with self.assertNumQueries(0):
+			response = self.client.get(reverse('book_detail', args=[self.libro.id]))
+		self.assertContains(response, '$199.00')
+
+		FuenteLibro.objects.create(libro=self.libro, plataforma='Gandhi', url_libro='https://gandhi.mx/1',
+								   precio=180.0, moneda='MXN')
+		response = self.client.get(reverse('book_availability', args=[self.libro.id]))
+		self.assertContains(response, '$180.00 MXN')
+
+	def test_missing_book_section_is_not_found(self: 'BookDetailSectionsTest') -> None:
+		"""
+		Test that a section of an unknown book answers 404.
+		"""
+		response = self.client.get(f"{reverse('book_related', args=[0])}?source=database")
+		self.assertEqual(response.status_code, 404)
+
+
+class BookCardTest(TestCase):
+	"""
+	Test cases for the compact book cards.
+	"""
+	def test_card_reads_like_the_old_dicts(self: 'BookCardTest') -> None:
+		"""
+		Test that the camelCase keys are aliases of the card fields.
+		"""
+		card = BookCard.from_google({'id': 'g1', 'volumeInfo': {
+			'title': 'Rayuela', 'publishedDate': '1963', 'pageCount': 600, 'previewLink': 'https://x'}})
+		self.assertEqual(card.get('publishedDate'), '1963')
+		self.assertEqual(card['pageCount'], 600)
+		self.assertEqual(card.get('book_id'), 'g1')
+		self.assertEqual(card.get('availability', 'Consultar'), 'Consultar')
+		self.assertFalse(hasattr(card, '__dict__'))
+		self.assertEqual(card.to_dict()['source'], 'Google Books')
+		self.assertEqual(decode_cards(encode_cards([card])), [card])
+		self.assertEqual(len({card, *decode_cards(encode_cards([card]))}), 1)
+		self.assertIsNone(decode_cards([card.encode()[1:]]))
+		self.assertRaises(ValueError, BookCard.decode, (0,) + card.encode()[1:])
+
+	def test_card_queryset_reads_a_short_description(self: 'BookCardTest') -> None:
+		"""
+		Test that local cards are built without loading the whole description.
+		"""
+		Libro.objects.create(
+			categoria		  = Categoria.objects.create(nombre='Ensayo', activa=True),
+			titulo			  = 'El Laberinto de la Soledad',
+			autor		      = 'Octavio Paz',
+			isbn		      = '9780000000042',
+			descripcion       = 'x' * 5000,
+			fecha_publicacion = '1950-01-01',
+			paginas			  = 200,
+			precio			  = 10.0
+		)
+		libro = card_queryset(Libro.objects.all()).get()
+		with self.assertNumQueries(0):
+			card = BookCard.from_libro(libro)
+		self.assertEqual(len(card.description), 303)
+		self.assertTrue(card.is_local)
+		self.assertEqual(card.source, 'database')
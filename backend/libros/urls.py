@@ -12,8 +12,17 @@ urlpatterns = [
     path('recomendaciones/',              views.recomendaciones_view, name='recomendaciones'),
     path('similares/<int:libro_id>/',     views.similar_books_view,   name='similar_books'),
     path("api/search/",                   views.book_search_api,      name="book_search_api"),
+    path("api/search/stream/",            views.book_search_stream,   name="book_search_stream"),
+    path("api/search/semantic/",          views.semantic_search_api,  name="semantic_search_api"),
+    path("api/tendencias/",               views.trending_api,         name="trending_api"),
+    path("api/categorias/",               views.api_categorias,       name="api_categorias"),
+    path("api/categorias/estadisticas/",  views.category_statistics_api, name="category_statistics_api"),
+    path("api/categorias/libros/",        views.api_libros_categoria, name="api_libros_categoria"),
+    path("api/libros/categoria/",         views.books_by_category_api, name="books_by_category_api"),
     path("api/recomendaciones/",          views.api_recommendations,  name='api_recommendaciones'),
     path("amazon/<str:asin>/",            views.amazon_book_details,  name="amazon_book_details"),
+    path('libros/<str:book_id>/disponibilidad/', views.book_availability_view, name='book_availability'),
+    path('libros/<str:book_id>/relacionados/',   views.book_related_view,      name='book_related'),
     path('libros/<str:book_id>/',         views.book_detail_view,     name='book_detail'),
     path('favoritos/agregar/<int:libro_id>/', views.agregar_favorito, name='agregar_favorito'),
     path('favoritos/remover/<int:libro_id>/', views.remover_favorito, name='remover_favorito'),
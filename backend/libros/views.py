@@ -3,23 +3,43 @@ Views for the libros app.
 """
 # pylint: disable=E1101
 from django.shortcuts                     import render, get_object_or_404
-from django.contrib.auth                  import get_user_model
-from django.http                          import HttpResponse, JsonResponse, HttpRequest
+from django.http                          import (HttpResponse, JsonResponse, HttpRequest,
+                                                  StreamingHttpResponse)
 from django.views.decorators.http         import require_http_methods
 from django.contrib.auth.decorators       import login_required
 from django.db.models                     import QuerySet, Q, Count, Avg
 from django.db                            import models
+from django.db.models.functions           import Coalesce
+from django.template.loader               import render_to_string
+from django.utils.safestring              import mark_safe
 from libros.models                        import Libro
 from core.api.google_books                import GoogleBooksAPI
 from core.api.amazon_books                import AmazonBooksAPI, AmazonBooksAPIAlternative
-from core.services.recommendation_service import RecomendationEngine
+from core.services.recommendation_service import get_engine
+from core.services.book_card              import BookCard, card_queryset
+from core.services.category_stats         import estadisticas_de
+from core.services.favorites              import annotate_favorites, get_favorite_ids
+from core.services.http_cache             import catalog_cache
+from core.services.fragment_cache         import (CATALOG_VERSION, STATS_VERSION, cached_fragment,
+                                                  render_fragment, user_segment)
+from core.services.book_detail            import (availability_fragment, get_detail, related_fragment,
+                                                  render_sections)
+from core.services.prefetch               import detail_prefetcher
+from core.services.search_log             import popular_queries
+from core.services.semantic_search        import get_catalog_index
+from core.services.trending               import tendencias
+from core.services.search_service         import (SearchService, encode_event,
+                                                  format_database_book)
 from .models                              import Libro, Categoria
 from profiles.models                      import Favorito
 google_api      = GoogleBooksAPI()
 amazon_api      = AmazonBooksAPI()
 amazon_rapidapi = AmazonBooksAPIAlternative()
 
+DEFAULT_EXPLORE_QUERIES = ['bestseller 2024', 'popular fiction', 'technology books', 'science']
+
 @require_http_methods(["GET"])
+@catalog_cache
 def books_by_category_api(request: HttpRequest) -> JsonResponse:
     """
     API endpoint that returns books filtered by category.
@@ -39,10 +59,10 @@ def books_by_category_api(request: HttpRequest) -> JsonResponse:
     
     try:
         category = get_object_or_404(Categoria, id=category_id, activa=True)
-        books = Libro.objects.filter(categoria=category).values(
+        books = list(Libro.objects.filter(categoria=category).values(
             'id', 'titulo', 'autor', 'isbn', 'precio', 
             'calificacion', 'disponible', 'imagen_url'
-        )
+        ))
         
         return JsonResponse({
             'categoria': {
@@ -50,14 +70,15 @@ def books_by_category_api(request: HttpRequest) -> JsonResponse:
                 'nombre': category.nombre,
                 'descripcion': category.descripcion
             },
-            'total_libros': books.count(),
-            'libros': list(books)
+            'total_libros': len(books),
+            'libros': books
         })
         
     except Categoria.DoesNotExist:
         return JsonResponse({'error': 'Categoría no encontrada'}, status=404)
 
 @require_http_methods(["GET"])
+@catalog_cache
 def category_statistics_api(request: HttpRequest) -> JsonResponse:
     """
     API endpoint that returns category statistics.
@@ -67,18 +88,18 @@ def category_statistics_api(request: HttpRequest) -> JsonResponse:
     Returns:
         JsonResponse: Complete statistics of all categories.
     """
-    categories = Categoria.objects.filter(activa=True).annotate(
-        total_libros=Count('libros'),
-    ).values('id', 'nombre', 'descripcion', 'total_libros')
+    categories = list(Categoria.objects.filter(activa=True).values(
+        'id', 'nombre', 'descripcion',
+        total_libros=Coalesce('estadisticas__total_libros', 0),
+    ).order_by('-total_libros'))
     
     total_books_system = Libro.objects.count()
-    total_active_categories = categories.count()
     
     statistics = {
-        'total_categorias': total_active_categories,
+        'total_categorias': len(categories),
         'total_libros_sistema': total_books_system,
-        'categorias': list(categories.order_by('-total_libros')),
-        'categoria_mas_popular': categories.order_by('-total_libros').first() if categories else None
+        'categorias': categories,
+        'categoria_mas_popular': categories[0] if categories else None
     }
     
     return JsonResponse(statistics)
@@ -91,39 +112,42 @@ def books(request: HttpRequest) -> HttpResponse:
         request (HttpRequest): The HTTP request object.
 
     Returns:
-        HttpResponse: The rendered response containing all books and users.
-    """
-    categorias = Categoria.objects.filter(
-        activa=True
-    ).annotate(
-        total_libros=Count('libros', filter=Q(libros__disponible=True))
-    ).order_by('nombre')
-
-    categorias_con_libros = []
-
-    for categoria in categorias:
-        libros_destacados = categoria.libros.filter(
-            disponible=True
-        ).order_by('-calificacion')[:6]
-
-        # Check favorite status for each book if user is authenticated
-        if request.user.is_authenticated:
-            for libro in libros_destacados:
-                libro.is_favorite = Favorito.objects.filter(
-                    usuario=request.user,
-                    libro=libro
-                ).exists()
-
-        categorias_con_libros.append({
-            'categoria': categoria,
-            'libros': libros_destacados,
-            'total': categoria.total_libros,
-        })
+        HttpResponse: The rendered response containing the top books per category.
+    """
+    def build_context() -> dict:
+        categorias = list(Categoria.objects.filter(
+            activa=True
+        ).annotate(
+            total_libros=Coalesce('estadisticas__libros_disponibles', 0)
+        ).order_by('nombre'))
+        destacados = Libro.objects.filter(
+            categoria__in=categorias, disponible=True
+        ).only(
+            'id', 'categoria_id', 'titulo', 'autor', 'imagen_url', 'calificacion'
+        ).top_por_categoria(6, '-calificacion')
+        libros_por_categoria = {}
+        for libro in destacados:
+            libros_por_categoria.setdefault(libro.categoria_id, []).append(libro)
+
+        return {
+            'autenticado': request.user.is_authenticated,
+            'categorias_con_libros': [
+                {
+                    'categoria': categoria,
+                    'libros': libros_por_categoria.get(categoria.id, []),
+                    'total': categoria.total_libros,
+                }
+                for categoria in categorias
+            ],
+        }
 
     context = {
-        'categorias_con_libros': categorias_con_libros,
-        'total_categorias': categorias.count(),
-        'usuarios': get_user_model().objects.all()
+        'categorias_html': render_fragment(
+            'libros_grid', 'fragments/libros_grid.html',
+            (request.user.is_authenticated,), build_context,
+            versions=(CATALOG_VERSION, STATS_VERSION)
+        ),
+        'favorite_ids': sorted(get_favorite_ids(request.user)),
     }
 
     return render(request, 'libros.html', context)
@@ -138,33 +162,39 @@ def home_view(request: HttpRequest) -> HttpResponse:
     Returns:
         HttpResponse: The rendered response for the home view.
     """
-    context = {}
-    explore_books = []
-
-    # Get popular books from Google Books API to display
-    try:
-        # Search for popular/trending books across different categories
-        search_queries = ['bestseller 2024', 'popular fiction', 'technology books', 'science']
-        for query in search_queries:
-            google_result = google_api.fetch_book_details(query)
-            if isinstance(google_result, list) and google_result:
-                explore_books.extend(google_result[:3])
-            elif isinstance(google_result, dict) and 'books' in google_result:
-                explore_books.extend(google_result['books'][:3])
-            if len(explore_books) >= 12:
-                break
+    # Use the most searched queries, completed with the default ones
+    search_queries = popular_queries(limit=len(DEFAULT_EXPLORE_QUERIES))
+    search_queries += [q for q in DEFAULT_EXPLORE_QUERIES if q not in search_queries]
 
-        # Limit to 12 books
-        explore_books = explore_books[:12]
-    except Exception as e:
-        print(f"Error fetching explore books: {e}")
+    def build_explore_books() -> str:
         explore_books = []
+        # Get popular books from Google Books API to display
+        try:
+            for query in search_queries:
+                google_result = google_api.fetch_book_details(query)
+                if isinstance(google_result, list) and google_result:
+                    explore_books.extend(google_result[:3])
+                elif isinstance(google_result, dict) and 'books' in google_result:
+                    explore_books.extend(google_result['books'][:3])
+                if len(explore_books) >= 12:
+                    break
+        except Exception as e:
+            print(f"Error fetching explore books: {e}")
+            return None
+        if not explore_books:
+            return None
+        # Limit to 12 books
+        return render_to_string('fragments/explore_books.html', {
+            'explore_books': explore_books[:12],
+        })
 
-    context.update({
+    context = {
         'user': request.user,
-        'explore_books': explore_books,
-        'has_explore_books': len(explore_books) > 0
-    })
+        'explore_books_html': mark_safe(
+            cached_fragment('explore_books', tuple(search_queries), build_explore_books, versions=())
+            or ''
+        ),
+    }
     return render(request, 'dashboard.html', context)
 
 
@@ -239,9 +269,6 @@ def book_search_view(request):
     """
     Book search: database first, then Google Books and Amazon APIs.
     """
-    from core.api.google_books import GoogleBooksAPI
-    from core.api.amazon_books import AmazonBooksAPI
-
     user = request.user if request.user.is_authenticated else None
     search_query = request.GET.get('search', '').strip()
 
@@ -251,80 +278,23 @@ def book_search_view(request):
     amazon_error = None
 
     if search_query:
+        search_service = SearchService()
+
         # Search in local database first
-        db_books = Libro.objects.filter(
-            Q(titulo__icontains=search_query) |
-            Q(autor__icontains=search_query) |
-            Q(isbn__icontains=search_query)
-        ).order_by('-fecha_creacion')
-
-        for book in db_books:
-            all_books.append({
-                'source': 'Database',
-                'book_id': book.id,
-                'id': book.id,  # Also add as 'id' for template compatibility
-                'title': book.titulo,
-                'authors': [book.autor] if book.autor else [],
-                'description': book.descripcion,
-                'thumbnail': book.imagen_url if book.imagen_url else '',
-                'isbn': book.isbn,
-                'is_local': True,
-                'book_object': book
-            })
+        db_books = search_service.search_database(search_query)
+        all_books.extend(format_database_book(book) for book in db_books)
 
         # Search in Google Books
-        try:
-            google_api = GoogleBooksAPI()
-            google_result = google_api.fetch_book_details(search_query)
-
-            if isinstance(google_result, dict) and 'error' in google_result:
-                google_error = google_result['error']
-            elif isinstance(google_result, list):
-                for book in google_result:
-                    book_id = book.get('id', 'unknown')
-                    all_books.append({
-                        'source': 'Google Books',
-                        'book_id': book_id,
-                        'id': book_id,  # Also add as 'id' for template compatibility
-                        'title': book.get('title', 'N/A'),
-                        'authors': book.get('authors', []),
-                        'description': book.get('description', 'N/A'),
-                        'thumbnail': book.get('thumbnail', ''),
-                        'publisher': book.get('publisher', 'N/A'),
-                        'publishedDate': book.get('publishedDate', 'N/A'),
-                        'pageCount': book.get('pageCount', 'N/A'),
-                        'categories': book.get('categories', []),
-                        'previewLink': book.get('previewLink', '#'),
-                        'is_local': False
-                    })
-        except Exception as e:
-            google_error = f"Error buscando en Google Books: {str(e)}"
+        google_books, google_error = search_service.search_google(search_query)
+        all_books.extend(google_books)
 
         # Search in Amazon
-        try:
-            amazon_api = AmazonBooksAPI()
-            amazon_result = amazon_api.search_books(search_query, max_results=10)
-
-            if isinstance(amazon_result, dict) and 'error' in amazon_result:
-                amazon_error = amazon_result['error']
-            elif isinstance(amazon_result, dict) and 'books' in amazon_result:
-                for book in amazon_result['books']:
-                    book_id = book.get('asin', book.get('amazon_url', '').split('/')[-1] if 'amazon_url' in book else 'unknown')
-                    all_books.append({
-                        'source': 'Amazon',
-                        'book_id': book_id,
-                        'id': book_id,  # Also add as 'id' for template compatibility
-                        'title': book.get('title', 'N/A'),
-                        'authors': book.get('authors', []),
-                        'description': book.get('description', 'N/A'),
-                        'thumbnail': book.get('image_url', ''),
-                        'price': book.get('price', 'N/A'),
-                        'rating': book.get('rating', 'N/A'),
-                        'amazon_url': book.get('amazon_url', ''),
-                        'is_local': False
-                    })
-        except Exception as e:
-            amazon_error = f"Error buscando en Amazon: {str(e)}"
+        amazon_books, amazon_error = search_service.search_amazon(search_query, max_results=10)
+        all_books.extend(amazon_books)
+
+        search_service.log(search_query)
+        detail_prefetcher.enqueue(all_books)
+        annotate_favorites(all_books, request.user)
 
     context = {
         'search_query': search_query,
@@ -339,6 +309,40 @@ def book_search_view(request):
     return render(request, 'book_search.html', context)
 
 
+@require_http_methods(["GET"])
+def book_search_stream(request: HttpRequest) -> StreamingHttpResponse:
+    """
+    Streaming variant of the book search. Emits the database hits immediately
+    and then each provider batch as it completes, as NDJSON by default or as
+    Server-Sent Events with ?format=sse.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        StreamingHttpResponse: The stream of search events.
+    """
+    query = (request.GET.get('q') or request.GET.get('search', '')).strip()
+    source = request.GET.get('source', 'all')
+    fmt = 'sse' if request.GET.get('format') == 'sse' else 'ndjson'
+    try:
+        max_results = int(request.GET.get('max_results', 10))
+    except ValueError:
+        max_results = 10
+
+    if not query:
+        return JsonResponse({'error': 'Query parameter is required'}, status=400)
+
+    events = SearchService().stream(query, source=source, max_results=max_results)
+    response = StreamingHttpResponse(
+        (encode_event(event, fmt) for event in events),
+        content_type='text/event-stream' if fmt == 'sse' else 'application/x-ndjson'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @require_http_methods(["GET"])
 def book_search_api(request):
     """
@@ -360,7 +364,10 @@ def book_search_api(request):
     
     if source in ['google', 'all']:
         google_result = google_api.fetch_book_details(query)
-        results['google_books'] = google_result
+        if isinstance(google_result, list):
+            results['google_books'] = [book.to_dict() for book in google_result]
+        else:
+            results['google_books'] = google_result
         
         # Add Google book to combined results if found
         if 'title' in google_result and google_result['title'] != 'N/A':
@@ -379,7 +386,8 @@ def book_search_api(request):
     
     if source in ['amazon', 'all']:
         amazon_result = amazon_api.search_books(query, max_results=max_results)
-        results['amazon_books'] = amazon_result
+        results['amazon_books'] = {
+            **amazon_result, 'books': [book.to_dict() for book in amazon_result.get('books', [])]}
         
         # Add Amazon books to combined results
         if 'books' in amazon_result:
@@ -400,6 +408,72 @@ def book_search_api(request):
     return JsonResponse(results)
 
 
+@require_http_methods(["GET"])
+def semantic_search_api(request: HttpRequest) -> JsonResponse:
+    """
+    API endpoint for the local semantic search over the catalog.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        JsonResponse: The top-k closest books with their cosine score.
+    """
+    query = request.GET.get('q', '').strip()
+    try:
+        k = min(int(request.GET.get('k', 10)), 50)
+    except ValueError:
+        k = 10
+
+    if not query:
+        return JsonResponse({'error': 'Query parameter is required'}, status=400)
+
+    hits = get_catalog_index().search(query, k)
+    libros = Libro.objects.only('titulo', 'autor', 'imagen_url').in_bulk([libro_id for libro_id, _ in hits])
+    return JsonResponse({
+        'query': query,
+        'results': [{
+            'id': libro_id,
+            'titulo': libros[libro_id].titulo,
+            'autor': libros[libro_id].autor,
+            'imagen_url': libros[libro_id].imagen_url,
+            'score': round(score, 4),
+        } for libro_id, score in hits if libro_id in libros]
+    })
+
+
+@require_http_methods(["GET"])
+def trending_api(request: HttpRequest) -> JsonResponse:
+    """
+    API endpoint with the trending books, overall or in one category.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        JsonResponse: The trending books with their decayed score.
+    """
+    categoria_id = request.GET.get('categoria_id')
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), 50))
+        categoria_id = int(categoria_id) if categoria_id else None
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros inválidos'}, status=400)
+
+    hits = tendencias(limit, categoria_id)
+    libros = Libro.objects.only('titulo', 'autor', 'imagen_url').in_bulk([libro_id for libro_id, _ in hits])
+    return JsonResponse({
+        'categoria_id': categoria_id,
+        'results': [{
+            'id': libro_id,
+            'titulo': libros[libro_id].titulo,
+            'autor': libros[libro_id].autor,
+            'imagen_url': libros[libro_id].imagen_url,
+            'score': round(score, 4),
+        } for libro_id, score in hits if libro_id in libros]
+    })
+
+
 def amazon_book_details(request, asin):
     """
     Get detailed information about a specific Amazon book.
@@ -413,251 +487,76 @@ def amazon_book_details(request, asin):
     
     return render(request, 'amazon_book_details.html', context)
 
-def book_detail_view(request, book_id):
+
+def _book_section(request: HttpRequest, book_id: str, section) -> HttpResponse:
     """
-    Book detail page - shows complete book information.
-    Supports Google Books API, Amazon API, and local database books.
-    Auto-detects if book_id is numeric (database) or string (API).
+    Serves one deferred section of the book detail page as an HTML fragment.
     """
-    source = request.GET.get('source', None)
-
-    if not source:
-        try:
-            int(book_id)
-            if Libro.objects.filter(id=book_id).exists():
-                source = 'database'
-            else:
-                source = 'google'
-        except (ValueError, TypeError):
-            source = 'google'
-
-    book = None
-    error = None
-    availability_options = []
-    
-    if source == 'google':
-        try:
-            google_api = GoogleBooksAPI()
-            book_data = google_api.get_book_by_id(book_id)
+    source, payload, error = get_detail(book_id, request.GET.get('source'))
+    if error or not payload:
+        return HttpResponse(status=404)
+    return HttpResponse(section(payload, source, book_id))
 
-            if isinstance(book_data, dict) and 'error' in book_data:
-                error = book_data['error']
-            else:
-                book = book_data
 
-        except Exception as e:
-            error = f'Error al cargar desde Google Books: {str(e)}'
-            print(f"[DEBUG] Google Books error: {e}")
-            print(f"[DEBUG] Book ID: {book_id}")
-            
-    elif source == 'amazon':
-        try:
-            amazon_api = AmazonBooksAPI()
-            book_data = amazon_api.get_book_details(book_id)
-            
-            if isinstance(book_data, dict) and 'error' in book_data:
-                error = 'No se pudo cargar la información del libro de Amazon'
-            else:
-                book = {
-                    'title': book_data.get('title', 'N/A'),
-                    'authors': book_data.get('authors', []),
-                    'description': book_data.get('description', 'N/A'),
-                    'thumbnail': book_data.get('image_url', ''),
-                    'categories': book_data.get('categories', []),
-                    'published_date': book_data.get('publication_date', 'N/A'),
-                    'publishedDate': book_data.get('publication_date', 'N/A'),
-                    'page_count': book_data.get('pages', 'N/A'),
-                    'pageCount': book_data.get('pages', 'N/A'),
-                    'publisher': book_data.get('publisher', 'N/A'),
-                    'price': book_data.get('price', 'N/A'),
-                    'rating': book_data.get('rating', 'N/A'),
-                    'amazon_url': book_data.get('amazon_url', '#'),
-                }
-        except Exception as e:
-            error = f'Error al cargar desde Amazon: {str(e)}'
-            print(f"[DEBUG] Amazon error: {e}")
-    
-    elif source == 'database':
-        try:
-            libro = Libro.objects.get(id=book_id)
-            book = {
-                'title': libro.titulo,
-                'authors': [libro.autor] if libro.autor else [],
-                'description': libro.descripcion,
-                'thumbnail': libro.imagen_url,
-                'categories': [libro.categoria.nombre] if libro.categoria else [],
-                'published_date': libro.fecha_publicacion.strftime('%Y-%m-%d') if libro.fecha_publicacion else None,
-                'publishedDate': libro.fecha_publicacion.strftime('%Y-%m-%d') if libro.fecha_publicacion else None,
-                'page_count': libro.paginas,
-                'pageCount': libro.paginas,
-                'publisher': 'N/A',
-                'price': float(libro.precio) if libro.precio else None,
-                'rating': libro.calificacion,
-            }
-        except Libro.DoesNotExist:
-            error = 'Libro no encontrado en la base de datos'
-        except Exception as e:
-            error = f'Error al cargar desde base de datos: {str(e)}'
-            print(f"[DEBUG] Database error: {e}")
-    
-    else:
-        error = 'Fuente de datos no válida'
+@require_http_methods(["GET"])
+def book_availability_view(request: HttpRequest, book_id: str) -> HttpResponse:
+    """
+    Availability section of the book detail page, fetched by the page after
+    the main section is shown.
+    """
+    return _book_section(request, book_id, availability_fragment)
 
-    # Build availability options
-    if book and not error:
-        book_title = book.get('title', '')
-        book_categories = book.get('categories', [])
-
-        # Try to find on Amazon
-        if book_title:
-            try:
-                amazon_result = amazon_api.search_books(book_title, max_results=1)
-                if isinstance(amazon_result, dict) and 'books' in amazon_result and amazon_result['books']:
-                    amazon_book = amazon_result['books'][0]
-                    amazon_price = amazon_book.get('price', 'Precio no disponible')
-                    availability_options.append({
-                        'platform': 'Amazon',
-                        'platform_logo': 'amazon',
-                        'price': amazon_price,
-                        'language': 'Español',
-                        'format': 'Físico',
-                        'stock': f"{amazon_book.get('availability', 'Consultar')} disponible" if amazon_book.get('availability') else 'Consultar disponibilidad',
-                        'link': amazon_book.get('amazon_url', f'https://www.amazon.com.mx/s?k={book_title.replace(" ", "+")}'),
-                        'link_text': 'Ver en Amazon',
-                        'show_favorite': False,
-                        'rating': amazon_book.get('rating', None)
-                    })
-                else:
-                    # Fallback Amazon option - link to search
-                    availability_options.append({
-                        'platform': 'Amazon',
-                        'platform_logo': 'amazon',
-                        'price': 'Ver precio',
-                        'language': 'Español',
-                        'format': 'Físico',
-                        'stock': 'Consultar disponibilidad',
-                        'link': f'https://www.amazon.com.mx/s?k={book_title.replace(" ", "+")}',
-                        'link_text': 'Buscar en Amazon',
-                        'show_favorite': False,
-                        'rating': None
-                    })
-            except Exception as e:
-                print(f"[DEBUG] Error fetching Amazon data: {e}")
-                # Fallback Amazon option
-                availability_options.append({
-                    'platform': 'Amazon',
-                    'platform_logo': 'amazon',
-                    'price': 'Ver precio',
-                    'language': 'Español',
-                    'format': 'Físico / Digital',
-                    'stock': 'Consultar disponibilidad',
-                    'link': f'https://www.amazon.com.mx/s?k={book_title.replace(" ", "+")}',
-                    'link_text': 'Buscar en Amazon',
-                    'show_favorite': False,
-                    'rating': None
-                })
-
-        # Google Books option (always available for Google source)
-        if source == 'google':
-            preview_link = book.get('previewLink', '')
-            buy_link = book.get('buyLink', '')
-
-            # Format price from Google Books
-            google_price = None
-            if book.get('price') and book.get('currency'):
-                if book.get('currency') == 'USD':
-                    google_price = f"${book.get('price'):.2f} USD"
-                elif book.get('currency') == 'MXN':
-                    google_price = f"${book.get('price'):.2f} MXN"
-                else:
-                    google_price = f"{book.get('price'):.2f} {book.get('currency')}"
-
-            # Determine the best link (buy link if available, otherwise preview)
-            best_link = buy_link if buy_link else preview_link
-            link_text = 'Comprar en Google Books' if buy_link else 'Ver vista previa'
-
-            # Determine stock based on saleability
-            saleability = book.get('saleability', 'NOT_FOR_SALE')
-            if saleability == 'FOR_SALE':
-                stock_text = 'Disponible para compra'
-            elif saleability == 'FREE':
-                stock_text = 'Gratis'
-                google_price = 'Gratis'
-            else:
-                stock_text = 'Solo vista previa'
-                google_price = google_price or 'No disponible para compra'
-
-            if best_link:
-                availability_options.append({
-                    'platform': 'Google Books',
-                    'platform_logo': 'google',
-                    'price': google_price,
-                    'language': 'Múltiples idiomas',
-                    'format': 'Digital',
-                    'stock': stock_text,
-                    'link': best_link,
-                    'link_text': link_text,
-                    'show_favorite': True,
-                    'rating': None
-                })
-
-    # Get AI recommendations for related books
-    related_books = []
-    if book and not error:
-        try:
-            from core.services.ai_recommendations import AIRecommendationService
 
-            ai_service = AIRecommendationService()
-            book_title = book.get('title', '')
-            book_categories = book.get('categories', [])
+@require_http_methods(["GET"])
+def book_related_view(request: HttpRequest, book_id: str) -> HttpResponse:
+    """
+    Related books section of the book detail page, fetched by the page after
+    the main section is shown.
+    """
+    return _book_section(
+        request, book_id,
+        lambda payload, source, key: related_fragment(payload, source, key, request.user))
 
-            # Use the first category if available, otherwise use the book title
-            category_for_search = book_categories[0] if book_categories else book_title
 
-            # Get personalized recommendations
-            related_books = ai_service.get_books_by_category(
-                category_name=category_for_search,
-                num_books=6,
-                user=request.user if request.user.is_authenticated else None
-            )
+def book_detail_view(request, book_id):
+    """
+    Book detail page - shows complete book information.
+    Supports Google Books API, Amazon API, and local database books.
+    Auto-detects if book_id is numeric (database) or string (API).
 
-            # Format related books for template
-            formatted_related_books = []
-            for related_book in related_books:
-                formatted_related_books.append({
-                    'source': 'google',
-                    'id': related_book.get('id', 'unknown'),
-                    'title': related_book.get('title', 'N/A'),
-                    'authors': related_book.get('authors', []),
-                    'thumbnail': related_book.get('thumbnail', ''),
-                    'description': related_book.get('description', 'N/A'),
-                })
-            related_books = formatted_related_books
+    The book, its offers and its related books are cached per book. The
+    availability and related books sections depend on slow
+    external APIs. By default they are inlined only when already cached and otherwise
+    fetched by the page from their own endpoints; with ?render=full both are
+    built concurrently under BOOK_DETAIL_SECTIONS_DEADLINE seconds.
+    """
+    source, payload, error = get_detail(book_id, request.GET.get('source', None))
+    book = payload['book'] if payload else None
 
-        except Exception as e:
-            print(f"[DEBUG] Error fetching related books: {e}")
-            related_books = []
-
-    # Debug info
-    print(f"[DEBUG] Source: {source}")
-    print(f"[DEBUG] Book ID: {book_id}")
-    print(f"[DEBUG] Book data exists: {book is not None}")
-    if book:
-        print(f"[DEBUG] Book title: {book.get('title', 'N/A')}")
-    print(f"[DEBUG] Availability options: {len(availability_options)}")
-    print(f"[DEBUG] Related books: {len(related_books)}")
+    availability_html = None
+    related_html = None
+    if book and not error:
+        if request.GET.get('render') == 'full':
+            sections = render_sections(payload, source, book_id, request.user)
+            availability_html = sections['availability_html']
+            related_html = sections['related_html']
+        else:
+            availability_html = availability_fragment(payload, source, book_id, build=False)
+            related_html = related_fragment(payload, source, book_id, request.user, build=False)
 
     context = {
         'user': request.user,
         'book': book,
         'source': source,
+        'book_id': book_id,
         'error': error,
-        'availability_options': availability_options,
-        'related_books': related_books
+        'availability_html': availability_html,
+        'related_html': related_html
     }
 
     return render(request, 'book_detail.html', context)
 
+
 def categoria_detalle(request: HttpRequest, categoria_id: int) -> HttpResponse:
     """
     Muestra todos los libros de una categoría específica.
@@ -676,78 +575,76 @@ def categoria_detalle(request: HttpRequest, categoria_id: int) -> HttpResponse:
     if orden not in ordenes_validas:
         orden = '-calificacion'
 
-    # Obtener libros de la base de datos local
-    libros_db = categoria.libros.filter(disponible=True)
-
-    if busqueda:
-        libros_db = libros_db.filter(
-            Q(titulo__icontains=busqueda) |
-            Q(autor__icontains=busqueda) |
-            Q(descripcion__icontains=busqueda)
-        )
-
-    libros_db = libros_db.order_by(orden)
+    def build_database_books() -> dict:
+        # Obtener libros de la base de datos local
+        libros_db = categoria.libros.filter(disponible=True)
 
-    # Obtener recomendaciones de IA + Google Books (personalizadas por usuario)
-    ai_service = AIRecommendationService()
-    libros_google = []
-    try:
-        # Pass user to get personalized recommendations
-        libros_google = ai_service.get_books_by_category(
-            category_name=categoria.nombre,
-            num_books=12,
-            user=request.user if request.user.is_authenticated else None
-        )
-    except Exception as e:
-        print(f"Error obteniendo recomendaciones de IA para {categoria.nombre}: {e}")
+        if busqueda:
+            libros_db = libros_db.filter(
+                Q(titulo__icontains=busqueda) |
+                Q(autor__icontains=busqueda) |
+                Q(descripcion__icontains=busqueda)
+            )
 
-    # Combinar libros de base de datos y Google Books
-    all_books = []
+        libros = [BookCard.from_libro(libro) for libro in card_queryset(libros_db).order_by(orden)]
 
-    # Agregar libros de base de datos
-    for libro in libros_db:
-        all_books.append({
-            'source': 'database',
-            'id': libro.id,
-            'title': libro.titulo,
-            'authors': [libro.autor] if libro.autor else [],
-            'thumbnail': libro.imagen_url,
-            'description': libro.descripcion,
-            'price': float(libro.precio) if libro.precio else None,
-            'rating': libro.calificacion,
-            'is_local': True
-        })
+        return {
+            'html': render_to_string('fragments/categoria_libros.html', {'libros': libros}),
+            'total': len(libros),
+            'resumen': libros_db.aggregate(
+                calificacion_promedio=Avg('calificacion'),
+                precio_minimo=models.Min('precio'),
+                precio_maximo=models.Max('precio'),
+            ) if busqueda else None,
+        }
 
-    # Agregar libros de Google Books
-    for book in libros_google:
-        all_books.append({
-            'source': 'google',
-            'id': book.get('id', 'unknown'),
-            'title': book.get('title', 'N/A'),
-            'authors': book.get('authors', []),
-            'thumbnail': book.get('thumbnail', ''),
-            'description': book.get('description', 'N/A'),
-            'publisher': book.get('publisher', 'N/A'),
-            'publishedDate': book.get('publishedDate', 'N/A'),
-            'pageCount': book.get('pageCount', 'N/A'),
-            'categories': book.get('categories', []),
-            'previewLink': book.get('previewLink', '#'),
-            'is_local': False
-        })
+    def build_ai_books() -> dict:
+        # Obtener recomendaciones de IA + Google Books (personalizadas por perfil)
+        try:
+            libros_google = AIRecommendationService().get_books_by_category(
+                category_name=categoria.nombre,
+                num_books=12,
+                user=request.user if request.user.is_authenticated else None
+            )
+        except Exception as e:
+            print(f"Error obteniendo recomendaciones de IA para {categoria.nombre}: {e}")
+            return None
+
+        return {
+            'html': render_to_string('fragments/categoria_libros.html', {'libros': libros_google}),
+            'total': len(libros_google),
+        }
+
+    # Los libros de la base de datos se comparten entre usuarios y los de IA
+    # entre usuarios con el mismo perfil
+    libros_db = cached_fragment(
+        'categoria_libros', (categoria.id, orden, busqueda), build_database_books)
+    libros_ia = cached_fragment(
+        'categoria_ia', (categoria.id,) + user_segment(request.user), build_ai_books, versions=()
+    ) or {'html': '', 'total': 0}
 
     # Estadísticas
+    resumen = libros_db['resumen']
+    if resumen is None:
+        categoria_stats = estadisticas_de(categoria)
+        resumen = {
+            'calificacion_promedio': categoria_stats.calificacion_promedio,
+            'precio_minimo': categoria_stats.precio_minimo,
+            'precio_maximo': categoria_stats.precio_maximo,
+        }
     stats = {
-        'total_libros': len(all_books),
-        'libros_database': len(libros_db),
-        'libros_google': len(libros_google),
-        'calificacion_promedio': libros_db.aggregate(Avg('calificacion'))['calificacion__avg'] or 0,
-        'precio_minimo': libros_db.aggregate(models.Min('precio'))['precio__min'] or 0,
-        'precio_maximo': libros_db.aggregate(models.Max('precio'))['precio__max'] or 0,
+        'total_libros': libros_db['total'] + libros_ia['total'],
+        'libros_database': libros_db['total'],
+        'libros_google': libros_ia['total'],
+        'calificacion_promedio': resumen['calificacion_promedio'] or 0,
+        'precio_minimo': resumen['precio_minimo'] or 0,
+        'precio_maximo': resumen['precio_maximo'] or 0,
     }
 
     context = {
         'categoria': categoria,
-        'libros': all_books,
+        'libros_database_html': mark_safe(libros_db['html']),
+        'libros_ia_html': mark_safe(libros_ia['html']),
         'estadisticas': stats,
         'busqueda': busqueda,
         'orden': orden,
@@ -784,21 +681,24 @@ def libros_por_categoria_vista(request: HttpRequest) -> HttpResponse:
 
 
 @require_http_methods(["GET"])
+@catalog_cache
 def api_categorias(request: HttpRequest) -> JsonResponse:
     """
     API endpoint que retorna todas las categorías en JSON.
     """
-    categorias = Categoria.objects.filter(activa=True).annotate(
-        total_libros=Count('libros', filter=Q(libros__disponible=True))
-    ).values('id', 'nombre', 'descripcion', 'icono', 'color', 'total_libros')
+    categorias = list(Categoria.objects.filter(activa=True).values(
+        'id', 'nombre', 'descripcion',
+        total_libros=Coalesce('estadisticas__libros_disponibles', 0),
+    ).order_by('nombre'))
 
     return JsonResponse({
-        'total': categorias.count(),
-        'categorias': list(categorias)
+        'total': len(categorias),
+        'categorias': categorias
     })
 
 
 @require_http_methods(["GET"])
+@catalog_cache
 def api_libros_categoria(request: HttpRequest) -> JsonResponse:
     """
     API endpoint que retorna libros de una categoría específica.
@@ -809,9 +709,9 @@ def api_libros_categoria(request: HttpRequest) -> JsonResponse:
         return JsonResponse({'error': 'categoria_id requerido'}, status=400)
 
     categoria = get_object_or_404(Categoria, id=categoria_id, activa=True)
-    libros = categoria.libros.filter(disponible=True).values(
+    libros = list(categoria.libros.filter(disponible=True).values(
         'id', 'titulo', 'autor', 'precio', 'calificacion', 'imagen_url'
-    )
+    ))
 
     return JsonResponse({
         'categoria': {
@@ -819,8 +719,8 @@ def api_libros_categoria(request: HttpRequest) -> JsonResponse:
             'nombre': categoria.nombre,
             'descripcion': categoria.descripcion,
         },
-        'total_libros': libros.count(),
-        'libros': list(libros)
+        'total_libros': len(libros),
+        'libros': libros
     })
 
 
@@ -835,13 +735,13 @@ def recomendaciones_view(request: HttpRequest) -> HttpResponse:
     Returns:
         HttpResponse: The HTTP response object.
     """
-    engine = RecomendationEngine()
+    engine = get_engine()
     print("Generating recommendations for user:", request.user.id)
     try:
-        recommendations = engine.get_recommendations(
+        recommendations = annotate_favorites(engine.get_recommendations(
             user_id=request.user.id,
             top_n=12
-        )
+        ), request.user)
         print(recommendations)
     except Exception as e:
         print("Error generating recommendations:", e)
@@ -854,7 +754,7 @@ def recomendaciones_view(request: HttpRequest) -> HttpResponse:
 @login_required
 def api_recommendations(request):
     """API endpoint para obtener recomendaciones (JSON)"""
-    engine = RecomendationEngine()
+    engine = get_engine()
     top_n = int(request.GET.get('top_n', 10))
     
     try:
@@ -887,7 +787,7 @@ def api_recommendations(request):
 
 def similar_books_view(request, libro_id):
     """Vista para mostrar libros similares a uno específico"""
-    engine = RecomendationEngine()
+    engine = get_engine()
     
     similares = engine.get_similar_books(
         libro_id=libro_id,
@@ -1,7 +1,9 @@
-from django.db              import models
-from libros.models          import Libro, Categoria
-from django.contrib.auth    import get_user_model
-from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db                 import models
+from django.db.models.signals  import post_save, post_delete
+from django.dispatch           import receiver
+from libros.models             import Libro, Categoria
+from django.contrib.auth       import get_user_model
+from django.core.validators    import MinValueValidator, MaxValueValidator
 User = get_user_model()
 
 
@@ -137,3 +139,127 @@ class InteresUsuario(models.Model):
 
     def __str__(self: 'InteresUsuario') -> str:
         return f"{self.usuario.username} (Nivel: {self.nivel_interes})"
+
+
+class RecomendacionPrecalculada(models.Model):
+    """
+    A book of the top-N recommendations of a user, computed offline by the
+    precompute_recommendations command and read with a single index scan.
+    """
+    usuario = models.ForeignKey(
+        User,
+        on_delete    = models.CASCADE,
+        related_name = "recomendaciones_precalculadas",
+        verbose_name = "Usuario"
+    )
+    libro = models.ForeignKey(
+        Libro,
+        on_delete    = models.CASCADE,
+        related_name = "recomendaciones_precalculadas",
+        verbose_name = "Libro"
+    )
+    posicion = models.PositiveSmallIntegerField(
+        verbose_name = "Posición",
+        help_text    = "Lugar del libro en la lista del usuario, desde 0."
+    )
+    puntuacion = models.FloatField(
+        default      = 0.0,
+        verbose_name = "Puntuación"
+    )
+    fecha_calculo = models.DateTimeField(
+        verbose_name = "Fecha de Cálculo",
+        help_text    = "Cuándo se calculó la lista del usuario."
+    )
+
+    class Meta:
+        verbose_name        = "Recomendación Precalculada"
+        verbose_name_plural = "Recomendaciones Precalculadas"
+        constraints         = [
+            models.UniqueConstraint(
+                fields = ['usuario', 'posicion'],
+                name   = 'recomendacion_precalculada_posicion',
+            ),
+        ]
+
+    def __str__(self: 'RecomendacionPrecalculada') -> str:
+        return f"{self.usuario_id} #{self.posicion}: {self.libro_id}"
+
+
+class VersionUsuario(models.Model):
+    """
+    When the favorites or interests of a user last changed, in nanoseconds
+    since the epoch. Stored in the database so every process, including the
+    offline commands, sees the same version.
+    """
+    usuario = models.OneToOneField(
+        User,
+        on_delete    = models.CASCADE,
+        primary_key  = True,
+        related_name = "version_recomendaciones",
+        verbose_name = "Usuario"
+    )
+    version = models.BigIntegerField(
+        verbose_name = "Versión",
+        help_text    = "Última modificación de los favoritos o intereses, en nanosegundos."
+    )
+
+    class Meta:
+        verbose_name        = "Versión de Usuario"
+        verbose_name_plural = "Versiones de Usuario"
+
+    def __str__(self: 'VersionUsuario') -> str:
+        return f"{self.usuario_id}: {self.version}"
+
+
+@receiver([post_save, post_delete], sender=Favorito)
+def invalidar_favoritos_usuario(sender, instance, **kwargs):
+    """
+    Drops the cached favorite set of the user when a favorite changes.
+    """
+    from core.services.favorites import invalidate_favorite_ids
+    invalidate_favorite_ids(instance.usuario_id)
+
+
+@receiver(post_save, sender=Favorito)
+def contar_favorito(sender, instance, created, **kwargs):
+    """
+    Increments the favorite counter and the trending score of the book.
+    """
+    if created:
+        from core.services.book_counters import ajustar_favoritos
+        from core.services.trending      import registrar_favorito
+        ajustar_favoritos(instance.libro_id, 1)
+        registrar_favorito(instance.libro_id, instance.fecha_favorito)
+
+
+@receiver(post_delete, sender=Favorito)
+def descontar_favorito(sender, instance, **kwargs):
+    """
+    Decrements the favorite counter and the trending score of the book.
+    """
+    from core.services.book_counters import ajustar_favoritos
+    from core.services.trending      import registrar_favorito
+    ajustar_favoritos(instance.libro_id, -1)
+    registrar_favorito(instance.libro_id, instance.fecha_favorito, signo=-1)
+
+
+@receiver([post_save, post_delete], sender=Favorito)
+def actualizar_libros_similares(sender, instance, **kwargs):
+    """
+    Schedules the update of the co-favorite lists of the book and of the
+    other favorites of the user when a favorite is added or removed.
+    """
+    if kwargs.get('created', True):
+        from core.services.similar_books import actualizar_cofavoritos, similar_updates
+        similar_updates.schedule(actualizar_cofavoritos, instance.usuario_id, instance.libro_id)
+
+
+@receiver([post_save, post_delete], sender=Favorito)
+@receiver([post_save, post_delete], sender=InteresUsuario)
+def actualizar_recomendaciones_usuario(sender, instance, **kwargs):
+    """
+    Marks the user as changed in the recommendation model, so their
+    neighbors and the cached recommendations depending on them are refreshed.
+    """
+    from core.services.recommendation_service import get_engine
+    get_engine().user_changed(instance.usuario_id)
@@ -1,12 +1,58 @@
 """
 Tests for the profiles application models.
 """
-from django.test         import TestCase
-from django.contrib.auth import get_user_model
-from libros.models       import Libro, Categoria
-from .models             import Recomendacion, Favorito, InteresUsuario, TipoRecomendacion
+import json
+import tempfile
+from datetime                             import timedelta
+from pathlib                              import Path
+from unittest.mock                        import patch
+import numpy as np
+from django.core.cache                    import cache
+from django.test                          import TestCase, override_settings
+from django.contrib.auth                  import get_user_model
+from django.urls                          import reverse
+from django.utils                         import timezone
+from core.services.ann_index              import HyperplaneLSH, sample_recall
+from core.services.favorites              import annotate_favorites, get_favorite_ids
+from core.services.recommendation_service import (RecomendationEngine, feature_matrix, get_engine,
+                                                  get_user_versions, rank_books, top_k_neighbors)
+from core.services.similar_books          import reconstruir_cofavoritos, similar_updates, similares
+from core.services.trending               import reconstruir, tendencias
+from libros.models                        import Libro, LibroSimilar, Categoria
+from .models                              import (Recomendacion, Favorito, InteresUsuario,
+                                                  RecomendacionPrecalculada, TipoRecomendacion)
 User = get_user_model()
 
+
+def crear_usuario(username: str) -> User:
+	"""
+	Creates a user with every profile field the signup requires.
+	"""
+	return User.objects.create_user(
+		username        = username,
+		password        = 'testpass',
+		email           = f'{username}@example.com',
+		nombre_completo = 'Usuario de Prueba',
+		universidad     = 'uacj',
+		carrera         = 'Ingeniería',
+		nivel_academico = 'licenciatura'
+	)
+
+
+def crear_libro(categoria: Categoria, titulo: str, isbn: str) -> Libro:
+	"""
+	Creates a book with placeholder details in a category.
+	"""
+	return Libro.objects.create(
+		categoria         = categoria,
+		titulo            = titulo,
+		autor             = 'Autor',
+		isbn              = isbn,
+		fecha_publicacion = '2000-01-01',
+		precio            = 10,
+		paginas           = 100
+	)
+
 class RecomendacionModelTest(TestCase):
     """
 	Test case for the Recomendacion model.
@@ -91,3 +137,355 @@ class InteresUsuarioModelTest(TestCase):
 		self.assertEqual(interes.usuario, self.user)
 		self.assertEqual(interes.categoria, self.categoria)
 		self.assertEqual(interes.nivel_interes, 8)
+
+class FavoriteIdsCacheTest(TestCase):
+	"""
+	Test case for the cached favorite set of a user.
+	"""
+	def setUp(self: 'FavoriteIdsCacheTest') -> None:
+		"""
+		Set up a valid user and two books.
+		"""
+		cache.clear()
+		self.user = crear_usuario('cacheuser')
+		self.categoria: Categoria = Categoria.objects.create(nombre='Novela Gráfica', activa=True)
+		self.libros = [
+			crear_libro(self.categoria, titulo, isbn)
+			for titulo, isbn in (('Maus', '9780000000011'), ('Persépolis', '9780000000028'))
+		]
+
+	def test_favorites_are_cached_and_invalidated(self: 'FavoriteIdsCacheTest') -> None:
+		"""
+		The favorite set is read once and dropped when a favorite is added or removed.
+		"""
+		self.assertEqual(get_favorite_ids(self.user), frozenset())
+		favorito = Favorito.objects.create(usuario=self.user, libro=self.libros[0])
+		with self.assertNumQueries(1):
+			books = annotate_favorites(self.libros, self.user)
+			annotate_favorites(self.libros, self.user)
+		self.assertEqual([book.is_favorite for book in books], [True, False])
+		favorito.delete()
+		self.assertEqual(get_favorite_ids(self.user), frozenset())
+
+	def test_favorite_counter(self: 'FavoriteIdsCacheTest') -> None:
+		"""
+		The favorite counter of the book follows favorite inserts and deletes.
+		"""
+		favorito = Favorito.objects.create(usuario=self.user, libro=self.libros[0])
+		self.libros[0].refresh_from_db()
+		self.assertEqual(self.libros[0].total_favoritos, 1)
+		favorito.delete()
+		self.libros[0].refresh_from_db()
+		self.assertEqual(self.libros[0].total_favoritos, 0)
+
+
+class TrendingScoreTest(TestCase):
+	"""
+	Test case for the time-decayed trending scores.
+	"""
+	def setUp(self: 'TrendingScoreTest') -> None:
+		"""
+		Set up two users and two books in different categories.
+		"""
+		self.users = [crear_usuario(f'trend{i}') for i in range(2)]
+		self.categorias = [
+			Categoria.objects.create(nombre=nombre, activa=True) for nombre in ('Cómic', 'Manga')
+		]
+		self.libros = [
+			crear_libro(categoria, f'Libro {categoria.nombre}', f'978000000{i}999')
+			for i, categoria in enumerate(self.categorias)
+		]
+
+	def test_recent_favorites_trend_higher(self: 'TrendingScoreTest') -> None:
+		"""
+		Old favorites weigh less than new ones and scores survive re-normalization.
+		"""
+		viejo = Favorito.objects.create(usuario=self.users[0], libro=self.libros[0])
+		Favorito.objects.filter(pk=viejo.pk).update(fecha_favorito=timezone.now() - timedelta(days=6))
+		for user in self.users:
+			Favorito.objects.create(usuario=user, libro=self.libros[1])
+		reconstruir()
+		esperado = dict(tendencias())
+		reconstruir()
+		self.assertEqual(list(esperado), [self.libros[1].id, self.libros[0].id])
+		self.assertAlmostEqual(esperado[self.libros[1].id], 2.0, places=3)
+		self.assertAlmostEqual(esperado[self.libros[0].id], 0.25, places=2)
+		for libro_id, score in tendencias():
+			self.assertAlmostEqual(score, esperado[libro_id], places=3)
+		self.assertEqual(tendencias(categoria_id=self.categorias[0].id)[0][0], self.libros[0].id)
+
+		Favorito.objects.filter(usuario=self.users[0], libro=self.libros[1]).delete()
+		self.assertAlmostEqual(dict(tendencias())[self.libros[1].id], 1.0, places=3)
+
+	def test_trending_api_clamps_the_limit(self: 'TrendingScoreTest') -> None:
+		"""
+		Out of range limits are clamped instead of failing.
+		"""
+		for user in self.users:
+			Favorito.objects.create(usuario=user, libro=self.libros[0])
+		url = reverse('trending_api')
+		response = self.client.get(url, {'limit': -3})
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(len(response.json()['results']), 1)
+		self.assertEqual(self.client.get(url, {'limit': 'x'}).status_code, 400)
+
+
+class RecommendationEngineTest(TestCase):
+	"""
+	Test case for the recommendation engine and its model file.
+	"""
+	def setUp(self: 'RecommendationEngineTest') -> None:
+		"""
+		Set up two groups of users with favorites in different categories and
+		a temporary model path.
+		"""
+		cache.clear()
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		model_path = override_settings(RECOMMENDATION_MODEL_PATH=Path(directory.name) / 'model')
+		model_path.enable()
+		self.addCleanup(model_path.disable)
+
+		self.categorias = [
+			Categoria.objects.create(nombre=nombre, activa=True) for nombre in ('Terror', 'Romance')
+		]
+		self.libros = [
+			crear_libro(categoria, f'{categoria.nombre} {j}', f'9780000005{i}{j}0')
+			for i, categoria in enumerate(self.categorias) for j in range(3)
+		]
+		self.users = [crear_usuario(f'lector{i}') for i in range(4)]
+		# Similar books updates are run in the test thread with drain()
+		worker = patch('core.services.similar_books.similar_updates._ensure_worker')
+		worker.start()
+		self.addCleanup(worker.stop)
+		# Users 0 and 1 read terror, users 2 and 3 read romance
+		with self.captureOnCommitCallbacks(execute=True):
+			for i, user in enumerate(self.users):
+				grupo = self.libros[:3] if i < 2 else self.libros[3:]
+				for libro in grupo[:2 + i % 2]:
+					Favorito.objects.create(usuario=user, libro=libro)
+				InteresUsuario.objects.create(usuario=user, categoria=self.categorias[i // 2], nivel_interes=8)
+		similar_updates.drain()
+
+	def test_model_is_reloaded_when_the_file_changes(self: 'RecommendationEngineTest') -> None:
+		"""
+		A serving engine picks up a model trained by another process.
+		"""
+		self.assertIs(get_engine(), get_engine())
+		trainer = RecomendationEngine().train()
+		serving = RecomendationEngine()
+		self.assertTrue(serving.reload_if_changed(force=True))
+		self.assertFalse(serving.reload_if_changed(force=True))
+		self.assertEqual(serving.user_ids.tolist(), trainer.user_ids.tolist())
+
+		recomendados = serving.get_recommendations(self.users[0].id, top_n=5)
+		self.assertEqual({libro.id for libro in recomendados}, {libro.id for libro in self.libros[2:]})
+
+		InteresUsuario.objects.create(usuario=crear_usuario('lector4'), categoria=self.categorias[0],
+									  nivel_interes=5)
+		trainer.train()
+		self.assertTrue(serving.reload_if_changed(force=True))
+		self.assertEqual(len(serving.user_ids), 5)
+
+	def test_model_is_saved_as_memory_mapped_arrays(self: 'RecommendationEngineTest') -> None:
+		"""
+		Every training writes a new versioned directory and moves the pointer.
+		"""
+		trainer = RecomendationEngine()
+		for _ in range(3):
+			trainer.train()
+		root = trainer.model_path
+		current = (root / 'current').read_text()
+		versions = sorted(path.name for path in root.iterdir() if path.is_dir())
+		self.assertEqual(len(versions), 2)
+		self.assertEqual(versions[-1], current)
+
+		manifest = json.loads((root / current / 'manifest.json').read_text())
+		self.assertEqual(manifest['version'], current)
+		self.assertEqual(manifest['shape'], [4, 2])
+		self.assertEqual(manifest['arrays']['scores'], 'float32')
+		self.assertEqual(manifest['arrays']['neighbors'], 'int32')
+
+		serving = RecomendationEngine()
+		self.assertTrue(serving.reload_if_changed(force=True))
+		self.assertIsInstance(serving.neighbors, np.memmap)
+		self.assertFalse(serving.neighbors.flags.writeable)
+		self.assertEqual(serving.user_ids.tolist(), [user.id for user in self.users])
+
+	def test_top_k_neighbors_match_the_dense_similarities(self: 'RecommendationEngineTest') -> None:
+		"""
+		Blockwise top-K gives the same neighbors as sorting the full matrix.
+		"""
+		vectors = np.random.default_rng(7).random((50, 8))
+		neighbors, scores = top_k_neighbors(vectors, 5, block_size=16)
+		self.assertEqual(neighbors.shape, (50, 5))
+		self.assertEqual(scores.dtype, np.float32)
+
+		unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+		dense = unit @ unit.T
+		np.fill_diagonal(dense, -np.inf)
+		np.testing.assert_array_equal(neighbors, np.argsort(-dense, axis=1)[:, :5])
+		np.testing.assert_allclose(scores, np.sort(dense, axis=1)[:, ::-1][:, :5], rtol=1e-5)
+
+	def test_features_are_a_sparse_user_category_matrix(self: 'RecommendationEngineTest') -> None:
+		"""
+		Interests and favorites of the same category add up into one entry.
+		"""
+		engine = RecomendationEngine()
+		matrix, user_ids, categoria_ids = feature_matrix([(engine.prepare_user_features(), 1.0)])
+		self.assertEqual(matrix.format, 'csr')
+		self.assertEqual(matrix.shape, (4, 2))
+		self.assertEqual(matrix.nnz, 4)
+		self.assertEqual(user_ids.tolist(), [user.id for user in self.users])
+		self.assertEqual(categoria_ids.tolist(), [categoria.id for categoria in self.categorias])
+		# Interest level 8 plus five points per favorite
+		self.assertEqual(matrix.toarray()[:, 0].tolist(), [18, 23, 0, 0])
+		self.assertIsNone(engine.prepare_collaborative_features())
+
+	def test_new_users_get_neighbors_without_retraining(self: 'RecommendationEngineTest') -> None:
+		"""
+		A user created after the training is placed with the LSH index.
+		"""
+		engine = RecomendationEngine().train()
+		lector = crear_usuario('lector4')
+		Favorito.objects.create(usuario=lector, libro=self.libros[0])
+		self.assertNotIn(lector.id, engine.user_ids.tolist())
+		vecinos = engine._similar_user_ids(engine._model, lector.id)
+		self.assertEqual(set(vecinos[:2]), {self.users[0].id, self.users[1].id})
+
+	def test_lsh_index_recall(self: 'RecommendationEngineTest') -> None:
+		"""
+		The LSH index finds most exact neighbors, and more tables find more.
+		"""
+		rng = np.random.default_rng(3)
+		centers = rng.standard_normal((20, 16))
+		vectors = centers[rng.integers(0, 20, 2000)] + 0.1 * rng.standard_normal((2000, 16))
+		few = sample_recall(HyperplaneLSH(vectors, n_tables=1, n_bits=12), 10, 200)
+		many = sample_recall(HyperplaneLSH(vectors, n_tables=8, n_bits=12), 10, 200)
+		self.assertGreater(many, 0.9)
+		self.assertGreaterEqual(many, few)
+
+		index = HyperplaneLSH(vectors)
+		rows, scores = index.query(vectors[5], 10, exclude=5)
+		self.assertNotIn(5, rows.tolist())
+		self.assertTrue(np.all(np.diff(scores) <= 0))
+
+	def test_changes_refresh_recommendations_without_retraining(self: 'RecommendationEngineTest') -> None:
+		"""
+		A new favorite of a neighbor shows up at once, and a user whose tastes
+		change gets new neighbors.
+		"""
+		with self.settings(RECOMMENDATION_NEIGHBORS=1):
+			engine = RecomendationEngine().train()
+		lector = self.users[0]
+		recomendados = engine.get_recommendations(lector.id)
+		self.assertEqual([libro.id for libro in recomendados], [self.libros[2].id])
+
+		Favorito.objects.create(usuario=self.users[1], libro=self.libros[3])
+		recomendados = engine.get_recommendations(lector.id)
+		self.assertEqual([libro.id for libro in recomendados], [self.libros[2].id, self.libros[3].id])
+		self.assertEqual(
+			[libro.id for libro in engine.get_recommendations(lector.id)], [libro.id for libro in recomendados])
+
+		# The user now only likes romance
+		Favorito.objects.filter(usuario=lector).delete()
+		interes = InteresUsuario.objects.get(usuario=lector)
+		interes.categoria = self.categorias[1]
+		interes.save()
+		recomendados = engine.get_recommendations(lector.id)
+		self.assertIn(lector.id, engine._model.changed)
+		self.assertIn(engine._model.changed[lector.id][1][0], {self.users[2].id, self.users[3].id})
+		self.assertTrue({libro.id for libro in recomendados} <= {libro.id for libro in self.libros[3:]})
+
+	def test_user_versions_are_shared_by_processes(self: 'RecommendationEngineTest') -> None:
+		"""
+		A change is seen by processes that do not share the cache, including
+		the one precomputing the lists.
+		"""
+		engine = RecomendationEngine().train()
+		lector = self.users[0]
+		Favorito.objects.create(usuario=lector, libro=self.libros[2])
+		# Another process, with its own local memory cache
+		cache.clear()
+		version, = get_user_versions(lector.id)
+		self.assertGreater(version, engine._model.trained_at)
+		otro = RecomendationEngine()
+		otro.precompute()
+		self.assertIn(lector.id, otro._model.changed)
+
+	def test_precomputed_recommendations_are_one_query(self: 'RecommendationEngineTest') -> None:
+		"""
+		Precomputed lists are served with one query until the user changes;
+		shorter lists than requested fall back to the live path.
+		"""
+		engine = RecomendationEngine().train()
+		self.assertEqual(engine.precompute(chunk_size=1), 4)
+		lector = self.users[0]
+		self.assertEqual(
+			list(RecomendacionPrecalculada.objects.filter(usuario=lector).order_by(
+				'posicion').values_list('libro_id', flat=True)),
+			[libro.id for libro in self.libros[2:]])
+
+		with self.assertNumQueries(1):
+			recomendados = engine.get_recommendations(lector.id, top_n=3)
+		self.assertEqual([libro.id for libro in recomendados], [libro.id for libro in self.libros[2:5]])
+		with patch.object(engine, 'reload_if_changed', side_effect=AssertionError):
+			self.assertRaises(AssertionError, engine.get_recommendations, lector.id, top_n=5)
+
+		Favorito.objects.create(usuario=lector, libro=self.libros[2])
+		recomendados = engine.get_recommendations(lector.id, top_n=3)
+		self.assertNotIn(self.libros[2].id, [libro.id for libro in recomendados])
+
+	def test_interest_boost_is_vectorized(self: 'RecommendationEngineTest') -> None:
+		"""
+		Ranking reads the book categories from the in-memory index, which is
+		reloaded when a book changes category, and the blend is configurable.
+		"""
+		libro_ids = [libro.id for libro in self.libros]
+		counts = [1, 1, 1, 2, 2, 2]
+		intereses = {self.categorias[0].id: 8}
+		ranked, scores = rank_books(libro_ids, counts, intereses, 4)
+		self.assertEqual(ranked.tolist(), libro_ids[:3] + [libro_ids[3]])
+		self.assertEqual(scores.tolist(), [9, 9, 9, 2])
+
+		with self.assertNumQueries(0):
+			rank_books(libro_ids, counts, intereses, 4)
+		with self.settings(RECOMMENDATION_INTEREST_WEIGHT=0.0):
+			ranked, _ = rank_books(libro_ids, counts, intereses, 3)
+		self.assertEqual(ranked.tolist(), libro_ids[3:])
+
+		self.libros[5].categoria = self.categorias[0]
+		self.libros[5].save()
+		ranked, scores = rank_books(libro_ids, counts, intereses, 1)
+		self.assertEqual((ranked.tolist(), scores.tolist()), ([libro_ids[5]], [10]))
+
+	def test_similar_books_are_co_favorites(self: 'RecommendationEngineTest') -> None:
+		"""
+		The similar books are kept up to date as favorites change, match a
+		full rebuild, and are served with one query.
+		"""
+		terror, romance = self.libros[:3], self.libros[3:]
+		incremental = list(LibroSimilar.objects.order_by('libro_id', 'posicion').values_list(
+			'libro_id', 'similar_id', 'puntuacion'))
+		self.assertEqual(reconstruir_cofavoritos(), 6)
+		rebuilt = list(LibroSimilar.objects.order_by('libro_id', 'posicion').values_list(
+			'libro_id', 'similar_id', 'puntuacion'))
+		self.assertEqual([fila[:2] for fila in incremental], [fila[:2] for fila in rebuilt])
+		for (_, _, antes), (_, _, despues) in zip(incremental, rebuilt):
+			self.assertAlmostEqual(antes, despues, places=5)
+
+		with self.assertNumQueries(1):
+			self.assertEqual(similares(terror[0].id, 6), [terror[1], terror[2]])
+
+		# A terror reader favorites a romance book; the lists change once it commits
+		with self.captureOnCommitCallbacks(execute=True):
+			Favorito.objects.create(usuario=self.users[1], libro=romance[2])
+			self.assertEqual(similares(terror[0].id, 6), [terror[1], terror[2]])
+		self.assertEqual(similar_updates.drain(), 1)
+		self.assertIn(romance[2], similares(terror[0].id, 6))
+		self.assertIn(terror[0], similares(romance[2].id, 6))
+		with self.captureOnCommitCallbacks(execute=True):
+			Favorito.objects.filter(usuario=self.users[1], libro=romance[2]).delete()
+		similar_updates.drain()
+		self.assertEqual(similares(terror[0].id, 6), [terror[1], terror[2]])
+		self.assertEqual(list(get_engine().get_similar_books(terror[0].id, 1)), [terror[1]])
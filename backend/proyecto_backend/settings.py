@@ -167,6 +167,55 @@ AMAZON_ASSOCIATE_TAG = os.getenv('AMAZON_ASSOCIATE_TAG', '')
 # Option 2: RapidAPI Amazon Data Scraper (third-party service)
 RAPIDAPI_KEY = os.getenv('RAPIDAPI_KEY', '')
 
+# Requests per second and burst allowed for each external book API, counted
+# in the cache: every process shares the budget only with a shared cache
+# backend, as the local memory cache above is per process. Background work
+# (prefetch, cache prewarming) only uses the spare budget.
+EXTERNAL_API_RATE_LIMITS = {
+    'google': {'rate': 1.0, 'burst': 10},
+    'amazon': {'rate': 0.5, 'burst': 5},
+}
+
+# Number of top search results whose detail data is prefetched (0 disables it)
+SEARCH_PREFETCH_TOP_N = 3
+
+# Half-life of a favorite in the trending scores
+TRENDING_HALF_LIFE_HOURS = 72
+
+# Seconds browsers and proxies may reuse anonymous catalog API responses
+CATALOG_API_MAX_AGE = 60
+
+# Seconds the book detail page waits for its secondary sections with ?render=full
+BOOK_DETAIL_SECTIONS_DEADLINE = 8
+
+# Seconds a book detail payload (book, offers, related books) is cached
+BOOK_DETAIL_CACHE_TIMEOUT = 300
+
+# Directory of the trained recommendation models, reloaded by every process
+# when a new one is saved
+RECOMMENDATION_MODEL_PATH = BASE_DIR / 'ml_models' / 'recommendation_model'
+RECOMMENDATION_RELOAD_INTERVAL = 30
+
+# Most similar users kept per user by the recommendation model
+RECOMMENDATION_NEIGHBORS = 10
+
+# Above this many users the neighbors are read from the LSH index instead of
+# an exact search. More tables raise the recall, more bits make lookups faster.
+RECOMMENDATION_EXACT_MAX_USERS = 20000
+RECOMMENDATION_LSH_TABLES = 8
+RECOMMENDATION_LSH_BITS = 10
+
+# Books per user stored by the precompute_recommendations command
+RECOMMENDATION_PRECOMPUTE_TOP_N = 50
+
+# Weights of the two recommendation signals: how many neighbors like a book,
+# and the interest level of the user in its category
+RECOMMENDATION_NEIGHBOR_WEIGHT = 1.0
+RECOMMENDATION_INTEREST_WEIGHT = 1.0
+
+# Similar books stored per book
+SIMILAR_BOOKS_K = 20
+
 CSRF_FAILURE_VIEW = 'django.views.csrf.csrf_failure'
 CSRF_COOKIE_NAME = 'csrftoken'
 CSRF_HEADER_NAME = 'HTTP_X_CSRFTOKEN'